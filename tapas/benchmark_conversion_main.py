@@ -0,0 +1,97 @@
+# coding=utf-8
+# Copyright 2019 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# Lint as: python3
+r"""Benchmarks TF example conversion on synthetic interactions.
+
+Writes examples/sec, p50/p99 latency and peak memory per table shape and
+converter as JSON, so that results of different commits can be compared.
+No downloads are needed, a small vocab is generated on the fly.
+
+python3 tapas/benchmark_conversion_main.py \
+  --output_file="/tmp/benchmark.json" \
+  --num_interactions=20
+"""
+
+import json
+import os
+import tempfile
+
+from absl import app
+from absl import flags
+
+from tapas.utils import benchmark_utils
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string("output_file", None,
+                    "JSON file the results are written to. Optional.")
+flags.DEFINE_integer("num_interactions", 20,
+                     "Number of interactions per configuration.")
+flags.DEFINE_integer("max_seq_length", 512,
+                     "Max length of a sequence in word pieces.")
+flags.DEFINE_integer("seed", 42, "Random seed of the synthetic interactions.")
+flags.DEFINE_list("shapes", None,
+                  "Names of the table shapes to run, see "
+                  "benchmark_utils.DEFAULT_SHAPES. Runs all if not set.")
+flags.DEFINE_list("converters", ["classifier", "pretraining"],
+                  "Converters to run, see benchmark_utils.ConverterType.")
+
+
+def _print_result(result):
+  print(f"{result.shape:>16} {result.converter:>12} "
+        f"examples/sec: {result.examples_per_second:10.2f} "
+        f"p50: {result.latency_p50_ms:8.2f}ms "
+        f"p99: {result.latency_p99_ms:8.2f}ms "
+        f"peak memory: {result.peak_memory_mb:8.2f}MB")
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError("Too many command-line arguments.")
+  shapes = benchmark_utils.DEFAULT_SHAPES
+  if FLAGS.shapes:
+    shapes_by_name = {shape.name: shape for shape in shapes}
+    unknown_shapes = set(FLAGS.shapes) - set(shapes_by_name)
+    if unknown_shapes:
+      raise app.UsageError(f"Unknown shapes: {sorted(unknown_shapes)}")
+    shapes = [shapes_by_name[name] for name in FLAGS.shapes]
+  converter_types = [
+      benchmark_utils.ConverterType[name.upper()] for name in FLAGS.converters
+  ]
+
+  with tempfile.TemporaryDirectory() as temp_dir:
+    vocab_file = os.path.join(temp_dir, "vocab.txt")
+    benchmark_utils.create_vocab(vocab_file)
+    results = benchmark_utils.run_benchmarks(
+        vocab_file,
+        shapes,
+        converter_types,
+        num_interactions=FLAGS.num_interactions,
+        max_seq_length=FLAGS.max_seq_length,
+        seed=FLAGS.seed,
+        report_fn=_print_result)
+
+  if FLAGS.output_file:
+    with open(FLAGS.output_file, "w") as output_file:
+      json.dump({
+          "num_interactions": FLAGS.num_interactions,
+          "max_seq_length": FLAGS.max_seq_length,
+          "seed": FLAGS.seed,
+          "results": results,
+      }, output_file, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+  app.run(main)
@@ -78,6 +78,8 @@ flags.DEFINE_integer("max_question_length", 32,
                      "See tf_example_utils.PretrainConversionConfig")
 flags.DEFINE_bool("always_continue_cells", True,
                   "See tf_example_utils.PretrainConversionConfig")
+flags.DEFINE_bool("time_conversion_stages", False,
+                  "Report the duration of the conversion stages as metrics.")
 
 
 def main(argv):
@@ -103,6 +105,7 @@ def main(argv):
       dupe_factor=FLAGS.dupe_factor,
       min_num_rows=FLAGS.min_num_rows,
       min_num_columns=FLAGS.min_num_columns,
+      time_stages=FLAGS.time_conversion_stages,
   )
   beam_runner.run(pipeline).wait_until_finish()
 
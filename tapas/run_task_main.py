@@ -17,10 +17,11 @@
 
 import enum
 import functools
+import itertools
+import multiprocessing
 import os
-import random
 import time
-from typing import Text, Optional
+from typing import List, Text, Optional
 
 from absl import app
 from absl import flags
@@ -29,14 +30,18 @@ import dataclasses
 from tapas.experiments import prediction_utils as exp_prediction_utils
 from tapas.models import tapas_classifier_model
 from tapas.models.bert import modeling
+from tapas.protos import interaction_pb2
 from tapas.scripts import calc_metrics_utils
-from tapas.scripts import prediction_utils
+from tapas.utils import cache_utils
+from tapas.utils import example_cache_utils
 from tapas.utils import file_utils
 from tapas.utils import hparam_utils
 from tapas.utils import number_annotation_utils
 from tapas.utils import task_utils
 from tapas.utils import tasks
 from tapas.utils import tf_example_utils
+from tapas.utils import tfrecord_utils
+from tapas.utils import timing_utils
 import tensorflow.compat.v1 as tf
 
 
@@ -106,6 +111,50 @@ flags.DEFINE_integer('max_seq_length', 512, 'Max sequence length of the input.')
 
 flags.DEFINE_string('mode', '', 'See Mode below.')
 
+flags.DEFINE_integer(
+    'num_workers', 1,
+    'Number of processes used to convert interactions to TF examples.')
+
+flags.DEFINE_string(
+    'tokenizer_backend', 'BERT',
+    'Word piece tokenizer used when creating TF examples. '
+    'See TokenizerBackend in tf_example_utils.')
+
+flags.DEFINE_integer(
+    'num_shuffle_shards', 100,
+    'Number of temporary shards used to shuffle the training examples. '
+    'Only a single shard is kept in memory while shuffling.')
+
+flags.DEFINE_integer(
+    'shuffle_seed', None,
+    'Random seed for shuffling the training examples. By default the order '
+    'differs between runs.')
+
+flags.DEFINE_integer(
+    'num_output_shards', 1,
+    'Number of files the TF examples of each dataset are written to. Has to '
+    'be the same when creating the data and when training or predicting.')
+
+flags.DEFINE_integer(
+    'numeric_text_cache_size', 100000,
+    'Max number of cell and question texts per worker whose parsed numbers '
+    'and dates are cached.')
+
+flags.DEFINE_bool(
+    'time_conversion_stages', False,
+    'Measure the time spent in the stages of the TF example conversion and '
+    'print a summary.')
+
+flags.DEFINE_string(
+    'example_cache_dir', None,
+    'Directory of a cache of converted interactions. Interactions that did not '
+    'change since a previous run are not converted again.')
+
+flags.DEFINE_bool(
+    'prune_example_cache', False,
+    'Delete the cache entries of the current task and conversion setup that '
+    'were not used when creating the data.')
+
 flags.DEFINE_bool('loop_predict', True,
                   'Loop predictions as new checkpoints appear while training')
 
@@ -116,6 +165,10 @@ flags.DEFINE_string(
 )
 
 _MAX_TABLE_ID = 512
+_MAX_TOKENIZED_TABLES = 128
+_MAX_TOKENIZED_TEXTS = 100000
+_MAX_ANNOTATED_TABLES = 1024
+_INTERACTIONS_PER_CHUNK = 32
 _MAX_PREDICTIONS_PER_SEQ = 20
 _CELL_CLASSIFICATION_THRESHOLD = 0.5
 
@@ -166,19 +219,48 @@ def _create_all_examples(
   example_dir = os.path.join(output_dir, 'tf_examples')
   file_utils.make_directories(example_dir)
 
-  _create_examples(
-      interaction_dir,
-      example_dir,
-      vocab_file,
-      task_utils.get_train_filename(task),
-      batch_size=None,
-      test_mode=test_mode)
-  _create_examples(interaction_dir, example_dir, vocab_file,
-                   task_utils.get_dev_filename(task), test_batch_size,
-                   test_mode)
-  _create_examples(interaction_dir, example_dir, vocab_file,
-                   task_utils.get_test_filename(task), test_batch_size,
-                   test_mode)
+  cache_keys = set()
+  cache_keys.update(
+      _create_examples(
+          interaction_dir,
+          example_dir,
+          vocab_file,
+          task_utils.get_train_filename(task),
+          batch_size=None,
+          test_mode=test_mode))
+  cache_keys.update(
+      _create_examples(interaction_dir, example_dir, vocab_file,
+                       task_utils.get_dev_filename(task), test_batch_size,
+                       test_mode))
+  cache_keys.update(
+      _create_examples(interaction_dir, example_dir, vocab_file,
+                       task_utils.get_test_filename(task), test_batch_size,
+                       test_mode))
+
+  if FLAGS.example_cache_dir is not None:
+    _, _, example_cache_namespace = _get_conversion_setup(vocab_file)
+    _update_example_cache(example_cache_namespace, cache_keys, test_mode)
+
+
+def _update_example_cache(namespace, cache_keys, test_mode):
+  """Reports and optionally prunes the cache entries that were not used.
+
+  Only the entries of 'namespace' are considered, entries created by other
+  tasks or conversion setups are kept.
+  """
+  stale_keys = example_cache_utils.get_stale_keys(FLAGS.example_cache_dir,
+                                                  namespace, cache_keys)
+  _print(f'Example cache entries used: {len(cache_keys)} '
+         f'stale: {len(stale_keys)}')
+  if not FLAGS.prune_example_cache:
+    return
+  if test_mode:
+    # Test mode stops early so used entries would look stale.
+    _warn('Not pruning the example cache in test mode.')
+    return
+  num_pruned = example_cache_utils.prune(FLAGS.example_cache_dir, namespace,
+                                         cache_keys)
+  _print(f'Pruned {num_pruned} example cache entries.')
 
 
 def _to_tf_compression_type(
@@ -192,6 +274,207 @@ def _to_tf_compression_type(
   raise ValueError(f'Unknown compression type: {compression_type}')
 
 
+@dataclasses.dataclass(frozen=True)
+class _ConversionOutput:
+  """Serialized examples and errors for all questions of an interaction."""
+  interaction_id: Text
+  examples: List[bytes]
+  errors: List[Text]
+  cache_key: Optional[Text] = None
+
+
+class _InteractionConverter:
+  """Converts serialized interactions to serialized TF examples."""
+
+  def __init__(self,
+               config,
+               tokenizer_backend,
+               numeric_text_cache_size,
+               example_cache=None,
+               time_stages=False):
+    self._example_cache = example_cache
+    self._table_cache = cache_utils.LruCache(max_size=_MAX_TOKENIZED_TABLES)
+    self._token_cache = cache_utils.LruCache(max_size=_MAX_TOKENIZED_TEXTS)
+    self._numeric_cache = cache_utils.LruCache(max_size=_MAX_ANNOTATED_TABLES)
+    self._numeric_text_cache = cache_utils.LruCache(
+        max_size=numeric_text_cache_size)
+    self._stage_timer = timing_utils.StageTimer() if time_stages else None
+    self._converter = tf_example_utils.ToClassifierTensorflowExample(
+        config,
+        table_cache=self._table_cache,
+        token_cache=self._token_cache,
+        tokenizer_backend=tokenizer_backend,
+        stage_timer=self._stage_timer)
+
+  def convert(self, serialized_interaction):
+    if self._example_cache is None:
+      return self._convert(serialized_interaction)
+
+    def _compute():
+      output = self._convert(serialized_interaction)
+      return example_cache_utils.encode_outputs(output.interaction_id,
+                                                output.examples, output.errors)
+
+    cache_key = self._example_cache.get_key(serialized_interaction)
+    interaction_id, examples, errors = example_cache_utils.decode_outputs(
+        self._example_cache.get(cache_key, _compute))
+    return _ConversionOutput(
+        interaction_id=interaction_id,
+        examples=examples,
+        errors=errors,
+        cache_key=cache_key)
+
+  def _convert(self, serialized_interaction):
+    interaction = interaction_pb2.Interaction.FromString(serialized_interaction)
+    if self._stage_timer is None:
+      self._add_numeric_values(interaction)
+    else:
+      with self._stage_timer.time('numeric_annotation'):
+        self._add_numeric_values(interaction)
+    examples = []
+    errors = []
+    for output in self._converter.convert_interaction(
+        interaction, serialize=True):
+      if isinstance(output, ValueError):
+        errors.append(str(output))
+      else:
+        examples.append(output)
+    return _ConversionOutput(
+        interaction_id=interaction.id, examples=examples, errors=errors)
+
+  def _add_numeric_values(self, interaction):
+    number_annotation_utils.add_numeric_values(
+        interaction,
+        table_cache=self._numeric_cache,
+        text_cache=self._numeric_text_cache)
+
+  def get_stats(self):
+    stats = {
+        'Table cache': self._table_cache.get_stats(),
+        'Token cache': self._token_cache.get_stats(),
+        'Numeric value cache': self._numeric_cache.get_stats(),
+        'Numeric text cache': self._numeric_text_cache.get_stats(),
+    }
+    if self._example_cache is not None:
+      stats['Example cache'] = self._example_cache.get_stats()
+    return stats
+
+  def get_stage_stats(self):
+    return self._converter.get_stage_stats()
+
+  def get_empty_example(self):
+    return self._converter.get_empty_example().SerializeToString()
+
+
+# Converter of the current process, see _init_worker.
+_worker_converter = None
+
+
+def _init_worker(config, tokenizer_backend, numeric_text_cache_size,
+                 example_cache_dir, example_cache_namespace, time_stages):
+  """Creates the converter of a worker process.
+
+  Workers don't read flags since they are not parsed in processes that are
+  spawned instead of forked, all options are passed as arguments.
+  """
+  global _worker_converter
+  example_cache = None
+  if example_cache_namespace is not None:
+    example_cache = example_cache_utils.ExampleCache(example_cache_dir,
+                                                     example_cache_namespace)
+  _worker_converter = _InteractionConverter(
+      config,
+      tokenizer_backend,
+      numeric_text_cache_size,
+      example_cache=example_cache,
+      time_stages=time_stages)
+
+
+def _convert_chunk(serialized_interactions):
+  """Converts a chunk of interactions in a worker process.
+
+  Args:
+    serialized_interactions: Interactions to convert.
+
+  Returns:
+    The process id, the outputs in input order and the current cache and stage
+    statistics of the process converter.
+  """
+  outputs = [
+      _worker_converter.convert(serialized_interaction)
+      for serialized_interaction in serialized_interactions
+  ]
+  return (os.getpid(), outputs, _worker_converter.get_stats(),
+          _worker_converter.get_stage_stats())
+
+
+def _iterate_chunks(values, chunk_size):
+  values = iter(values)
+  while True:
+    chunk = list(itertools.islice(values, chunk_size))
+    if not chunk:
+      return
+    yield chunk
+
+
+def _iterate_outputs(chunk_outputs, worker_stats, worker_stage_stats):
+  """Flattens chunk outputs and keeps the latest statistics of each worker."""
+  for worker_id, outputs, stats, stage_stats in chunk_outputs:
+    worker_stats[worker_id] = stats
+    worker_stage_stats[worker_id] = stage_stats
+    yield from outputs
+
+
+def _print_cache_stats(worker_stats):
+  """Prints cache statistics summed over all workers."""
+  names = sorted({name for stats in worker_stats.values() for name in stats})
+  for name in names:
+    hits = sum(stats[name]['hits'] for stats in worker_stats.values())
+    misses = sum(stats[name]['misses'] for stats in worker_stats.values())
+    hit_rate = hits / (hits + misses) if hits + misses else 0.0
+    _print(f'{name} hits: {hits} misses: {misses} hit rate: {hit_rate:0.4f}')
+
+
+def _print_stage_stats(worker_stage_stats):
+  """Prints the time spent per conversion stage summed over all workers."""
+  stats = timing_utils.merge_stats(worker_stage_stats.values())
+  for line in timing_utils.format_stats(stats):
+    _print(line)
+
+
+def _get_empty_example(pool, config, tokenizer_backend):
+  """Returns a serialized padding example."""
+  if pool is None:
+    # The converter of this process was created by _init_worker.
+    return _worker_converter.get_empty_example()
+  converter = tf_example_utils.ToClassifierTensorflowExample(
+      config, tokenizer_backend=tokenizer_backend)
+  return converter.get_empty_example().SerializeToString()
+
+
+def _get_conversion_setup(vocab_file):
+  """Returns the conversion config, tokenizer backend and cache namespace.
+
+  The namespace is None if the example cache is disabled.
+  """
+  config = tf_example_utils.ClassifierConversionConfig(
+      vocab_file=vocab_file,
+      max_seq_length=FLAGS.max_seq_length,
+      max_column_id=_MAX_TABLE_ID,
+      max_row_id=_MAX_TABLE_ID,
+      strip_column_names=False,
+      add_aggregation_candidates=False,
+  )
+  tokenizer_backend = tf_example_utils.TokenizerBackend[
+      FLAGS.tokenizer_backend.upper()]
+  example_cache_namespace = None
+  if FLAGS.example_cache_dir is not None:
+    example_cache_namespace = example_cache_utils.get_namespace(
+        repr(config), tokenizer_backend.name,
+        example_cache_utils.get_file_fingerprint(vocab_file))
+  return config, tokenizer_backend, example_cache_namespace
+
+
 def _create_examples(
     interaction_dir,
     example_dir,
@@ -200,67 +483,111 @@ def _create_examples(
     batch_size,
     test_mode,
 ):
-  """Creates TF example for a single dataset."""
+  """Creates TF example for a single dataset.
+
+  Args:
+    interaction_dir: Directory of the input interactions.
+    example_dir: Directory of the output examples.
+    vocab_file: Bert vocab file.
+    filename: Name of the dataset.
+    batch_size: Test batch size or None for training data.
+    test_mode: Only convert a few examples.
+
+  Returns:
+    The keys of the example cache entries that were used.
+  """
 
   filename = f'{filename}.tfrecord'
   interaction_path = os.path.join(interaction_dir, filename)
   example_path = os.path.join(example_dir, filename)
 
-  config = tf_example_utils.ClassifierConversionConfig(
-      vocab_file=vocab_file,
-      max_seq_length=FLAGS.max_seq_length,
-      max_column_id=_MAX_TABLE_ID,
-      max_row_id=_MAX_TABLE_ID,
-      strip_column_names=False,
-      add_aggregation_candidates=False,
-  )
-  converter = tf_example_utils.ToClassifierTensorflowExample(config)
-
-  examples = []
-  num_questions = 0
-  num_conversion_errors = 0
-  for interaction in prediction_utils.iterate_interactions(interaction_path):
-    number_annotation_utils.add_numeric_values(interaction)
-    for i in range(len(interaction.questions)):
-      num_questions += 1
-
-      try:
-        examples.append(converter.convert(interaction, i))
-      except ValueError as e:
-        num_conversion_errors += 1
-        logging.info("Can't convert interaction: %s error: %s", interaction.id,
-                     e)
-    if test_mode and len(examples) >= 100:
-      break
-
-  _print(f'Processed: {filename}')
-  _print(f'Num questions processed: {num_questions}')
-  _print(f'Num examples: {len(examples)}')
-  _print(f'Num conversion errors: {num_conversion_errors}')
+  config, tokenizer_backend, example_cache_namespace = _get_conversion_setup(
+      vocab_file)
+  chunks = _iterate_chunks(
+      tf.python_io.tf_record_iterator(interaction_path),
+      _INTERACTIONS_PER_CHUNK)
+  worker_args = (config, tokenizer_backend, FLAGS.numeric_text_cache_size,
+                 FLAGS.example_cache_dir, example_cache_namespace,
+                 FLAGS.time_conversion_stages)
+  pool = None
+  if FLAGS.num_workers > 1:
+    pool = multiprocessing.Pool(
+        processes=FLAGS.num_workers,
+        initializer=_init_worker,
+        initargs=worker_args)
+    # Results are returned in input order so the output is independent of the
+    # number of workers.
+    chunk_outputs = pool.imap(_convert_chunk, chunks)
+  else:
+    _init_worker(*worker_args)
+    chunk_outputs = map(_convert_chunk, chunks)
 
+  options = _to_tf_compression_type(FLAGS.compression_type)
   if batch_size is None:
-    random.shuffle(examples)
+    # Examples are streamed to temporary shards and shuffled shard by shard
+    # so that the training set doesn't have to fit into memory.
+    writer = tfrecord_utils.ShufflingTFRecordWriter(
+        example_path,
+        num_shards=FLAGS.num_shuffle_shards,
+        seed=FLAGS.shuffle_seed,
+        options=options,
+        num_output_shards=FLAGS.num_output_shards)
   else:
-    # Make sure the eval sets are divisible by the test batch size since
-    # otherwise examples will be dropped on TPU.
-    # These examples will later be ignored when writing the predictions.
-    originial_num_examples = len(examples)
-    while len(examples) % batch_size != 0:
-      examples.append(converter.get_empty_example())
-    if originial_num_examples != len(examples):
-      _print(f'Padded with {len(examples) - originial_num_examples} examples.')
-
-  with tf.io.TFRecordWriter(
-      example_path,
-      options=_to_tf_compression_type(FLAGS.compression_type),
-  ) as writer:
-    for example in examples:
-      writer.write(example.SerializeToString())
+    writer = tfrecord_utils.ShardedTFRecordWriter(
+        example_path, FLAGS.num_output_shards, options=options)
+
+  num_examples = 0
+  num_questions = 0
+  num_conversion_errors = 0
+  worker_stats = {}
+  worker_stage_stats = {}
+  cache_keys = set()
+  with writer:
+    try:
+      for output in _iterate_outputs(chunk_outputs, worker_stats,
+                                     worker_stage_stats):
+        if output.cache_key is not None:
+          cache_keys.add(output.cache_key)
+        num_questions += len(output.examples) + len(output.errors)
+        for example in output.examples:
+          writer.write(example)
+          num_examples += 1
+        for error in output.errors:
+          num_conversion_errors += 1
+          logging.info("Can't convert interaction: %s error: %s",
+                       output.interaction_id, error)
+        if test_mode and num_examples >= 100:
+          break
+    finally:
+      if pool is not None:
+        pool.terminate()
+
+    _print(f'Processed: {filename}')
+    _print(f'Num questions processed: {num_questions}')
+    _print(f'Num examples: {num_examples}')
+    _print(f'Num conversion errors: {num_conversion_errors}')
+    _print_cache_stats(worker_stats)
+    if FLAGS.time_conversion_stages:
+      _print_stage_stats(worker_stage_stats)
+
+    if batch_size is not None:
+      # Make sure the eval sets are divisible by the test batch size since
+      # otherwise examples will be dropped on TPU.
+      # These examples will later be ignored when writing the predictions.
+      num_padding_examples = -num_examples % batch_size
+      if num_padding_examples:
+        empty_example = _get_empty_example(pool, config, tokenizer_backend)
+        for _ in range(num_padding_examples):
+          writer.write(empty_example)
+        _print(f'Padded with {num_padding_examples} examples.')
+
+  return cache_keys
 
 
 def _get_train_examples_file(task, output_dir):
-  return os.path.join(output_dir, 'tf_examples',
+  path = os.path.join(output_dir, 'tf_examples',
                       f'{task_utils.get_train_filename(task)}.tfrecord')
+  return tfrecord_utils.get_file_pattern(path, FLAGS.num_output_shards)
 
 
 def _get_test_filename(task, test_set):
@@ -277,7 +604,8 @@ def _get_test_examples_file(
     test_set,
 ):
   filename = _get_test_filename(task, test_set)
-  return os.path.join(output_dir, 'tf_examples', f'{filename}.tfrecord')
+  path = os.path.join(output_dir, 'tf_examples', f'{filename}.tfrecord')
+  return tfrecord_utils.get_file_pattern(path, FLAGS.num_output_shards)
 
 
 def _get_test_interactions_file(
@@ -706,7 +1034,7 @@ def _check_options(output_dir, task, mode):
       output_dir,
       test_set=TestSet.DEV,
   )
-  if not tf.io.gfile.exists(tf_examples):
+  if not tf.io.gfile.glob(tf_examples):
     raise ValueError(f'No TF examples found: {tf_examples}')
 
   _print(f'is_built_with_cuda: {tf.test.is_built_with_cuda()}')
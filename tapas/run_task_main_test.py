@@ -0,0 +1,179 @@
+# coding=utf-8
+# Copyright 2019 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# Lint as: python3
+
+import os
+import tempfile
+
+from absl import flags
+from absl.testing import absltest
+from absl.testing import flagsaver
+from tapas import run_task_main
+from tapas.utils import benchmark_utils
+from tapas.utils import number_annotation_utils
+from tapas.utils import tf_example_utils
+import tensorflow.compat.v1 as tf
+
+FLAGS = flags.FLAGS
+
+_SHAPE = benchmark_utils.TableShape(
+    name='test',
+    num_rows=4,
+    num_columns=3,
+    cell_length=2,
+    numeric_fraction=0.3,
+    date_fraction=0.3,
+    num_questions=3)
+_NUM_INTERACTIONS = 40
+
+
+def _read_examples(path):
+  return [
+      tf.train.Example.FromString(value)
+      for value in tf.python_io.tf_record_iterator(path)
+  ]
+
+
+class CreateExamplesTest(absltest.TestCase):
+
+  def setUp(self):
+    super(CreateExamplesTest, self).setUp()
+    # The conversion reads the flag defaults if the test runs without
+    # absltest.main.
+    if not FLAGS.is_parsed():
+      FLAGS.mark_as_parsed()
+    test_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(test_dir.cleanup)
+    self._test_dir = test_dir.name
+    self._vocab_file = os.path.join(self._test_dir, 'vocab.txt')
+    benchmark_utils.create_vocab(self._vocab_file)
+    self._interaction_dir = os.path.join(self._test_dir, 'interactions')
+    tf.io.gfile.makedirs(self._interaction_dir)
+    self._interactions = benchmark_utils.create_interactions(
+        _SHAPE, _NUM_INTERACTIONS, seed=1)
+    # More interactions than fit into a single chunk.
+    self.assertGreater(
+        len(self._interactions), run_task_main._INTERACTIONS_PER_CHUNK)
+    with tf.io.TFRecordWriter(
+        os.path.join(self._interaction_dir, 'data.tfrecord')) as writer:
+      for interaction in self._interactions:
+        writer.write(interaction.SerializeToString())
+
+  def _create_examples(self, num_workers, batch_size):
+    example_dir = os.path.join(self._test_dir,
+                               f'examples_{num_workers}_{batch_size}')
+    tf.io.gfile.makedirs(example_dir)
+    with flagsaver.flagsaver(
+        num_workers=num_workers,
+        max_seq_length=64,
+        compression_type='',
+        shuffle_seed=1,
+        num_shuffle_shards=3,
+        num_output_shards=1):
+      run_task_main._create_examples(
+          self._interaction_dir,
+          example_dir,
+          self._vocab_file,
+          'data',
+          batch_size=batch_size,
+          test_mode=False)
+    return _read_examples(os.path.join(example_dir, 'data.tfrecord'))
+
+  def _get_expected_examples(self):
+    converter = tf_example_utils.ToClassifierTensorflowExample(
+        tf_example_utils.ClassifierConversionConfig(
+            vocab_file=self._vocab_file,
+            max_seq_length=64,
+            max_column_id=run_task_main._MAX_TABLE_ID,
+            max_row_id=run_task_main._MAX_TABLE_ID,
+            strip_column_names=False,
+            add_aggregation_candidates=False,
+        ))
+    examples = []
+    for interaction in self._interactions:
+      number_annotation_utils.add_numeric_values(interaction)
+      for index in range(len(interaction.questions)):
+        examples.append(converter.convert(interaction, index))
+    return examples, converter.get_empty_example()
+
+  def test_test_set_is_independent_of_num_workers(self):
+    expected_examples, empty_example = self._get_expected_examples()
+    batch_size = 7
+    num_padding_examples = -len(expected_examples) % batch_size
+    self.assertGreater(num_padding_examples, 0)
+    for num_workers in [1, 2]:
+      examples = self._create_examples(num_workers, batch_size=batch_size)
+      self.assertEqual(
+          examples,
+          expected_examples + [empty_example] * num_padding_examples)
+
+  def test_train_set_is_independent_of_num_workers(self):
+    expected_examples, _ = self._get_expected_examples()
+    serial_examples = self._create_examples(num_workers=1, batch_size=None)
+    pool_examples = self._create_examples(num_workers=2, batch_size=None)
+    self.assertEqual(serial_examples, pool_examples)
+    self.assertNotEqual(serial_examples, expected_examples)
+    self.assertCountEqual(serial_examples, expected_examples)
+
+
+class InitWorkerTest(absltest.TestCase):
+
+  def setUp(self):
+    super(InitWorkerTest, self).setUp()
+    if not FLAGS.is_parsed():
+      FLAGS.mark_as_parsed()
+
+  def test_init_worker(self):
+    test_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(test_dir.cleanup)
+    vocab_file = os.path.join(test_dir.name, 'vocab.txt')
+    benchmark_utils.create_vocab(vocab_file)
+    config = tf_example_utils.ClassifierConversionConfig(
+        vocab_file=vocab_file,
+        max_seq_length=64,
+        max_column_id=run_task_main._MAX_TABLE_ID,
+        max_row_id=run_task_main._MAX_TABLE_ID,
+        strip_column_names=False,
+        add_aggregation_candidates=False,
+    )
+    interactions = benchmark_utils.create_interactions(_SHAPE, 2, seed=1)
+    chunk = [interaction.SerializeToString() for interaction in interactions]
+
+    # Workers only use their arguments, no flags are read.
+    with flagsaver.flagsaver(num_workers=3, example_cache_dir=None):
+      run_task_main._init_worker(
+          config,
+          tf_example_utils.TokenizerBackend.BERT,
+          numeric_text_cache_size=10,
+          example_cache_dir=os.path.join(test_dir.name, 'cache'),
+          example_cache_namespace='namespace',
+          time_stages=True)
+    for expected_hits in [0, 2]:
+      worker_id, outputs, stats, stage_stats = run_task_main._convert_chunk(
+          chunk)
+      self.assertEqual(worker_id, os.getpid())
+      self.assertEqual([output.interaction_id for output in outputs],
+                       [interaction.id for interaction in interactions])
+      for output in outputs:
+        self.assertLen(output.examples, _SHAPE.num_questions)
+        self.assertEmpty(output.errors)
+        self.assertIsNotNone(output.cache_key)
+      self.assertEqual(stats['Example cache']['hits'], expected_hits)
+      self.assertEqual(stats['Example cache']['misses'], 2)
+      self.assertNotEmpty(stage_stats['stages'])
+
+
+if __name__ == '__main__':
+  absltest.main()
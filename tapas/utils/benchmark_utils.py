@@ -0,0 +1,311 @@
+# coding=utf-8
+# Copyright 2019 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# Lint as: python3
+"""Synthetic interactions and timing helpers to benchmark TF example creation."""
+
+import dataclasses
+import enum
+import random
+import time
+import tracemalloc
+from typing import Text
+
+import numpy as np
+from tapas.protos import interaction_pb2
+from tapas.utils import number_annotation_utils
+from tapas.utils import tf_example_utils
+
+_RESERVED_SYMBOLS = ('[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]', '[EMPTY]')
+_NUM_WORDS = 500
+_MONTHS = ('january', 'february', 'march', 'april', 'may', 'june', 'july',
+           'august', 'september', 'october', 'november', 'december')
+_PUNCTUATION = ('.', ',', '-', '?')
+
+
+class ConverterType(enum.Enum):
+  CLASSIFIER = 1
+  PRETRAINING = 2
+
+
+@dataclasses.dataclass(frozen=True)
+class TableShape:
+  """Describes the synthetic interactions of a benchmark configuration.
+
+  name: Name of the configuration.
+  num_rows: Number of rows excluding the header.
+  num_columns: Number of columns.
+  cell_length: Number of words of text cells.
+  numeric_fraction: Fraction of cells that contain a number.
+  date_fraction: Fraction of cells that contain a date.
+  num_questions: Number of questions per interaction.
+  """
+  name: Text
+  num_rows: int
+  num_columns: int
+  cell_length: int
+  numeric_fraction: float
+  date_fraction: float
+  num_questions: int
+
+
+DEFAULT_SHAPES = (
+    TableShape('small', 5, 4, 2, 0.3, 0.1, 3),
+    TableShape('medium', 50, 8, 2, 0.3, 0.1, 3),
+    TableShape('large', 500, 10, 2, 0.3, 0.1, 3),
+    TableShape('long_cells', 50, 8, 12, 0.1, 0.0, 3),
+    TableShape('numeric', 100, 8, 1, 0.9, 0.0, 3),
+    TableShape('dates', 100, 8, 1, 0.1, 0.8, 3),
+    TableShape('many_questions', 50, 8, 2, 0.3, 0.1, 20),
+)
+
+
+@dataclasses.dataclass(frozen=True)
+class BenchmarkResult:
+  """Throughput, latency and memory of a single configuration.
+
+  Latencies are measured per converted example. The peak memory is the peak of
+  the Python allocations traced while converting in a separate pass.
+  """
+  shape: Text
+  converter: Text
+  num_interactions: int
+  num_examples: int
+  num_errors: int
+  examples_per_second: float
+  latency_p50_ms: float
+  latency_p99_ms: float
+  peak_memory_mb: float
+
+
+def _get_words():
+  return [f'w{index}' for index in range(_NUM_WORDS)]
+
+
+def create_vocab(vocab_file):
+  """Writes a vocab that covers all words of the synthetic interactions."""
+  digits = [str(digit) for digit in range(10)]
+  words = (
+      list(_RESERVED_SYMBOLS) + _get_words() + list(_MONTHS) + digits +
+      [f'##{digit}' for digit in digits] + list(_PUNCTUATION))
+  with open(vocab_file, 'tw') as output_file:
+    for word in words:
+      output_file.write(f'{word}\n')
+
+
+def _get_text(rng, length):
+  return ' '.join(rng.choice(_get_words()) for _ in range(length))
+
+
+def _get_cell_text(rng, shape):
+  value = rng.random()
+  if value < shape.numeric_fraction:
+    if rng.random() < 0.5:
+      return str(rng.randint(0, 100000))
+    return f'{rng.uniform(0, 1000):.2f}'
+  if value < shape.numeric_fraction + shape.date_fraction:
+    return (f'{rng.choice(_MONTHS)} {rng.randint(1, 28)}, '
+            f'{rng.randint(1900, 2020)}')
+  return _get_text(rng, shape.cell_length)
+
+
+def create_interaction(rng, shape,
+                       interaction_id):
+  """Creates a random interaction with numeric value annotations."""
+  interaction = interaction_pb2.Interaction(id=interaction_id)
+  table = interaction.table
+  table.table_id = f'table_{interaction_id}'
+  for _ in range(shape.num_columns):
+    table.columns.add().text = _get_text(rng, 2)
+  for _ in range(shape.num_rows):
+    row = table.rows.add()
+    for _ in range(shape.num_columns):
+      row.cells.add().text = _get_cell_text(rng, shape)
+
+  for index in range(shape.num_questions):
+    question = interaction.questions.add()
+    question.id = f'{interaction_id}-{index}_0'
+    question.original_text = (
+        f'{_get_text(rng, rng.randint(5, 15))} {rng.randint(0, 1000)} ?')
+    question.text = question.original_text
+    if shape.num_rows:
+      coordinate = question.answer.answer_coordinates.add()
+      coordinate.row_index = rng.randrange(shape.num_rows)
+      coordinate.column_index = rng.randrange(shape.num_columns)
+      question.answer.answer_texts.append(
+          table.rows[coordinate.row_index].cells[coordinate.column_index].text)
+  number_annotation_utils.add_numeric_values(interaction)
+  return interaction
+
+
+def create_interactions(shape, num_interactions,
+                        seed):
+  rng = random.Random(seed)
+  return [
+      create_interaction(rng, shape, f'{shape.name}_{index}')
+      for index in range(num_interactions)
+  ]
+
+
+def _iterate_conversions(
+    converter_type, converter,
+    interactions, seed):
+  """Yields a function per example that runs its conversion."""
+  for interaction in interactions:
+    if converter_type == ConverterType.CLASSIFIER:
+      for index in range(len(interaction.questions)):
+        yield lambda interaction=interaction, index=index: converter.convert(
+            interaction, index)
+    else:
+      rng = random.Random(
+          tf_example_utils.fingerprint(f'{seed}_{interaction.id}'))
+      yield lambda interaction=interaction, rng=rng: converter.convert(
+          rng, interaction, None)
+
+
+def _run_conversions(conversions):
+  """Runs all conversions and returns latencies and number of errors."""
+  latencies = []
+  num_errors = 0
+  for conversion in conversions:
+    start_time = time.perf_counter()
+    try:
+      if conversion() is None:
+        num_errors += 1
+    except ValueError:
+      num_errors += 1
+    latencies.append(time.perf_counter() - start_time)
+  return latencies, num_errors
+
+
+def create_converter(converter_type, vocab_file,
+                     max_seq_length):
+  """Creates a converter with the settings used for fine-tuning/pretraining."""
+  if converter_type == ConverterType.CLASSIFIER:
+    return tf_example_utils.ToClassifierTensorflowExample(
+        tf_example_utils.ClassifierConversionConfig(
+            vocab_file=vocab_file,
+            max_seq_length=max_seq_length,
+            max_column_id=512,
+            max_row_id=512,
+            strip_column_names=False,
+            add_aggregation_candidates=False,
+        ))
+  return tf_example_utils.ToPretrainingTensorflowExample(
+      tf_example_utils.PretrainConversionConfig(
+          vocab_file=vocab_file,
+          max_seq_length=max_seq_length,
+          max_predictions_per_seq=20,
+          random_seed=1,
+          masked_lm_prob=0.15,
+          max_column_id=512,
+          max_row_id=512,
+          min_question_length=1,
+          max_question_length=32,
+          always_continue_cells=True,
+          strip_column_names=False,
+      ))
+
+
+def run_benchmark(
+    converter_type,
+    vocab_file,
+    shape,
+    num_interactions,
+    max_seq_length,
+    seed,
+):
+  """Converts synthetic interactions of 'shape' and measures the conversion.
+
+  Args:
+    converter_type: The converter to benchmark.
+    vocab_file: Vocab file created by 'create_vocab'.
+    shape: Describes the interactions.
+    num_interactions: Number of interactions to convert.
+    max_seq_length: Max length of a sequence in word pieces.
+    seed: Random seed of the interactions and the pretraining conversion.
+
+  Returns:
+    The benchmark result.
+  """
+  interactions = create_interactions(shape, num_interactions, seed)
+
+  # Each pass uses a new converter so that no pass profits from the caches
+  # filled by the previous one.
+  converter = create_converter(converter_type, vocab_file, max_seq_length)
+  start_time = time.perf_counter()
+  latencies, num_errors = _run_conversions(
+      _iterate_conversions(converter_type, converter, interactions, seed))
+  total_time = time.perf_counter() - start_time
+
+  # Tracing allocations slows down the conversion, so memory is measured in a
+  # separate pass.
+  converter = create_converter(converter_type, vocab_file, max_seq_length)
+  tracemalloc.start()
+  try:
+    _run_conversions(
+        _iterate_conversions(converter_type, converter, interactions, seed))
+    _, peak_memory = tracemalloc.get_traced_memory()
+  finally:
+    tracemalloc.stop()
+
+  latencies_ms = np.array(latencies) * 1000.0
+  num_examples = len(latencies) - num_errors
+  return BenchmarkResult(
+      shape=shape.name,
+      converter=converter_type.name.lower(),
+      num_interactions=num_interactions,
+      num_examples=num_examples,
+      num_errors=num_errors,
+      examples_per_second=num_examples / total_time if total_time else 0.0,
+      latency_p50_ms=float(np.percentile(latencies_ms, 50))
+      if latencies else 0.0,
+      latency_p99_ms=float(np.percentile(latencies_ms, 99))
+      if latencies else 0.0,
+      peak_memory_mb=peak_memory / 2**20,
+  )
+
+
+def run_benchmarks(
+    vocab_file,
+    shapes,
+    converter_types,
+    num_interactions,
+    max_seq_length,
+    seed,
+    report_fn = None,
+):
+  """Runs 'run_benchmark' for all shapes and converters.
+
+  Args:
+    vocab_file: Vocab file created by 'create_vocab'.
+    shapes: Describes the interactions of the configurations.
+    converter_types: Converters to benchmark.
+    num_interactions: Number of interactions per configuration.
+    max_seq_length: Max length of a sequence in word pieces.
+    seed: Random seed.
+    report_fn: Optionally called with every result once it is available.
+
+  Returns:
+    The results as JSON serializable dicts.
+  """
+  results = []
+  for shape in shapes:
+    for converter_type in converter_types:
+      result = run_benchmark(converter_type, vocab_file, shape,
+                             num_interactions, max_seq_length, seed)
+      if report_fn is not None:
+        report_fn(result)
+      results.append(dataclasses.asdict(result))
+  return results
@@ -0,0 +1,88 @@
+# coding=utf-8
+# Copyright 2019 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# Lint as: python3
+
+import os
+import random
+import tempfile
+
+from absl.testing import absltest
+from tapas.utils import benchmark_utils
+
+_SHAPE = benchmark_utils.TableShape(
+    name='test',
+    num_rows=4,
+    num_columns=3,
+    cell_length=2,
+    numeric_fraction=0.3,
+    date_fraction=0.3,
+    num_questions=2)
+
+
+class BenchmarkUtilsTest(absltest.TestCase):
+
+  def test_create_interaction(self):
+    interaction = benchmark_utils.create_interaction(
+        random.Random(1), _SHAPE, 'id')
+    self.assertLen(interaction.table.columns, 3)
+    self.assertLen(interaction.table.rows, 4)
+    self.assertLen(interaction.questions, 2)
+    self.assertEqual(
+        interaction,
+        benchmark_utils.create_interaction(random.Random(1), _SHAPE, 'id'))
+
+  def test_run_benchmarks(self):
+    with tempfile.TemporaryDirectory() as temp_dir:
+      vocab_file = os.path.join(temp_dir, 'vocab.txt')
+      benchmark_utils.create_vocab(vocab_file)
+      results = benchmark_utils.run_benchmarks(
+          vocab_file, [_SHAPE],
+          list(benchmark_utils.ConverterType),
+          num_interactions=2,
+          max_seq_length=64,
+          seed=1)
+
+    self.assertEqual([(result['shape'], result['converter'])
+                      for result in results], [('test', 'classifier'),
+                                               ('test', 'pretraining')])
+    classifier_result, pretraining_result = results
+    self.assertEqual(classifier_result['num_examples'], 4)
+    self.assertEqual(pretraining_result['num_examples'], 2)
+    for result in results:
+      self.assertEqual(result['num_errors'], 0)
+      self.assertGreater(result['examples_per_second'], 0)
+      self.assertGreater(result['peak_memory_mb'], 0)
+
+  def test_run_benchmark_with_errors(self):
+    with tempfile.TemporaryDirectory() as temp_dir:
+      vocab_file = os.path.join(temp_dir, 'vocab.txt')
+      benchmark_utils.create_vocab(vocab_file)
+      # No question fits into a sequence of 4 word pieces.
+      result = benchmark_utils.run_benchmark(
+          benchmark_utils.ConverterType.CLASSIFIER,
+          vocab_file,
+          _SHAPE,
+          num_interactions=2,
+          max_seq_length=4,
+          seed=1)
+
+    self.assertEqual(result.num_examples, 0)
+    self.assertEqual(result.num_errors, 4)
+    # Failed conversions don't count towards the throughput.
+    self.assertEqual(result.examples_per_second, 0.0)
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -0,0 +1,84 @@
+# coding=utf-8
+# Copyright 2019 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# Lint as: python3
+"""A bounded least-recently-used cache with hit and miss counters."""
+
+import collections
+import threading
+from typing import Any, Callable, Hashable, Mapping, Text
+
+
+class LruCache:
+  """Maps keys to values and evicts the least recently used entries.
+
+  All operations take a lock so that a single instance can be shared by
+  several converters in one process.
+  """
+
+  def __init__(self, max_size):
+    if max_size <= 0:
+      raise ValueError(f'Invalid cache size: {max_size}')
+    self._max_size = max_size
+    self._entries = collections.OrderedDict()
+    self._lock = threading.Lock()
+    self._hits = 0
+    self._misses = 0
+
+  @property
+  def hits(self):
+    return self._hits
+
+  @property
+  def misses(self):
+    return self._misses
+
+  def __len__(self):
+    return len(self._entries)
+
+  def get(self, key, compute_fn):
+    """Returns the value for 'key', calls 'compute_fn(key)' if missing.
+
+    Args:
+      key: Cache key.
+      compute_fn: Computes the value of a missing key. It is called without
+        holding the lock so that slow computations don't block other threads.
+
+    Returns:
+      The cached or newly computed value.
+    """
+    with self._lock:
+      if key in self._entries:
+        self._hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key]
+      self._misses += 1
+    value = compute_fn(key)
+    with self._lock:
+      self._entries[key] = value
+      self._entries.move_to_end(key)
+      while len(self._entries) > self._max_size:
+        self._entries.popitem(last=False)
+    return value
+
+  def get_stats(self):
+    """Returns hit and miss counts, current size and hit rate."""
+    with self._lock:
+      lookups = self._hits + self._misses
+      return {
+          'hits': self._hits,
+          'misses': self._misses,
+          'size': len(self._entries),
+          'hit_rate': self._hits / lookups if lookups else 0.0,
+      }
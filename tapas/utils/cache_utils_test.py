@@ -0,0 +1,53 @@
+# coding=utf-8
+# Copyright 2019 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# Lint as: python3
+
+from absl.testing import absltest
+from tapas.utils import cache_utils
+
+
+class LruCacheTest(absltest.TestCase):
+
+  def test_get(self):
+    cache = cache_utils.LruCache(max_size=2)
+    computed = []
+
+    def compute_fn(key):
+      computed.append(key)
+      return key * 2
+
+    self.assertEqual(cache.get(1, compute_fn), 2)
+    self.assertEqual(cache.get(2, compute_fn), 4)
+    self.assertEqual(cache.get(1, compute_fn), 2)
+    # Evicts 2 since 1 was used more recently.
+    self.assertEqual(cache.get(3, compute_fn), 6)
+    self.assertEqual(cache.get(1, compute_fn), 2)
+    self.assertEqual(cache.get(2, compute_fn), 4)
+    self.assertEqual(computed, [1, 2, 3, 2])
+    self.assertLen(cache, 2)
+    self.assertEqual(cache.get_stats(), {
+        'hits': 2,
+        'misses': 4,
+        'size': 2,
+        'hit_rate': 2 / 6,
+    })
+
+  def test_invalid_size(self):
+    with self.assertRaises(ValueError):
+      cache_utils.LruCache(max_size=0)
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -0,0 +1,206 @@
+# coding=utf-8
+# Copyright 2019 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# Lint as: python3
+"""A content addressed on-disk cache of converted examples."""
+
+import hashlib
+import os
+import uuid
+
+import tensorflow.compat.v1 as tf
+
+# Changes whenever the format of the cached values changes, so that old
+# entries are not read.
+_FORMAT_VERSION = 'tf_example_v1'
+# Marks entries that are still being written.
+_TEMP_INFIX = '.tmp-'
+
+
+def get_namespace(*parts):
+  """Returns a fingerprint of everything that influences the conversion.
+
+  Args:
+    *parts: Strings such as the conversion config and the vocab fingerprint.
+  """
+  hasher = hashlib.sha256()
+  for part in parts:
+    hasher.update(part.encode('utf-8'))
+    hasher.update(b'\0')
+  return hasher.hexdigest()
+
+
+def get_file_fingerprint(path):
+  """Returns a fingerprint of the content of the file at 'path'."""
+  with tf.io.gfile.GFile(path, 'rb') as input_file:
+    return hashlib.sha256(input_file.read()).hexdigest()
+
+
+def _get_namespace_dir(cache_dir, namespace):
+  """Returns the directory that holds the entries of 'namespace'."""
+  fingerprint = hashlib.sha256(
+      f'{_FORMAT_VERSION}\0{namespace}'.encode('utf-8')).hexdigest()
+  return os.path.join(cache_dir, fingerprint)
+
+
+class ExampleCache:
+  """Maps serialized inputs to serialized conversion outputs.
+
+  Entries are files named by the fingerprint of the namespace and the input,
+  so changed inputs or a changed conversion setup lead to new entries. Every
+  namespace has its own subdirectory, so the entries of other tasks and
+  conversion setups in the same cache directory are not pruned. Entries are
+  written to a temporary file first and then renamed so that several processes
+  can share a cache directory.
+  """
+
+  def __init__(self, cache_dir, namespace):
+    self._cache_dir = _get_namespace_dir(cache_dir, namespace)
+    self._namespace = namespace.encode('utf-8')
+    self._hits = 0
+    self._misses = 0
+    tf.io.gfile.makedirs(self._cache_dir)
+
+  def get_key(self, serialized_input):
+    """Returns the cache key of 'serialized_input'."""
+    return hashlib.sha256(_FORMAT_VERSION.encode('utf-8') + b'\0' +
+                          self._namespace + b'\0' +
+                          serialized_input).hexdigest()
+
+  def _get_path(self, key):
+    return os.path.join(self._cache_dir, key)
+
+  def get(self, key, compute_fn):
+    """Returns the value for 'key', calls and stores 'compute_fn()' if missing.
+
+    Args:
+      key: Cache key, see get_key.
+      compute_fn: Computes the serialized value of a missing key.
+
+    Returns:
+      The cached or newly computed value.
+    """
+    path = self._get_path(key)
+    try:
+      with tf.io.gfile.GFile(path, 'rb') as input_file:
+        value = input_file.read()
+      self._hits += 1
+      return value
+    except tf.errors.NotFoundError:
+      self._misses += 1
+    value = compute_fn()
+    temp_path = f'{path}{_TEMP_INFIX}{uuid.uuid4().hex}'
+    with tf.io.gfile.GFile(temp_path, 'wb') as output_file:
+      output_file.write(value)
+    tf.io.gfile.rename(temp_path, path, overwrite=True)
+    return value
+
+  def get_stats(self):
+    """Returns hit and miss counts and hit rate."""
+    lookups = self._hits + self._misses
+    return {
+        'hits': self._hits,
+        'misses': self._misses,
+        'hit_rate': self._hits / lookups if lookups else 0.0,
+    }
+
+
+def encode_outputs(interaction_id, examples,
+                   errors):
+  """Serializes conversion outputs as a tf.train.Example.
+
+  Args:
+    interaction_id: Id of the converted interaction.
+    examples: Serialized examples.
+    errors: Conversion error messages.
+
+  Returns:
+    The serialized container.
+  """
+  feature = {
+      'interaction_id':
+          tf.train.Feature(
+              bytes_list=tf.train.BytesList(
+                  value=[interaction_id.encode('utf-8')])),
+      'examples':
+          tf.train.Feature(bytes_list=tf.train.BytesList(value=examples)),
+      'errors':
+          tf.train.Feature(
+              bytes_list=tf.train.BytesList(
+                  value=[error.encode('utf-8') for error in errors])),
+  }
+  return tf.train.Example(features=tf.train.Features(
+      feature=feature)).SerializeToString()
+
+
+def decode_outputs(value):
+  """Parses the output of encode_outputs.
+
+  Args:
+    value: Serialized container.
+
+  Returns:
+    The interaction id, the serialized examples and the error messages.
+  """
+  feature = tf.train.Example.FromString(value).features.feature
+  interaction_id = feature['interaction_id'].bytes_list.value[0].decode('utf-8')
+  examples = list(feature['examples'].bytes_list.value)
+  errors = [
+      error.decode('utf-8') for error in feature['errors'].bytes_list.value
+  ]
+  return interaction_id, examples, errors
+
+
+def get_stale_keys(cache_dir, namespace,
+                   used_keys):
+  """Returns the keys of the entries of 'namespace' not in 'used_keys'.
+
+  Entries that are still being written by another process are not stale.
+
+  Args:
+    cache_dir: Directory of an ExampleCache.
+    namespace: Namespace of the ExampleCache.
+    used_keys: Keys of the entries to keep.
+
+  Returns:
+    The sorted keys.
+  """
+  namespace_dir = _get_namespace_dir(cache_dir, namespace)
+  if not tf.io.gfile.exists(namespace_dir):
+    return []
+  used_keys = set(used_keys)
+  return sorted(
+      key for key in tf.io.gfile.listdir(namespace_dir)
+      if key not in used_keys and _TEMP_INFIX not in key)
+
+
+def prune(cache_dir, namespace, used_keys):
+  """Deletes the entries of 'namespace' that are not in 'used_keys'.
+
+  Entries of other namespaces and entries that are still being written are
+  kept.
+
+  Args:
+    cache_dir: Directory of an ExampleCache.
+    namespace: Namespace of the ExampleCache.
+    used_keys: Keys of the entries to keep.
+
+  Returns:
+    The number of deleted entries.
+  """
+  namespace_dir = _get_namespace_dir(cache_dir, namespace)
+  stale_keys = get_stale_keys(cache_dir, namespace, used_keys)
+  for key in stale_keys:
+    tf.io.gfile.remove(os.path.join(namespace_dir, key))
+  return len(stale_keys)
@@ -0,0 +1,120 @@
+# coding=utf-8
+# Copyright 2019 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# Lint as: python3
+
+import os
+import tempfile
+
+from absl.testing import absltest
+from tapas.utils import example_cache_utils
+
+
+class ExampleCacheTest(absltest.TestCase):
+
+  def test_get(self):
+    with tempfile.TemporaryDirectory() as cache_dir:
+      computed = []
+
+      def compute_fn(value):
+        computed.append(value)
+        return value * 2
+
+      cache = example_cache_utils.ExampleCache(cache_dir, namespace='a')
+      key_1 = cache.get_key(b'1')
+      key_2 = cache.get_key(b'2')
+      self.assertEqual(cache.get(key_1, lambda: compute_fn(b'1')), b'11')
+      self.assertEqual(cache.get(key_2, lambda: compute_fn(b'2')), b'22')
+      self.assertEqual(cache.get(key_1, lambda: compute_fn(b'1')), b'11')
+      self.assertEqual(computed, [b'1', b'2'])
+      self.assertEqual(cache.get_stats(), {
+          'hits': 1,
+          'misses': 2,
+          'hit_rate': 1 / 3,
+      })
+
+      # Entries are shared between instances with the same namespace.
+      cache = example_cache_utils.ExampleCache(cache_dir, namespace='a')
+      self.assertEqual(cache.get(key_2, lambda: compute_fn(b'2')), b'22')
+      self.assertEqual(computed, [b'1', b'2'])
+
+      cache = example_cache_utils.ExampleCache(cache_dir, namespace='b')
+      self.assertNotEqual(cache.get_key(b'1'), key_1)
+
+  def test_prune(self):
+    with tempfile.TemporaryDirectory() as cache_dir:
+      cache = example_cache_utils.ExampleCache(cache_dir, namespace='a')
+      keys = [cache.get_key(value) for value in [b'1', b'2', b'3']]
+      for key in keys:
+        cache.get(key, lambda: b'value')
+
+      self.assertEqual(
+          example_cache_utils.get_stale_keys(cache_dir, 'a', keys[:1]),
+          sorted(keys[1:]))
+      self.assertEqual(example_cache_utils.prune(cache_dir, 'a', keys[:1]), 2)
+      self.assertEqual(
+          example_cache_utils.get_stale_keys(cache_dir, 'a', []), keys[:1])
+
+  def test_prune_keeps_other_namespaces(self):
+    with tempfile.TemporaryDirectory() as cache_dir:
+      cache_a = example_cache_utils.ExampleCache(cache_dir, namespace='a')
+      key_a = cache_a.get_key(b'1')
+      cache_a.get(key_a, lambda: b'a')
+      cache_b = example_cache_utils.ExampleCache(cache_dir, namespace='b')
+      key_b = cache_b.get_key(b'1')
+      cache_b.get(key_b, lambda: b'b')
+
+      self.assertEqual(example_cache_utils.prune(cache_dir, 'b', []), 1)
+      self.assertEmpty(example_cache_utils.get_stale_keys(cache_dir, 'b', []))
+      self.assertEqual(
+          example_cache_utils.get_stale_keys(cache_dir, 'a', []), [key_a])
+      cache_a = example_cache_utils.ExampleCache(cache_dir, namespace='a')
+      self.assertEqual(cache_a.get(key_a, lambda: b'computed'), b'a')
+
+  def test_prune_keeps_temporary_files(self):
+    with tempfile.TemporaryDirectory() as cache_dir:
+      cache = example_cache_utils.ExampleCache(cache_dir, namespace='a')
+      key = cache.get_key(b'1')
+      cache.get(key, lambda: b'value')
+      # A file that another process is about to rename to its entry.
+      namespace_dir, = os.listdir(cache_dir)
+      temp_path = os.path.join(cache_dir, namespace_dir,
+                               f'{cache.get_key(b"2")}.tmp-0')
+      with open(temp_path, 'wb') as temp_file:
+        temp_file.write(b'value')
+
+      self.assertEqual(example_cache_utils.prune(cache_dir, 'a', []), 1)
+      self.assertTrue(os.path.exists(temp_path))
+
+  def test_namespace(self):
+    self.assertEqual(
+        example_cache_utils.get_namespace('a', 'b'),
+        example_cache_utils.get_namespace('a', 'b'))
+    self.assertNotEqual(
+        example_cache_utils.get_namespace('ab', ''),
+        example_cache_utils.get_namespace('a', 'b'))
+
+  def test_encode_outputs(self):
+    value = example_cache_utils.encode_outputs('id_0', [b'\x00\x01', b''],
+                                               ['error \u00e9'])
+    self.assertEqual(
+        example_cache_utils.decode_outputs(value),
+        ('id_0', [b'\x00\x01', b''], ['error \u00e9']))
+    self.assertEqual(
+        example_cache_utils.decode_outputs(
+            example_cache_utils.encode_outputs('', [], [])), ('', [], []))
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -0,0 +1,123 @@
+# coding=utf-8
+# Copyright 2019 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# Lint as: python3
+"""Single pass word piece tokenizer that matches the Bert tokenizer output.
+
+The Bert FullTokenizer runs basic tokenization on its input, so calling it on
+every word produced by a BasicTokenizer normalizes the text twice. The
+tokenizer in this module normalizes and splits the text once and then finds
+the greedy longest-match-first word pieces by walking a character trie of the
+vocab instead of testing every prefix of a word.
+"""
+
+from typing import Iterable, List, Mapping, Optional, Text, Tuple
+
+from official.nlp.bert import tokenization
+
+_INNER_PREFIX = '##'
+# Marks trie nodes that complete a vocab entry.
+_IS_PIECE = None
+
+
+def _build_trie(words):
+  """Builds a character trie (nested dicts) from the words."""
+  root = {}
+  for word in words:
+    if not word:
+      continue
+    node = root
+    for char in word:
+      node = node.setdefault(char, {})
+    node[_IS_PIECE] = True
+  return root
+
+
+def _find_longest_match(trie, word, start):
+  """Returns the end of the longest vocab entry in 'word' starting at 'start'."""
+  end = None
+  node = trie
+  for index in range(start, len(word)):
+    node = node.get(word[index])
+    if node is None:
+      break
+    if _IS_PIECE in node:
+      end = index + 1
+  return end
+
+
+class FastWordpieceTokenizer:
+  """Basic tokenization followed by trie based word piece tokenization."""
+
+  def __init__(self,
+               vocab,
+               unk_token,
+               max_input_chars_per_word,
+               do_lower_case = True):
+    """Initializes the tokenizer.
+
+    Args:
+      vocab: Word piece vocab, inner pieces start with '##'.
+      unk_token: Piece that replaces words that can't be tokenized.
+      max_input_chars_per_word: Longer words are mapped to 'unk_token'.
+      do_lower_case: Whether to lower case the input.
+    """
+    self._basic_tokenizer = tokenization.BasicTokenizer(
+        do_lower_case=do_lower_case)
+    self._unk_token = unk_token
+    self._max_input_chars_per_word = max_input_chars_per_word
+    self._begin_trie = _build_trie(
+        word for word in vocab if not word.startswith(_INNER_PREFIX))
+    self._inner_trie = _build_trie(
+        word[len(_INNER_PREFIX):]
+        for word in vocab
+        if word.startswith(_INNER_PREFIX))
+
+  @classmethod
+  def from_bert_tokenizer(
+      cls, bert_tokenizer,
+      do_lower_case = True):
+    """Creates a tokenizer with the vocab and options of a FullTokenizer."""
+    wordpiece_tokenizer = bert_tokenizer.wordpiece_tokenizer
+    return cls(
+        vocab=bert_tokenizer.vocab,
+        unk_token=wordpiece_tokenizer.unk_token,
+        max_input_chars_per_word=wordpiece_tokenizer.max_input_chars_per_word,
+        do_lower_case=do_lower_case)
+
+  def _get_pieces(self, word):
+    """Splits a single word into word pieces."""
+    if len(word) > self._max_input_chars_per_word:
+      return [self._unk_token]
+    pieces = []
+    start = 0
+    while start < len(word):
+      if start == 0:
+        end = _find_longest_match(self._begin_trie, word, start)
+      else:
+        end = _find_longest_match(self._inner_trie, word, start)
+      if end is None:
+        return [self._unk_token]
+      if start == 0:
+        pieces.append(word[start:end])
+      else:
+        pieces.append(_INNER_PREFIX + word[start:end])
+      start = end
+    return pieces
+
+  def tokenize(self, text):
+    """Returns (word, piece) tuples for all word pieces in 'text'."""
+    return [(word, piece)
+            for word in self._basic_tokenizer.tokenize(text)
+            for piece in self._get_pieces(word)]
@@ -0,0 +1,81 @@
+# coding=utf-8
+# Copyright 2019 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# Lint as: python3
+
+import os
+import random
+import tempfile
+
+from absl.testing import absltest
+from tapas.utils import fast_tokenization
+from tapas.utils import tf_example_utils
+
+from official.nlp.bert import tokenization
+
+_VOCAB = [
+    '[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]', '[EMPTY]', 'un', '##aff',
+    '##able', 'a', '##a', '##b', 'ab', 'abc', '##bc', '##c', 'c', 'cafe', '##s',
+    '.', ',', '-', '1', '##1', '##2', '2', '中', 'yes', '##yes', 'ye'
+]
+_TEXTS = [
+    'unaffable', 'Unaffables', 'abcabc cab', 'abd', 'Café, cafés.', 'x1-2',
+    'a\tb\n', '中文', '', ' ', 'N/A', 'yesyes yes-ye', 'ab' * 300, 'aaaa##b',
+    'ﬁ', 'İ', '­', 'Ⅸ ab'
+]
+
+
+def _create_vocab(vocab_file):
+  with open(vocab_file, 'tw') as output_file:
+    for word in _VOCAB:
+      output_file.write(f'{word}\n')
+
+
+class FastTokenizationTest(absltest.TestCase):
+
+  def test_tokenize(self):
+    with tempfile.TemporaryDirectory() as input_dir:
+      vocab_file = os.path.join(input_dir, 'vocab.txt')
+      _create_vocab(vocab_file)
+      bert_tokenizer = tokenization.FullTokenizer(
+          vocab_file=vocab_file, do_lower_case=True)
+    tokenizer = fast_tokenization.FastWordpieceTokenizer.from_bert_tokenizer(
+        bert_tokenizer)
+    self.assertEqual(
+        tokenizer.tokenize('Unaffable abd'), [
+            ('unaffable', 'un'),
+            ('unaffable', '##aff'),
+            ('unaffable', '##able'),
+            ('abd', '[UNK]'),
+        ])
+
+  def test_parity_with_bert_backend(self):
+    with tempfile.TemporaryDirectory() as input_dir:
+      vocab_file = os.path.join(input_dir, 'vocab.txt')
+      _create_vocab(vocab_file)
+      tokenizer = tf_example_utils.TapasTokenizer(vocab_file)
+      fast_tokenizer = tf_example_utils.TapasTokenizer(
+          vocab_file, backend=tf_example_utils.TokenizerBackend.FAST)
+    rng = random.Random(0)
+    chars = 'abcy1中é-., \t#'
+    texts = list(_TEXTS)
+    for _ in range(500):
+      texts.append(''.join(
+          rng.choice(chars) for _ in range(rng.randint(0, 12))))
+    for text in texts:
+      self.assertEqual(fast_tokenizer.tokenize(text), tokenizer.tokenize(text))
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -22,8 +22,9 @@ Please note that exceptions in this module are concise and not parameterized,
 since they are used as counter names in a BEAM pipeline.
 """
 
+import collections
 import enum
-from typing import Callable, List, Text
+from typing import Callable, Dict, Hashable, List, Sequence, Text, Tuple
 
 import frozendict
 import numpy as np
@@ -40,18 +41,57 @@ class SupervisionMode(enum.Enum):
   REMOVE_ALL = 2
 
 
-def _find_matching_coordinates(table, answer_text,
-                               normalize):
-  normalized_text = normalize(answer_text)
-  for row_index, row in enumerate(table.rows):
-    for column_index, cell in enumerate(row.cells):
-      if normalized_text == normalize(cell.text):
-        yield (row_index, column_index)
+def _get_key(normalized_text):
+  # Some normalizations return token lists which can't be used as keys.
+  if isinstance(normalized_text, list):
+    return tuple(normalized_text)
+  return normalized_text
+
+
+class CellIndex:
+  """Maps the normalized cell texts of a table to the cell coordinates.
+
+  The index of a normalization function is built when it is first used, so
+  the cells are normalized once per table and not once per answer text. The
+  same index can be used for all questions of the table.
+  """
+
+  def __init__(self, table):
+    self._table = table
+    self._indexes = {}
+
+  def _get_index(
+      self, normalize
+  ):
+    index = self._indexes.get(normalize)
+    if index is None:
+      index = collections.defaultdict(list)
+      for row_index, row in enumerate(self._table.rows):
+        for column_index, cell in enumerate(row.cells):
+          index[_get_key(normalize(cell.text))].append(
+              (row_index, column_index))
+      self._indexes[normalize] = index
+    return index
+
+  def find_matching_coordinates(
+      self, answer_text,
+      normalize):
+    """Returns the coordinates of the cells that match 'answer_text'.
+
+    Args:
+      answer_text: The text to find.
+      normalize: a function that normalizes a string.
+
+    Returns:
+      The matching (row_index, column_index) pairs in row-major order.
+    """
+    return self._get_index(normalize).get(_get_key(normalize(answer_text)), [])
 
 
 def _compute_cost_matrix_inner(table,
                                answer,
-                               normalize):
+                               normalize,
+                               cell_index):
   """Returns a cost matrix M where the value M[i,j] contains a matching cost from answer i to cell j.
 
   The matrix is a binary matrix and -1 is used to indicate a possible match from
@@ -63,6 +103,7 @@ def _compute_cost_matrix_inner(table,
     table: a Table message.
     answer: an Answer message.
     normalize: a function that normalizes a string.
+    cell_index: Index of the normalized cell texts of 'table'.
 
   Raises:
     ValueError if:
@@ -80,8 +121,8 @@ def _compute_cost_matrix_inner(table,
 
   for index, answer_text in enumerate(answer.answer_texts):
     found = False
-    for row, column in _find_matching_coordinates(table, answer_text,
-                                                  normalize):
+    for row, column in cell_index.find_matching_coordinates(
+        answer_text, normalize):
       found = True
       cost_matrix[index, (row * len(table.columns)) + column] = -1
       num_candidates[row, column] += 1
@@ -97,27 +138,31 @@ def _compute_cost_matrix_inner(table,
 
 
 def _compute_cost_matrix(table,
-                         answer):
+                         answer,
+                         cell_index):
   for index, normalize_fn in enumerate(text_utils.STRING_NORMALIZATIONS):
     try:
-      return _compute_cost_matrix_inner(table, answer, normalize_fn)
+      return _compute_cost_matrix_inner(table, answer, normalize_fn,
+                                        cell_index)
     except ValueError:
       if index == len(text_utils.STRING_NORMALIZATIONS) - 1:
         raise
 
 
 def _parse_answer_coordinates(table,
-                              answer):
+                              answer,
+                              cell_index):
   """Populates answer_coordinates using answer_texts.
 
   Args:
     table: a Table message, needed to compute the answer coordinates.
     answer: an Answer message that will be modified on success.
+    cell_index: Index of the normalized cell texts of 'table'.
 
   Raises:
     ValueError if the conversion fails.
   """
-  cost_matrix = _compute_cost_matrix(table, answer)
+  cost_matrix = _compute_cost_matrix(table, answer, cell_index)
   row_indices, column_indices = scipy.optimize.linear_sum_assignment(
       cost_matrix)
   for _ in row_indices:
@@ -154,7 +199,8 @@ def _has_single_float_answer_equal_to(question,
 
 def _parse_question(table,
                     original_question,
-                    clear_fields):
+                    clear_fields,
+                    cell_index):
   """Parses question's answer_texts fields to possibly populate additional fields.
 
   Args:
@@ -162,6 +208,7 @@ def _parse_question(table,
     original_question: a Question message containing answer_texts.
     clear_fields: A list of strings indicating which fields need to be cleared
       and possibly repopulated.
+    cell_index: Index of the normalized cell texts of 'table'.
 
   Returns:
     A Question message with answer_coordinates or float_value field populated.
@@ -197,7 +244,7 @@ def _parse_question(table,
 
   if not question.answer.answer_coordinates:
     try:
-      _parse_answer_coordinates(table, question.answer)
+      _parse_answer_coordinates(table, question.answer, cell_index)
     except ValueError as exc:
       error_message += "[answer_coordinates: {}]".format(str(exc))
 
@@ -225,7 +272,8 @@ _CLEAR_FIELDS = frozendict.frozendict({
 
 
 def parse_question(table,
-                   question, mode):
+                   question, mode,
+                   cell_index = None):
   """Parses answer_text field of question to populate additional fields needed to create TF examples.
 
   Args:
@@ -233,6 +281,8 @@ def parse_question(table,
     question: a Question message, that will be modified (even on unsuccesful
       parsing).
     mode: See SupervisionMode enum for more information.
+    cell_index: Optional CellIndex of 'table'. Passing the same index for all
+      questions of a table avoids normalizing the cells for every question.
 
   Returns:
     A Question message with answer_coordinates or float_value field populated.
@@ -247,4 +297,6 @@ def parse_question(table,
   if clear_fields is None:
     raise ValueError(f"Mode {mode.name} is not supported")
 
-  return _parse_question(table, question, clear_fields)
+  if cell_index is None:
+    cell_index = CellIndex(table)
+  return _parse_question(table, question, clear_fields, cell_index)
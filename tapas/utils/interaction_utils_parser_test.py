@@ -18,6 +18,7 @@ from absl.testing import absltest
 from absl.testing import parameterized
 from tapas.protos import interaction_pb2
 from tapas.utils import interaction_utils_parser
+from tapas.utils import text_utils
 from google.protobuf import text_format
 
 
@@ -255,6 +256,42 @@ class InteractionUtilsParserTest(parameterized.TestCase):
     _set_float32_safe_answer(expected_answer)
     self.assertEqual(expected_answer, question.answer)
 
+  def test_shared_cell_index(self):
+    interaction = text_format.Parse(
+        """
+      table {
+        columns { text: "Column0" }
+        columns { text: "Column1" }
+        rows {
+          cells { text: "A" }
+          cells { text: "b c" }
+        }
+        rows {
+          cells { text: "d" }
+          cells { text: "E." }
+        }
+      }
+      questions { answer { answer_texts: "a" } }
+      questions { answer { answer_texts: "b  c" } }
+      questions { answer { answer_texts: "e" } }""",
+        interaction_pb2.Interaction())
+
+    cell_index = interaction_utils_parser.CellIndex(interaction.table)
+    for question in interaction.questions:
+      expected_question = interaction_utils_parser.parse_question(
+          interaction.table, question, _Mode.REMOVE_ALL)
+      actual_question = interaction_utils_parser.parse_question(
+          interaction.table, question, _Mode.REMOVE_ALL, cell_index=cell_index)
+      self.assertEqual(expected_question, actual_question)
+
+    self.assertEqual(
+        cell_index.find_matching_coordinates("b  c",
+                                             text_utils.tokenize_string),
+        [(0, 1)])
+    self.assertEqual(
+        cell_index.find_matching_coordinates("e", text_utils.wtq_normalize),
+        [(1, 1)])
+
 
 if __name__ == "__main__":
   absltest.main()
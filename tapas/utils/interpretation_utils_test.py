@@ -16,6 +16,7 @@
 # coding=utf8
 
 import random
+from unittest import mock
 
 from absl.testing import absltest
 from absl.testing import parameterized
@@ -79,10 +80,11 @@ class InterpretationUtilsTest(parameterized.TestCase, absltest.TestCase):
         [[1.0, 3.0, 6.0], [2.0, 0.0, None], [1.0, None, 0.0]], 3.0)
     rng = random.Random(seed)
 
-    interpretation_utils._MAX_INDICES_TO_EXPLORE = 1
+    with mock.patch.object(interpretation_utils, '_MAX_ROWS_TO_SEARCH', 1):
+      interpretation_utils._MAX_INDICES_TO_EXPLORE = 1
 
-    actual = interpretation_utils.find_candidates(rng, interaction.table,
-                                                  interaction.questions[0])
+      actual = interpretation_utils.find_candidates(rng, interaction.table,
+                                                    interaction.questions[0])
     expected = [
         _Candidate(_AggFun.COUNT, 0, (0, 1, 2)),
         _Candidate(_AggFun.COUNT, 1, (0, 1, 2)),
@@ -106,6 +108,29 @@ class InterpretationUtilsTest(parameterized.TestCase, absltest.TestCase):
     expected = [_Candidate(_AggFun.NONE, 2, (1,))]
     self.assertEqual(expected, actual)
 
+  @parameterized.parameters((0,), (1,), (2,))
+  def test_find_correct_subsets(self, seed):
+    rng = random.Random(seed)
+    values = [float(rng.randint(-5, 10)) for _ in range(12)]
+    indices = list(range(len(values)))
+
+    def _is_correct(subset, values):
+      return abs(sum(values[i] for i in subset) / len(subset) - 2.0) < 1.0e-2
+
+    def _get_window(length):
+      return 2.0 * length, 1.0e-2 * length
+
+    expected = interpretation_utils.get_correct_powerset(
+        indices, values, _is_correct)
+    actual = interpretation_utils.find_correct_subsets(
+        indices, values, _is_correct, _get_window, max_num_subsets=10000)
+    self.assertEqual(expected, actual)
+
+    actual = interpretation_utils.find_correct_subsets(
+        indices, values, _is_correct, _get_window, max_num_subsets=3)
+    self.assertLen(actual, 3)
+    self.assertContainsSubset(actual, expected)
+
 
 if __name__ == "__main__":
   absltest.main()
@@ -0,0 +1,44 @@
+# coding=utf-8
+# Copyright 2019 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# Lint as: python3
+"""Adds numeric annotations to files of interactions.
+
+Kept separate from number_annotation_utils so that the annotation logic
+doesn't depend on TensorFlow.
+"""
+
+from tapas.protos import interaction_pb2
+from tapas.utils import number_annotation_utils
+import tensorflow.compat.v1 as tf
+
+
+def add_numeric_values_to_file(input_file, output_file):
+  """Reads interactions from a TF record file, annotates and writes them.
+
+  Each distinct table is parsed once, see
+  `number_annotation_utils.add_numeric_values_to_interactions`.
+
+  Args:
+    input_file: TF record file of interactions.
+    output_file: TF record file of the annotated interactions.
+  """
+  interactions = (
+      interaction_pb2.Interaction.FromString(value)
+      for value in tf.python_io.tf_record_iterator(input_file))
+  interactions = number_annotation_utils.add_numeric_values_to_interactions(
+      interactions)
+  with tf.io.TFRecordWriter(output_file) as writer:
+    for interaction in interactions:
+      writer.write(interaction.SerializeToString())
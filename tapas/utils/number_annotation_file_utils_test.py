@@ -0,0 +1,63 @@
+# coding=utf-8
+# Copyright 2019 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# Lint as: python3
+
+import os
+import tempfile
+
+from absl.testing import absltest
+from tapas.protos import interaction_pb2
+from tapas.utils import number_annotation_file_utils
+from tapas.utils import number_annotation_utils
+import tensorflow.compat.v1 as tf
+
+from google.protobuf import text_format
+
+
+class AddNumericValuesToFileTest(absltest.TestCase):
+
+  def test_add_numeric_values_to_file(self):
+    interaction = text_format.Parse(
+        """
+          table {
+            columns { text: 'Number' }
+            rows { cells { text: '1' } }
+            rows { cells { text: '2' } }
+          }
+          questions { original_text: 'Is it 2?' }""",
+        interaction_pb2.Interaction())
+    expected_interaction = interaction_pb2.Interaction()
+    expected_interaction.CopyFrom(interaction)
+    number_annotation_utils.add_numeric_values(expected_interaction)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+      input_file = os.path.join(output_dir, 'input.tfrecord')
+      output_file = os.path.join(output_dir, 'output.tfrecord')
+      with tf.io.TFRecordWriter(input_file) as writer:
+        writer.write(interaction.SerializeToString())
+        writer.write(interaction.SerializeToString())
+      number_annotation_file_utils.add_numeric_values_to_file(
+          input_file, output_file)
+      actual_interactions = [
+          interaction_pb2.Interaction.FromString(value)
+          for value in tf.python_io.tf_record_iterator(output_file)
+      ]
+
+    self.assertEqual(actual_interactions,
+                     [expected_interaction, expected_interaction])
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -16,11 +16,13 @@
 """Helper functions for handling numeric Quik annotations and relations."""
 
 import collections
+import hashlib
 import itertools
 from typing import Text, Union, Tuple, Iterable, List, Any, Dict, Callable, Optional, Set
 from absl import logging
 from tapas.protos import interaction_pb2
 
+from tapas.utils import cache_utils
 from tapas.utils import constants
 from tapas.utils import number_utils
 from tapas.utils import text_utils
@@ -32,6 +34,11 @@ _PrimitiveNumericValue = Union[
 _SortKeyFn = Callable[[interaction_pb2.NumericValue], Tuple[float, Ellipsis]]
 
 _DATE_TUPLE_SIZE = 3
+_MAX_ANNOTATED_TABLES = 1024
+_MAX_PARSED_TEXTS = 100000
+# Consolidated numeric values of a table as (row_index, col_index, value).
+_TableNumericValues = Tuple[Tuple[int, int, interaction_pb2.NumericValue],
+                            Ellipsis]
 
 
 def _get_value_type(numeric_value):
@@ -122,14 +129,26 @@ def get_numeric_sort_key_fn(
   return _sort_key_fn
 
 
+def _get_first_values_by_type(
+    numeric_values
+):
+  """Returns the first value of every type in 'numeric_values'."""
+  first_values = {}
+  for value in numeric_values:
+    first_values.setdefault(_get_value_type(value), value)
+  return first_values
+
+
 def _consolidate_numeric_values(
-    row_index_to_values,
+    cell_texts,
+    text_to_values,
     min_consolidation_fraction,
     debug_info):
   """Finds the most common numeric values in a column and returns them.
 
   Args:
-   row_index_to_values: For each row index all the values in that cell.
+   cell_texts: The text of every cell in the column.
+   text_to_values: Maps every cell text to the first value of each type in it.
    min_consolidation_fraction: Fraction of cells that need to have consolidated
      value.
    debug_info: Additional information only used for logging.
@@ -139,15 +158,18 @@ def _consolidate_numeric_values(
    Rows that don't have a matching value are dropped. Empty list if values can't
    be consolidated.
   """
+  # Cells with the same text have the same types, so every distinct text is
+  # only counted once.
   type_counts = collections.Counter()
-  for numeric_values in row_index_to_values.values():
-    type_counts.update(_get_all_types(numeric_values))
+  for text, count in collections.Counter(cell_texts).items():
+    for value_type in text_to_values[text]:
+      type_counts[value_type] += count
   if not type_counts:
     return {}
   max_count = max(type_counts.values())
-  if max_count < len(row_index_to_values) * min_consolidation_fraction:
+  if max_count < len(cell_texts) * min_consolidation_fraction:
     logging.log_every_n(logging.INFO, 'Can\'t consolidate types: %s %s %d', 100,
-                        debug_info, row_index_to_values, max_count)
+                        debug_info, cell_texts, max_count)
     return {}
 
   valid_types = set()
@@ -161,31 +183,33 @@ def _consolidate_numeric_values(
     max_type = next(iter(valid_types))
 
   new_row_index_to_value = {}
-  for index, values in row_index_to_values.items():
-    # Extract the first matching value.
-    for value in values:
-      if _get_value_type(value) == max_type:
-        new_row_index_to_value[index] = value
-        break
+  for index, text in enumerate(cell_texts):
+    value = text_to_values[text].get(max_type)
+    if value is not None:
+      new_row_index_to_value[index] = value
 
   return new_row_index_to_value
 
 
-def _get_numeric_values(text):
-  """Parses text and returns numeric values."""
-  numeric_spans = number_utils.parse_text(text)
-  return itertools.chain(*(span.values for span in numeric_spans))
+def _parse_text(
+    text, text_cache
+):
+  """Returns the numeric value spans of a normalized text.
+
+  Args:
+    text: Normalized text, see text_utils.normalize_for_match.
+    text_cache: Optional cache mapping texts to their spans. The cached protos
+      are never modified, callers have to copy them.
+  """
+  if text_cache is None:
+    return number_utils.parse_text(text)
+  return text_cache.get(text, lambda _: tuple(number_utils.parse_text(text)))
 
 
-def _get_column_values(
-    table,
-    col_index):
-  """Parses text in column and returns a dict mapping row_index to values."""
-  index_to_values = {}
-  for row_index, row in enumerate(table.rows):
-    text = text_utils.normalize_for_match(row.cells[col_index].text)
-    index_to_values[row_index] = list(_get_numeric_values(text))
-  return index_to_values
+def _get_numeric_values(text, text_cache = None):
+  """Parses text and returns numeric values."""
+  numeric_spans = _parse_text(text, text_cache)
+  return itertools.chain(*(span.values for span in numeric_spans))
 
 
 def get_numeric_relation(
@@ -204,9 +228,44 @@ def get_numeric_relation(
   return None
 
 
+def _get_table_key(table,
+                   min_consolidation_fraction):
+  """Fingerprint of the cell texts, the only input of the numeric values."""
+  cell_texts = [[cell.text for cell in row.cells] for row in table.rows]
+  text = repr((min_consolidation_fraction, len(table.columns), cell_texts))
+  return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _get_numeric_table_values(
+    table, min_consolidation_fraction,
+    debug_info,
+    text_cache = None):
+  """Parses text in table column-wise and returns the consolidated values."""
+  # Every distinct cell text of the table is only normalized and parsed once.
+  text_to_values = {}
+  numeric_values = []
+  for col_index, column in enumerate(table.columns):
+    cell_texts = [row.cells[col_index].text for row in table.rows]
+    for text in cell_texts:
+      if text not in text_to_values:
+        text_to_values[text] = _get_first_values_by_type(
+            _get_numeric_values(
+                text_utils.normalize_for_match(text), text_cache))
+    column_values = _consolidate_numeric_values(
+        cell_texts,
+        text_to_values,
+        min_consolidation_fraction=min_consolidation_fraction,
+        debug_info=(debug_info, column))
+    for row_index, numeric_value in column_values.items():
+      numeric_values.append((row_index, col_index, numeric_value))
+  return tuple(numeric_values)
+
+
 def add_numeric_table_values(table,
                              min_consolidation_fraction=0.7,
-                             debug_info = None):
+                             debug_info = None,
+                             table_cache = None,
+                             text_cache = None):
   """Parses text in table column-wise and adds the consolidated values.
 
   Consolidation refers to finding values with a common types (date or number).
@@ -216,32 +275,81 @@ def add_numeric_table_values(table,
    min_consolidation_fraction: Fraction of cells in a column that need to have
      consolidated value.
    debug_info: Additional information used for logging.
+   table_cache: Optional cache mapping table fingerprints to the consolidated
+     values. Tables with the same cell texts are only parsed once.
+   text_cache: Optional cache mapping normalized cell texts to their numeric
+     value spans.
   """
   for row in table.rows:
     for cell in row.cells:
       cell.ClearField('numeric_value')
 
-  for col_index, column in enumerate(table.columns):
-    column_values = _consolidate_numeric_values(
-        _get_column_values(table, col_index),
-        min_consolidation_fraction=min_consolidation_fraction,
-        debug_info=(debug_info, column))
+  if table_cache is None:
+    numeric_values = _get_numeric_table_values(table,
+                                               min_consolidation_fraction,
+                                               debug_info, text_cache)
+  else:
+    numeric_values = table_cache.get(
+        _get_table_key(table, min_consolidation_fraction),
+        lambda _: _get_numeric_table_values(table, min_consolidation_fraction,
+                                            debug_info, text_cache))
+
+  # The cached protos are never modified, the cells receive copies.
+  for row_index, col_index, numeric_value in numeric_values:
+    table.rows[row_index].cells[col_index].numeric_value.CopyFrom(
+        numeric_value)
 
-    for row_index, numeric_value in column_values.items():
-      table.rows[row_index].cells[col_index].numeric_value.CopyFrom(
-          numeric_value)
 
+def add_numeric_values_to_questions(
+    interaction,
+    text_cache = None):
+  """Adds numeric value spans to all questions.
 
-def add_numeric_values_to_questions(interaction
-                                   ):
-  """Adds numeric value spans to all questions."""
+  Args:
+   interaction: Interaction with questions to annotate.
+   text_cache: Optional cache mapping normalized texts to their numeric value
+     spans.
+  """
   for question in interaction.questions:
     question.text = text_utils.normalize_for_match(question.original_text)
     question.annotations.CopyFrom(
         interaction_pb2.NumericValueSpans(
-            spans=number_utils.parse_text(question.text)))
+            spans=_parse_text(question.text, text_cache)))
 
 
-def add_numeric_values(interaction):
-  add_numeric_table_values(interaction.table)
-  add_numeric_values_to_questions(interaction)
+def add_numeric_values(interaction,
+                       table_cache = None,
+                       text_cache = None):
+  add_numeric_table_values(
+      interaction.table, table_cache=table_cache, text_cache=text_cache)
+  add_numeric_values_to_questions(interaction, text_cache=text_cache)
+
+
+def add_numeric_values_to_interactions(
+    interactions,
+    table_cache = None,
+    text_cache = None,
+):
+  """Adds numeric values to all interactions and yields them.
+
+  Interactions are modified in place. Tables that occur in several
+  interactions, e.g. in SQA where every table is used by many sequences, are
+  only parsed once.
+
+  Args:
+   interactions: Interactions to annotate.
+   table_cache: Cache of numeric table values, a new cache is used if None.
+   text_cache: Cache of parsed texts, a new cache is used if None.
+
+  Yields:
+   The annotated interactions.
+  """
+  if table_cache is None:
+    table_cache = cache_utils.LruCache(max_size=_MAX_ANNOTATED_TABLES)
+  if text_cache is None:
+    text_cache = cache_utils.LruCache(max_size=_MAX_PARSED_TEXTS)
+  for interaction in interactions:
+    add_numeric_values(
+        interaction, table_cache=table_cache, text_cache=text_cache)
+    yield interaction
+
@@ -17,6 +17,7 @@
 from absl.testing import absltest
 from absl.testing import parameterized
 from tapas.protos import interaction_pb2
+from tapas.utils import cache_utils
 from tapas.utils import number_annotation_utils
 from google.protobuf import text_format
 
@@ -63,7 +64,18 @@ class AddNumericTableValuesTest(parameterized.TestCase):
                                  (2, 1, '2001')], [(1, {
                                      1: _date(year=2000),
                                      2: _date(year=2001)
-                                 })], 0.5))
+                                 })], 0.5),
+      # Cells with the same text are counted and annotated individually.
+      ('repeated_values', [(0, 1, '2'), (2, 1, '2')], [(1, {
+          0: _number(2),
+          1: _number(2),
+          2: _number(2)
+      })], 0.7),
+      ('repeated_date_values', [(0, 1, ''), (1, 1, '2000'),
+                                (2, 1, '2000')], [(1, {
+                                    1: _date(year=2000),
+                                    2: _date(year=2000)
+                                })], 0.5))
   def test_table_values(self, row_updates, expected_updates,
                         min_consolidation_fraction):
 
@@ -214,6 +226,91 @@ class AddNumericValuesTest(parameterized.TestCase):
 
     self.assertEqual(expected_interaction, actual_interaction)
 
+  def test_add_numeric_values_with_table_cache(self):
+    interaction = text_format.Parse(
+        """
+          table {
+            columns { text: 'Name' }
+            columns { text: 'Number' }
+            rows {
+              cells { text: 'A' }
+              cells { text: '1' }
+            }
+            rows {
+              cells { text: 'B' }
+              cells { text: '2' }
+            }
+            rows {
+              cells { text: 'C' }
+              cells { text: '3' }
+            }
+          }
+          questions { original_text: 'Is A 3?' }""",
+        interaction_pb2.Interaction())
+    other_interaction = interaction_pb2.Interaction()
+    other_interaction.CopyFrom(interaction)
+    other_interaction.table.rows[2].cells[1].text = '4'
+
+    expected_interactions = []
+    for value in [interaction, interaction, other_interaction]:
+      expected_interaction = interaction_pb2.Interaction()
+      expected_interaction.CopyFrom(value)
+      number_annotation_utils.add_numeric_values(expected_interaction)
+      expected_interactions.append(expected_interaction)
+
+    table_cache = cache_utils.LruCache(max_size=2)
+    actual_interactions = []
+    for value in [interaction, interaction, other_interaction]:
+      actual_interaction = interaction_pb2.Interaction()
+      actual_interaction.CopyFrom(value)
+      actual_interactions.append(actual_interaction)
+    actual_interactions = list(
+        number_annotation_utils.add_numeric_values_to_interactions(
+            actual_interactions, table_cache=table_cache))
+
+    self.assertEqual(expected_interactions, actual_interactions)
+    self.assertEqual(table_cache.hits, 1)
+    self.assertEqual(table_cache.misses, 2)
+    self.assertEqual(actual_interactions[2].table.rows[2].cells[1]
+                     .numeric_value.float_value, 4.0)
+
+  def test_add_numeric_values_with_text_cache(self):
+    interaction = text_format.Parse(
+        """
+          table {
+            columns { text: 'Name' }
+            columns { text: 'Number' }
+            rows {
+              cells { text: 'A' }
+              cells { text: '1' }
+            }
+            rows {
+              cells { text: 'B' }
+              cells { text: '1' }
+            }
+          }
+          questions { original_text: 'Is A 1?' }""",
+        interaction_pb2.Interaction())
+    expected_interaction = interaction_pb2.Interaction()
+    expected_interaction.CopyFrom(interaction)
+    number_annotation_utils.add_numeric_values(expected_interaction)
+
+    text_cache = cache_utils.LruCache(max_size=10)
+    for _ in range(2):
+      actual_interaction = interaction_pb2.Interaction()
+      actual_interaction.CopyFrom(interaction)
+      number_annotation_utils.add_numeric_values(
+          actual_interaction, text_cache=text_cache)
+      self.assertEqual(expected_interaction, actual_interaction)
+      # Modifying the annotations must not modify the cached values.
+      actual_interaction.questions[0].annotations.spans[0].values[
+          0].float_value = 2.0
+      actual_interaction.table.rows[0].cells[1].numeric_value.float_value = 2.0
+
+    # 'a', '1', 'b' and 'is a 1?' are parsed once.
+    self.assertEqual(text_cache.misses, 4)
+    self.assertEqual(text_cache.hits, 4)
+
 
 if __name__ == '__main__':
   absltest.main()
@@ -26,7 +26,6 @@ import re
 from typing import Text, Tuple, List, Optional
 
 from tapas.protos import interaction_pb2
-from tapas.utils import text_utils
 
 
 # Constants for parsing date expressions.
@@ -39,7 +38,7 @@ _YEAR_MONTH_DAY = _DateMask(True, True, True)
 _MONTH = _DateMask(False, True, False)
 _MONTH_DAY = _DateMask(False, True, True)
 
-# Pairs of patterns to pass to 'datetime.strptime' and masks specifying which
+# Pairs of 'datetime.strptime' style patterns and masks specifying which
 # fields will be set by the corresponding pattern.
 _DATE_PATTERNS = (('%B', _MONTH), ('%Y', _YEAR), ('%Ys', _YEAR),
                   ('%b %Y', _YEAR_MONTH), ('%B %Y', _YEAR_MONTH),
@@ -53,33 +52,74 @@ _DATE_PATTERNS = (('%B', _MONTH), ('%Y', _YEAR), ('%Ys', _YEAR),
                   ('%d.%m.%Y', _YEAR_MONTH_DAY),
                   ('%A, %b %d', _MONTH_DAY), ('%A, %B %d', _MONTH_DAY))
 
-# This mapping is used to convert date patterns to regex patterns.
-_FIELD_TO_REGEX = (
-    ('%A', r'\w+'),  # Weekday as locale’s full name.
-    ('%B', r'\w+'),  # Month as locale’s full name.
-    ('%Y', r'\d{4}'),  #  Year with century as a decimal number.
-    ('%b', r'\w{3}'),  # Month as locale’s abbreviated name.
-    ('%d', r'\d{1,2}'),  # Day of the month as a zero-padded decimal number.
-    ('%m', r'\d{1,2}'),  # Month as a zero-padded decimal number.
+_MONTH_NAMES = ('january', 'february', 'march', 'april', 'may', 'june', 'july',
+                'august', 'september', 'october', 'november', 'december')
+_MONTH_ABBREVIATIONS = tuple(name[:3] for name in _MONTH_NAMES)
+_WEEKDAY_NAMES = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday',
+                  'saturday', 'sunday')
+
+# Maps lower case month names and abbreviations to the month number.
+_MONTH_NAME_TO_MONTH = {
+    name: month + 1 for month, name in enumerate(_MONTH_NAMES)
+}
+_MONTH_ABBREVIATION_TO_MONTH = {
+    name: month + 1 for month, name in enumerate(_MONTH_ABBREVIATIONS)
+}
+
+
+def _get_names_regex(names):
+  # Like strptime names are matched case-insensitively, longest name first.
+  return '(?i:%s)' % '|'.join(sorted(names, key=len, reverse=True))
+
+
+# Regexes of the fields. They accept the same texts as 'datetime.strptime'
+# except that single digit days can't be preceded by a space.
+_FIELD_TO_STRICT_REGEX = (
+    ('%A', r'(?P<A>%s)' % _get_names_regex(_WEEKDAY_NAMES)),
+    ('%B', r'(?P<B>%s)' % _get_names_regex(_MONTH_NAMES)),
+    ('%Y', r'(?P<Y>\d\d\d\d)'),
+    ('%b', r'(?P<b>%s)' % _get_names_regex(_MONTH_ABBREVIATIONS)),
+    ('%d', r'(?P<d>3[01]|[12]\d|0[1-9]|[1-9])'),
+    ('%m', r'(?P<m>1[0-2]|0[1-9]|[1-9])'),
 )
 
+_DIGIT_FIELDS = ('%Y', '%d', '%m')
+
+_ProcessedDatePattern = collections.namedtuple(
+    '_ProcessedDatePattern', ['pattern', 'mask', 'regex', 'num_words'])
+
 
 def _process_date_pattern(dp):
-  """Compute a regex for each date pattern to use as a prefilter."""
+  """Computes a regex that parses the date pattern without strptime."""
   pattern, mask = dp
   regex = pattern
   regex = regex.replace('.', re.escape('.'))
   regex = regex.replace('-', re.escape('-'))
   regex = regex.replace(' ', r'\s+')
-  for field, field_regex in _FIELD_TO_REGEX:
+  for field, field_regex in _FIELD_TO_STRICT_REGEX:
     regex = regex.replace(field, field_regex)
   # Make sure we didn't miss any of the fields.
   assert '%' not in regex, regex
-  return pattern, mask, re.compile('^' + regex + '$')
+  # Every field is a single word and fields are separated by punctuation.
+  num_words = pattern.count('%')
+  return _ProcessedDatePattern(pattern, mask, re.compile(regex), num_words)
 
 
 def _process_date_patterns():
-  return tuple(_process_date_pattern(dp) for dp in _DATE_PATTERNS)
+  """Groups the date patterns by number of words and presence of digits.
+
+  Returns:
+    Maps (number of words, whether the text contains a digit) to the patterns
+    that can match such a text, in the order of '_DATE_PATTERNS'.
+  """
+  patterns = collections.defaultdict(list)
+  for dp in _DATE_PATTERNS:
+    processed_pattern = _process_date_pattern(dp)
+    num_words = processed_pattern.num_words
+    patterns[num_words, True].append(processed_pattern)
+    if not any(field in dp[0] for field in _DIGIT_FIELDS):
+      patterns[num_words, False].append(processed_pattern)
+  return {key: tuple(value) for key, value in patterns.items()}
 
 
 _PROCESSED_DATE_PATTERNS = _process_date_patterns()
@@ -98,10 +138,22 @@ _ORDINAL_WORDS = [
     'eighth', 'ninth', 'tenth', 'eleventh', 'twelfth'
 ]
 
+_NUMBER_WORD_TO_VALUE = {
+    word: float(number) for number, word in enumerate(_NUMBER_WORDS)
+}
+_ORDINAL_WORD_TO_VALUE = {
+    word: float(number) for number, word in enumerate(_ORDINAL_WORDS)
+}
+
 _ORDINAL_SUFFIXES = ['st', 'nd', 'rd', 'th']
 
 _NUMBER_PATTERN = re.compile(r'((^|\s)[+-])?((\.\d+)|(\d+(,\d\d\d)*(\.\d*)?))')
 
+# Matches the same words as 'text_utils.get_all_spans', i.e. maximal runs of
+# characters for which 'str.isalnum' is true.
+_WORD_PATTERN = re.compile(r'[^\W_]+')
+_DIGIT_PATTERN = re.compile(r'\d')
+
 # Following DynSp:
 # https://github.com/Microsoft/DynSP/blob/master/util.py#L293.
 _MIN_YEAR = 1700
@@ -135,19 +187,60 @@ def _get_numeric_value_from_float(value):
   return interaction_pb2.NumericValue(float_value=value)
 
 
+def _get_date_from_match(match):
+  """Converts a match of a processed date pattern to a date.
+
+  Missing fields default to the values used by 'datetime.strptime'.
+
+  Args:
+    match: Match of the regex of a '_ProcessedDatePattern'.
+
+  Returns:
+    The date.
+
+  Raises:
+    ValueError: If the date doesn't exist.
+  """
+  fields = match.groupdict()
+  year = int(fields['Y']) if fields.get('Y') is not None else 1900
+  month = 1
+  if fields.get('m') is not None:
+    month = int(fields['m'])
+  elif fields.get('B') is not None:
+    month = _MONTH_NAME_TO_MONTH[fields['B'].lower()]
+  elif fields.get('b') is not None:
+    month = _MONTH_ABBREVIATION_TO_MONTH[fields['b'].lower()]
+  day = int(fields['d']) if fields.get('d') is not None else 1
+  return datetime.date(year, month, day)
+
+
 # Doesn't parse ordinal expressions such as '18th of february 1655'.
-def _parse_date(text):
-  """Attempts to format a text as a standard date string (yyyy-mm-dd)."""
+def _parse_date(text, num_words,
+                has_digit):
+  """Attempts to parse a text as a date.
+
+  Args:
+    text: Text to parse.
+    num_words: Number of words in the text, see '_WORD_PATTERN'.
+    has_digit: Whether the text contains a digit.
+
+  Returns:
+    The date or None.
+  """
+  patterns = _PROCESSED_DATE_PATTERNS.get((num_words, has_digit))
+  if not patterns:
+    return None
   text = re.sub(r'Sept\b', 'Sep', text)
-  for in_pattern, mask, regex in _PROCESSED_DATE_PATTERNS:
-    if not regex.match(text):
+  for processed_pattern in patterns:
+    match = processed_pattern.regex.fullmatch(text)
+    if match is None:
       continue
     try:
-      date = datetime.datetime.strptime(text, in_pattern).date()
-    except ValueError:
+      date = _get_date_from_match(match)
+    except (KeyError, ValueError):
       continue
     try:
-      return _get_numeric_value_from_date(date, mask)
+      return _get_numeric_value_from_date(date, processed_pattern.mask)
     except ValueError:
       continue
   return None
@@ -187,33 +280,43 @@ def parse_text(text):
     if number is not None:
       span_dict[match.span()].append(_get_numeric_value_from_float(number))
 
-  for begin_index, end_index in text_utils.get_all_spans(
-      text, max_ngram_length=1):
+  words = [match.span() for match in _WORD_PATTERN.finditer(text)]
+  # Number of words with a digit before every word.
+  digit_counts = [0]
+  for begin_index, end_index in words:
+    has_digit = _DIGIT_PATTERN.search(text, begin_index, end_index) is not None
+    digit_counts.append(digit_counts[-1] + has_digit)
+
+  for word_index, (begin_index, end_index) in enumerate(words):
     if (begin_index, end_index) in span_dict:
       continue
     span_text = text[begin_index:end_index]
 
-    number = _parse_number(span_text)
-    if number is not None:
-      span_dict[begin_index, end_index].append(
-          _get_numeric_value_from_float(number))
-    for number, word in enumerate(_NUMBER_WORDS):
-      if span_text == word:
+    # Texts without digits are never parsed as finite numbers.
+    if digit_counts[word_index + 1] > digit_counts[word_index]:
+      number = _parse_number(span_text)
+      if number is not None:
         span_dict[begin_index, end_index].append(
-            _get_numeric_value_from_float(float(number)))
-        break
-    for number, word in enumerate(_ORDINAL_WORDS):
-      if span_text == word:
+            _get_numeric_value_from_float(number))
+    for word_to_value in (_NUMBER_WORD_TO_VALUE, _ORDINAL_WORD_TO_VALUE):
+      number = word_to_value.get(span_text)
+      if number is not None:
         span_dict[begin_index, end_index].append(
-            _get_numeric_value_from_float(float(number)))
-        break
-
-  for begin_index, end_index in text_utils.get_all_spans(
-      text, max_ngram_length=_MAX_DATE_NGRAM_SIZE):
-    span_text = text[begin_index:end_index]
-    date = _parse_date(span_text)
-    if date is not None:
-      span_dict[begin_index, end_index].append(date)
+            _get_numeric_value_from_float(number))
+
+  # All ngrams of up to '_MAX_DATE_NGRAM_SIZE' words.
+  for end_word_index in range(len(words)):
+    for begin_word_index in range(
+        max(0, end_word_index - _MAX_DATE_NGRAM_SIZE + 1), end_word_index + 1):
+      begin_index = words[begin_word_index][0]
+      end_index = words[end_word_index][1]
+      date = _parse_date(
+          text[begin_index:end_index],
+          num_words=end_word_index - begin_word_index + 1,
+          has_digit=digit_counts[end_word_index + 1] >
+          digit_counts[begin_word_index])
+      if date is not None:
+        span_dict[begin_index, end_index].append(date)
 
   spans = sorted(
       span_dict.items(),
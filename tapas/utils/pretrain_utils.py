@@ -21,13 +21,17 @@ from typing import Iterable, Tuple, Text, Optional, List, Union
 import apache_beam as beam
 
 from tapas.protos import interaction_pb2
+from tapas.utils import cache_utils
 from tapas.utils import number_annotation_utils
 from tapas.utils import tf_example_utils
+from tapas.utils import timing_utils
 import tensorflow.compat.v1 as tf
 
 from google.protobuf import text_format
 
 _NS = "main"
+_MAX_TOKENIZED_TABLES = 128
+_MAX_TOKENIZED_TEXTS = 100000
 _KeyInteraction = Tuple[Text, interaction_pb2.Interaction]
 _KeyInteractionTable = Tuple[Text, Tuple[interaction_pb2.Interaction,
                                          Optional[interaction_pb2.Table]]]
@@ -120,15 +124,60 @@ def _parse_interaction(text_proto_line):
   return (interaction.id, interaction)
 
 
+def _report_stage(stage, seconds):
+  beam.metrics.Metrics.distribution(_NS, f"Stage {stage} (us)").update(
+      int(seconds * 1e6))
+
+
 class ToTensorflowExample(beam.DoFn):
   """Class for converting pretraining examples."""
 
-  def __init__(self, config):
+  def __init__(self, config, time_stages = False):
+    """Initializes the DoFn.
+
+    Args:
+      config: Conversion options.
+      time_stages: If true, the duration of every conversion stage is reported
+        as a distribution metric in microseconds.
+    """
     self._config = config
+    self._time_stages = time_stages
+
+  def setup(self):
+    # The caches are kept for the lifetime of the DoFn instance so that they
+    # are reused across bundles.
+    self._table_cache = cache_utils.LruCache(max_size=_MAX_TOKENIZED_TABLES)
+    self._token_cache = cache_utils.LruCache(max_size=_MAX_TOKENIZED_TEXTS)
+    self._stage_timer = None
+    if self._time_stages:
+      self._stage_timer = timing_utils.StageTimer(report_fn=_report_stage)
+    self._converter = tf_example_utils.ToPretrainingTensorflowExample(
+        self._config,
+        table_cache=self._table_cache,
+        token_cache=self._token_cache,
+        stage_timer=self._stage_timer)
+
+  def _get_counts(self):
+    """Returns the current values of the cache and stage counters."""
+    counts = {}
+    for name, cache in [("Table", self._table_cache),
+                        ("Token", self._token_cache)]:
+      counts[f"{name} cache hits"] = cache.hits
+      counts[f"{name} cache misses"] = cache.misses
+    if self._stage_timer is not None:
+      for name, value in self._stage_timer.get_stats()["counters"].items():
+        counts[f"Stage counter {name}"] = value
+    return counts
 
   def start_bundle(self):
-    self._converter = tf_example_utils.ToPretrainingTensorflowExample(
-        self._config)
+    self._bundle_start_counts = self._get_counts()
+
+  def finish_bundle(self):
+    # The counters accumulate across bundles, only the increase of this bundle
+    # is reported.
+    for name, value in self._get_counts().items():
+      beam.metrics.Metrics.counter(_NS, name).inc(
+          value - self._bundle_start_counts.get(name, 0))
 
   def process(
       self,
@@ -212,6 +261,7 @@ def build_pretrain_data_pipeline(
     dupe_factor,
     min_num_rows,
     min_num_columns,
+    time_stages = False,
 ):
   """Maps pre-training interactions to TF examples."""
 
@@ -232,7 +282,8 @@ def build_pretrain_data_pipeline(
         | "AddNumericValues" >> beam.Map(add_numeric_values_fn)
         | "Duplicate" >> beam.FlatMap(duplicate_fn, dupe_factor)
         | "PairWithNone" >> beam.FlatMap(pair_with_none_fn)
-        | "ToTensorflowExample" >> beam.ParDo(ToTensorflowExample(config))
+        | "ToTensorflowExample" >> beam.ParDo(
+            ToTensorflowExample(config, time_stages=time_stages))
         | "DropKey" >> beam.Map(lambda id_ex: id_ex[1])
         | "Post-Shuffle" >> beam.transforms.util.Reshuffle())
 
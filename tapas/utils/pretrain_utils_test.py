@@ -21,12 +21,15 @@ from absl import flags
 from absl.testing import absltest
 from absl.testing import parameterized
 
+from tapas.protos import interaction_pb2
 from tapas.utils import beam_runner
 from tapas.utils import pretrain_utils
 from tapas.utils import tf_example_utils
 
 import tensorflow.compat.v1 as tf
 
+from google.protobuf import text_format
+
 FLAGS = flags.FLAGS
 TEST_PATH = "tapas/utils/testdata/"
 
@@ -90,6 +93,46 @@ class CreatePretrainingDataTest(parameterized.TestCase):
             read_examples(os.path.join(temp_dir, f"{name}.tfrecord")))
         self.assertLen(examples, expected_len)
 
+  def test_caches_are_kept_across_bundles(self):
+    with tempfile.TemporaryDirectory() as temp_dir:
+      vocab_path = os.path.join(temp_dir, "vocab.txt")
+      self._create_vocab(list(_RESERVED_SYMBOLS) + ["released"], vocab_path)
+      interaction = text_format.Parse(
+          """
+          id: "a"
+          table {
+            columns { text: "released" }
+            rows { cells { text: "released" } }
+          }
+          questions { original_text: "released" }""",
+          interaction_pb2.Interaction())
+
+      to_example = pretrain_utils.ToTensorflowExample(
+          tf_example_utils.PretrainConversionConfig(
+              vocab_file=vocab_path,
+              max_seq_length=10,
+              max_predictions_per_seq=10,
+              random_seed=5,
+              masked_lm_prob=0.5,
+              max_column_id=3,
+              max_row_id=3,
+              min_question_length=1,
+              max_question_length=4,
+              always_continue_cells=True,
+              strip_column_names=False))
+      to_example.setup()
+      token_cache_misses = []
+      for key in ["a_0", "a_1"]:
+        to_example.start_bundle()
+        list(to_example.process((key, (interaction, None))))
+        to_example.finish_bundle()
+        token_cache_misses.append(to_example._token_cache.misses)
+
+      # The second bundle only sees texts that were tokenized by the first.
+      self.assertGreater(token_cache_misses[0], 0)
+      self.assertEqual(token_cache_misses[0], token_cache_misses[1])
+      self.assertGreater(to_example._token_cache.hits, 0)
+
 
 if __name__ == "__main__":
   absltest.main()
@@ -122,13 +122,24 @@ def _parse_questions(interaction_dict,
                      report_filename):
   """Adds numeric value spans to all questions."""
   counters = collections.defaultdict(collections.Counter)
+  # All interactions with the same table id hold a copy of the same table, so
+  # their questions can share one cell index.
+  cell_indexes = {}
   for key, interactions in interaction_dict.items():
     for interaction in interactions:
       questions = []
+      table_id = interaction.table.table_id
+      cell_index = cell_indexes.get(table_id)
+      if cell_index is None:
+        cell_index = interaction_utils_parser.CellIndex(interaction.table)
+        cell_indexes[table_id] = cell_index
       for original_question in interaction.questions:
         try:
           question = interaction_utils_parser.parse_question(
-              interaction.table, original_question, supervision_modes[key])
+              interaction.table,
+              original_question,
+              supervision_modes[key],
+              cell_index=cell_index)
           counters[key]['valid'] += 1
         except ValueError as exc:
           question = interaction_pb2.Question()
@@ -16,6 +16,7 @@
 # coding=utf8
 """Includes utility functions to convert and normalize text."""
 
+import functools
 import math
 import re
 import struct
@@ -26,6 +27,21 @@ import six
 from tapas.utils import constants
 
 
+# Maps quotes and dashes to their ASCII version.
+_WTQ_CHAR_TRANSLATION = str.maketrans({
+    **{c: "'" for c in u"‘’´`"},
+    **{c: '"' for c in u"“”"},
+    **{c: "-" for c in u"‐‑‒–—−"},
+})
+_WTQ_CITATIONS = re.compile(u"((?<!^)\\[[^\\]]*\\]|\\[\\d+\\]|[•♦†‡*#+])*$")
+_WTQ_PARENTHESIS = re.compile(u"(?<!^)( \\([^)]*\\))*$")
+_WTQ_QUOTATION_MARKS = re.compile(u'^"([^"]*)"$')
+_WTQ_WHITESPACE = re.compile(r"\s+", flags=re.U)
+_WTQ_TAGS = re.compile("<[^<]+?>")
+_NON_ASCII = re.compile(r"[^\x00-\x7f]")
+_MAX_WTQ_NORMALIZED_TEXTS = 100000
+
+
 def wtq_normalize(x):
   """Returns the normalized version of x.
 
@@ -40,36 +56,79 @@ def wtq_normalize(x):
     A normalized string.
   """
   x = x if isinstance(x, six.text_type) else six.text_type(x)
-  # Remove diacritics.
-  x = "".join(
-      c for c in unicodedata.normalize("NFKD", x)
-      if unicodedata.category(c) != "Mn")
+  # Remove diacritics. ASCII text doesn't change under NFKD.
+  if _NON_ASCII.search(x):
+    x = "".join(
+        c for c in unicodedata.normalize("NFKD", x)
+        if unicodedata.category(c) != "Mn")
   # Normalize quotes and dashes.
-  x = re.sub(u"[‘’´`]", "'", x)
-  x = re.sub(u"[“”]", '"', x)
-  x = re.sub(u"[‐‑‒–—−]", "-", x)
-  x = re.sub(u"[‐]", "", x)
+  x = x.translate(_WTQ_CHAR_TRANSLATION)
   while True:
     old_x = x
     # Remove citations.
-    x = re.sub(u"((?<!^)\\[[^\\]]*\\]|\\[\\d+\\]|[•♦†‡*#+])*$", "",
-               x.strip())
+    x = _WTQ_CITATIONS.sub("", x.strip())
     # Remove details in parenthesis.
-    x = re.sub(u"(?<!^)( \\([^)]*\\))*$", "", x.strip())
+    x = _WTQ_PARENTHESIS.sub("", x.strip())
     # Remove outermost quotation mark.
-    x = re.sub(u'^"([^"]*)"$', r"\1", x.strip())
+    x = _WTQ_QUOTATION_MARKS.sub(r"\1", x.strip())
     if x == old_x:
       break
   # Remove final '.'.
   if x and x[-1] == ".":
     x = x[:-1]
   # Collapse whitespaces and convert to lower case.
-  x = re.sub(r"\s+", " ", x, flags=re.U).lower().strip()
-  x = re.sub("<[^<]+?>", "", x)
+  x = _WTQ_WHITESPACE.sub(" ", x).lower().strip()
+  x = _WTQ_TAGS.sub("", x)
   x = x.replace("\n", " ")
   return x
 
 
+_cached_wtq_normalize_text = functools.lru_cache(
+    maxsize=_MAX_WTQ_NORMALIZED_TEXTS)(
+        wtq_normalize)
+
+
+def cached_wtq_normalize(x):
+  """Same as wtq_normalize but the results for texts are cached.
+
+  Only texts are cached: other values that compare equal can be normalized
+  differently, e.g. 1 and 1.0 or 0.0 and -0.0.
+
+  Args:
+    x: the object (integer type or string) to normalize.
+
+  Returns:
+    A normalized string.
+  """
+  if isinstance(x, six.text_type):
+    return _cached_wtq_normalize_text(x)
+  return wtq_normalize(x)
+
+
+def wtq_normalize_all(values):
+  """Applies wtq_normalize to all values, distinct texts are normalized once.
+
+  Args:
+    values: Objects (integer type or string) to normalize, e.g. the flattened
+      cells of a table.
+
+  Returns:
+    The normalized strings in the order of 'values'.
+  """
+  normalized_texts = {}
+  result = []
+  for value in values:
+    if not isinstance(value, six.text_type):
+      result.append(wtq_normalize(value))
+      continue
+    normalized_value = normalized_texts.get(value)
+    if normalized_value is None:
+      normalized_value = wtq_normalize(value)
+      normalized_texts[value] = normalized_value
+    result.append(normalized_value)
+  return result
+
+
 _TOKENIZER = re.compile(r"\w+|[^\w\s]+", re.UNICODE)
 
 
@@ -83,7 +142,7 @@ STRING_NORMALIZATIONS = (
     lambda x: x,
     lambda x: x.lower(),
     tokenize_string,
-    wtq_normalize,
+    cached_wtq_normalize,
 )
 
 
@@ -68,6 +68,19 @@ class TextUtilsTest(parameterized.TestCase, absltest.TestCase):
   )
   def test_wtq_normalization(self, value, expected):
     self.assertEqual(expected, text_utils.wtq_normalize(value))
+    self.assertEqual(expected, text_utils.cached_wtq_normalize(value))
+
+  def test_wtq_normalize_all(self):
+    values = [
+        u"“d‒ash”", "abc (123)", u"“d‒ash”", 1, 1.0, True,
+        float("nan"), 0.0, -0.0
+    ]
+    self.assertEqual(
+        ["d-ash", "abc", "d-ash", "1", "1.0", "true", "nan", "0.0", "-0.0"],
+        text_utils.wtq_normalize_all(values))
+    self.assertEqual(
+        ["0.0", "-0.0"],
+        [text_utils.cached_wtq_normalize(value) for value in [0.0, -0.0]])
 
   @parameterized.named_parameters(
       ("simple", [1.0, "1"], ["1.0", "1.0"]),
@@ -15,17 +15,22 @@
 # Lint as: python3
 """Utilities for converting interactions to TF examples."""
 
+import array
+import bisect
 import collections
+import enum
 import hashlib
 import random
-from typing import Iterable, List, Mapping, Optional, Text, Tuple
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Text, Tuple, Union
 from absl import logging
 import dataclasses
 from tapas.protos import interaction_pb2
 from tapas.utils import constants
+from tapas.utils import fast_tokenization
 from tapas.utils import interpretation_utils
 from tapas.utils import number_annotation_utils
 from tapas.utils import text_utils
+import numpy as np
 import tensorflow.compat.v1 as tf
 
 from official.nlp.bert import tokenization
@@ -43,18 +48,42 @@ _MAX_INDEX_LENGTH = int(_MAX_NUM_CANDIDATES * _MAX_NUM_ROWS * _WP_PER_CELL)
 _MAX_NUMERIC_VALUES = number_annotation_utils.MAX_QUESTION_NUMERIC_VALUES
 
 
+class _NoTiming:
+  """Stage context that does nothing, used if timing is disabled."""
+
+  def __enter__(self):
+    return None
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    return False
+
+
+_NO_TIMING = _NoTiming()
+
+
 @dataclasses.dataclass(frozen=True)
 class Token:
+  """A word piece and the text of the word it was created from."""
+  # Tables produce a lot of tokens, slots keep them small.
+  __slots__ = ('original_text', 'piece')
   original_text: Text
   piece: Text
 
+  def __getstate__(self):
+    return self.original_text, self.piece
+
+  def __setstate__(self, state):
+    original_text, piece = state
+    object.__setattr__(self, 'original_text', original_text)
+    object.__setattr__(self, 'piece', piece)
+
 
 @dataclasses.dataclass(frozen=True)
 class TrainingInstance:
   tokens: List[Token]
-  segment_ids: List[int]
-  column_ids: List[int]
-  row_ids: List[int]
+  segment_ids: Sequence[int]
+  column_ids: Sequence[int]
+  row_ids: Sequence[int]
   masked_lm_positions: List[int]
   masked_lm_labels: List[Text]
   is_random_table: bool
@@ -69,8 +98,37 @@ class TokenCoordinates:
 
 @dataclasses.dataclass
 class TokenizedTable:
+  """Tokens of all cells, the first row is the header row.
+
+  Instead of one TokenCoordinates object per token the coordinates are stored
+  in parallel int arrays with one entry per token in row-major order.
+
+  rows: Tokens of every cell.
+  tokens: All tokens.
+  row_indexes: Row index of every token.
+  column_indexes: Column index of every token.
+  token_indexes: Index of every token in its cell.
+  word_begin_indexes: Index of the first word piece of the word of every token,
+    -1 if the cell starts with an inner word piece.
+  """
   rows: List[List[List[Token]]]
-  selected_tokens: List[TokenCoordinates]
+  tokens: List[Token]
+  row_indexes: np.ndarray
+  column_indexes: np.ndarray
+  token_indexes: np.ndarray
+  word_begin_indexes: np.ndarray
+
+  @property
+  def selected_tokens(self):
+    return [
+        TokenCoordinates(
+            column_index=column_index,
+            row_index=row_index,
+            token_index=token_index,
+        ) for row_index, column_index, token_index in zip(
+            self.row_indexes.tolist(), self.column_indexes.tolist(),
+            self.token_indexes.tolist())
+    ]
 
 
 @dataclasses.dataclass(frozen=True)
@@ -120,12 +178,17 @@ class ClassifierConversionConfig(ConversionConfig):
   add_aggregation_candidates: bool
 
 
+# Maps (column index, row index) of a table cell to its token positions.
+_CellTokenIndex = Mapping[Tuple[int, int], List[int]]
+
+
 @dataclasses.dataclass(frozen=True)
 class SerializedExample:
   tokens: List[Token]
-  column_ids: List[int]
-  row_ids: List[int]
-  segment_ids: List[int]
+  column_ids: Sequence[int]
+  row_ids: Sequence[int]
+  segment_ids: Sequence[int]
+  cell_index: _CellTokenIndex
 
 
 def _get_pieces(tokens):
@@ -136,6 +199,11 @@ def fingerprint(text):
   return int(hashlib.sha256(text.encode('utf-8')).hexdigest(), 16)
 
 
+def get_table_fingerprint(table):
+  """Returns a fingerprint of the table content."""
+  return hashlib.sha256(table.SerializeToString(deterministic=True)).hexdigest()
+
+
 def create_int_feature(values):
   return tf.train.Feature(int64_list=tf.train.Int64List(value=list(values)))
 
@@ -148,15 +216,217 @@ def create_string_feature(values):
   return tf.train.Feature(bytes_list=tf.train.BytesList(value=list(values)))
 
 
+# Field numbers of the lists in tf.train.Feature.
+_BYTES_LIST = 1
+_FLOAT_LIST = 2
+_INT64_LIST = 3
+# Protobuf wire type of length delimited fields.
+_LENGTH_DELIMITED = 2
+_MAX_VARINT_BYTES = 10
+
+
+@dataclasses.dataclass(frozen=True)
+class _RawFeature:
+  """Values of a feature before they are converted to a proto.
+
+  'kind' is the field number of the list in tf.train.Feature.
+  """
+  kind: int
+  values: Sequence[Union[int, float, bytes]]
+
+
+def _int_feature(values):
+  return _RawFeature(_INT64_LIST, values)
+
+
+def _float_feature(values):
+  return _RawFeature(_FLOAT_LIST, values)
+
+
+def _string_feature(values):
+  return _RawFeature(_BYTES_LIST, values)
+
+
+def _to_tf_example(
+    features):
+  """Creates a tf.train.Example proto from raw features."""
+  feature = {}
+  for key, raw_feature in features.items():
+    values = raw_feature.values
+    if isinstance(values, np.ndarray):
+      values = values.tolist()
+    if raw_feature.kind == _INT64_LIST:
+      feature[key] = create_int_feature(values)
+    elif raw_feature.kind == _FLOAT_LIST:
+      feature[key] = create_float_feature(values)
+    else:
+      feature[key] = create_string_feature(values)
+  return tf.train.Example(features=tf.train.Features(feature=feature))
+
+
+def _encode_varint(value):
+  """Encodes a non-negative int as protobuf varint."""
+  output = bytearray()
+  while value >= 0x80:
+    output.append((value & 0x7f) | 0x80)
+    value >>= 7
+  output.append(value)
+  return bytes(output)
+
+
+def _encode_varints(values):
+  """Encodes int64 values as concatenated varints.
+
+  Negative values are encoded as 10 byte two's complement like protobuf does.
+
+  Args:
+    values: Int64 values.
+
+  Returns:
+    The packed varints.
+  """
+  values = np.asarray(values, dtype=np.int64).view(np.uint64)
+  if not values.size:
+    return b''
+  # Number of 7 bit groups needed for every value.
+  num_bytes = np.ones(values.shape, dtype=np.int64)
+  for index in range(1, _MAX_VARINT_BYTES):
+    num_bytes += (values >> np.uint64(7 * index)) != 0
+  max_num_bytes = int(num_bytes.max())
+  if max_num_bytes == 1:
+    return values.astype(np.uint8).tobytes()
+  byte_indexes = np.arange(max_num_bytes)
+  groups = (values[:, np.newaxis] >> (np.uint64(7) * byte_indexes.astype(
+      np.uint64))) & np.uint64(0x7f)
+  # All but the last byte of a varint have the continuation bit set.
+  has_next = byte_indexes < (num_bytes[:, np.newaxis] - 1)
+  groups |= has_next.astype(np.uint64) << np.uint64(7)
+  is_used = byte_indexes < num_bytes[:, np.newaxis]
+  return groups[is_used].astype(np.uint8).tobytes()
+
+
+def _encode_field(field_number, payload):
+  """Encodes a length delimited field."""
+  return (_encode_varint(field_number << 3 | _LENGTH_DELIMITED) +
+          _encode_varint(len(payload)) + payload)
+
+
+def _encode_feature(raw_feature):
+  """Encodes a tf.train.Feature."""
+  values = raw_feature.values
+  if raw_feature.kind == _INT64_LIST:
+    payload = _encode_varints(values)
+  elif raw_feature.kind == _FLOAT_LIST:
+    # Like the protobuf runtime, values that overflow float32 become inf.
+    with np.errstate(over='ignore'):
+      payload = np.asarray(values, dtype='<f4').tobytes()
+  else:
+    return _encode_field(_BYTES_LIST,
+                         b''.join(_encode_field(1, value) for value in values))
+  # The values of int64 and float lists are packed into a single field.
+  packed_values = _encode_field(1, payload) if payload else b''
+  return _encode_field(raw_feature.kind, packed_values)
+
+
+def _encode_example(features):
+  """Serializes raw features as tf.train.Example without creating protos.
+
+  The output parses to the same proto as the serialization of
+  '_to_tf_example(features)', e.g. with tf.io.parse_single_example.
+
+  Args:
+    features: Maps feature names to raw features.
+
+  Returns:
+    The serialized example.
+  """
+  entries = []
+  for key, raw_feature in features.items():
+    entry = (
+        _encode_field(1, key.encode('utf8')) +
+        _encode_field(2, _encode_feature(raw_feature)))
+    entries.append(_encode_field(1, entry))
+  return _encode_field(1, b''.join(entries))
+
+
 def _is_inner_wordpiece(token):
   return token.piece.startswith('##')
 
 
-def _get_cell_token_indexes(column_ids, row_ids,
+def _get_cell_token_index(column_ids,
+                          row_ids):
+  """Builds an inverted index from cell coordinates to token positions.
+
+  Column and row ids are 1-based (0 is used for question tokens and the header
+  row respectively) so the coordinates in the index are shifted by one.
+
+  Args:
+    column_ids: Maps word piece position to column id.
+    row_ids: Maps word piece position to row id.
+
+  Returns:
+    A mapping from (column index, row index) to the ordered token positions.
+  """
+  cell_index = collections.defaultdict(list)
+  for index, (column_id, row_id) in enumerate(zip(column_ids, row_ids)):
+    cell_index[column_id - 1, row_id - 1].append(index)
+  return dict(cell_index)
+
+
+def _get_cell_token_indexes(cell_index,
                             column_id, row_id):
-  for index in range(len(column_ids)):
-    if (column_ids[index] - 1 == column_id and row_ids[index] - 1 == row_id):
-      yield index
+  return cell_index.get((column_id, row_id), [])
+
+
+def _get_cell_ids(column_ids, row_ids, num_columns,
+                  num_rows):
+  """Maps every token position to a flat cell id.
+
+  The cell in column 'c' and row 'r' (both 0-based) has id c * num_rows + r.
+  Question and header tokens and positions outside of the table get -1.
+
+  Args:
+    column_ids: Maps word piece position to column id.
+    row_ids: Maps word piece position to row id.
+    num_columns: Number of table columns.
+    num_rows: Number of table rows.
+
+  Returns:
+    An int array of cell ids.
+  """
+  column_ids = np.asarray(column_ids, dtype=np.int64)
+  row_ids = np.asarray(row_ids, dtype=np.int64)
+  in_table = ((column_ids >= 1) & (column_ids <= num_columns) & (row_ids >= 1) &
+              (row_ids <= num_rows))
+  return np.where(in_table, (column_ids - 1) * num_rows + row_ids - 1, -1)
+
+
+def _gather_cell_values(cell_ids, cell_values,
+                        default_value):
+  """Returns the value of the cell of every position or 'default_value'."""
+  values = np.full(cell_ids.shape, default_value, dtype=cell_values.dtype)
+  in_table = cell_ids >= 0
+  values[in_table] = cell_values[cell_ids[in_table]]
+  return values
+
+
+def _get_ranks(sort_keys):
+  """Ranks the keys among all distinct keys.
+
+  Args:
+    sort_keys: Floats or equally long tuples of floats.
+
+  Returns:
+    The 0-based rank of every key and the number of distinct keys.
+  """
+  keys = np.array(sort_keys, dtype=np.float64)
+  if not np.isnan(keys).any():
+    unique_keys, ranks = np.unique(keys, axis=0, return_inverse=True)
+    return ranks.reshape(-1), len(unique_keys)
+  # NaN is not equal to itself, so every NaN value is a distinct key.
+  unique_keys = sorted(dict.fromkeys(sort_keys))
+  key_to_rank = {key: rank for rank, key in enumerate(unique_keys)}
+  return np.array([key_to_rank[key] for key in sort_keys]), len(unique_keys)
 
 
 def _get_buckets(value, buckets, name):
@@ -168,7 +438,7 @@ def _get_buckets(value, buckets, name):
 
 def _get_all_answer_ids(
     column_ids,
-    row_ids,
+    cell_index,
     questions,
 ):
   """Maps lists of questions with answer coordinates to token indexes."""
@@ -178,8 +448,7 @@ def _get_all_answer_ids(
   for question in questions:
     for answer in question.answer.answer_coordinates:
       all_answers.add((answer.column_index, answer.row_index))
-      for index in _get_cell_token_indexes(column_ids, row_ids,
-                                           answer.column_index,
+      for index in _get_cell_token_indexes(cell_index, answer.column_index,
                                            answer.row_index):
         found_answers.add((answer.column_index, answer.row_index))
         answer_ids[index] = 1
@@ -188,10 +457,10 @@ def _get_all_answer_ids(
   return answer_ids, missing_count
 
 
-def _get_answer_ids(column_ids, row_ids,
+def _get_answer_ids(column_ids, cell_index,
                     question):
   """Maps answer coordinates to token indexes."""
-  answer_ids, missing_count = _get_all_answer_ids(column_ids, row_ids,
+  answer_ids, missing_count = _get_all_answer_ids(column_ids, cell_index,
                                                   [question])
 
   if missing_count:
@@ -199,20 +468,64 @@ def _get_answer_ids(column_ids, row_ids,
   return answer_ids
 
 
+class TokenizerBackend(enum.Enum):
+  # Basic tokenization followed by the Bert FullTokenizer on every word.
+  BERT = 1
+  # Single basic tokenization pass and trie based word piece matching.
+  # Produces the same tokens as BERT.
+  FAST = 2
+
+
 class TapasTokenizer:
   """Wraps a Bert tokenizer."""
 
-  def __init__(self, vocab_file):
+  def __init__(self,
+               vocab_file,
+               token_cache=None,
+               backend=TokenizerBackend.BERT):
+    """Initializes the tokenizer.
+
+    Args:
+      vocab_file: Bert vocab file.
+      token_cache: Optional LRU cache that memoizes the tokens of a text. The
+        cache is keyed by vocab file and text so it can be shared between
+        tokenizers. The cached token sequences are tuples so they can't be
+        modified by the callers.
+      backend: Implementation used to split texts into word pieces.
+    """
     self._basic_tokenizer = tokenization.BasicTokenizer(do_lower_case=True)
     self._wp_tokenizer = tokenization.FullTokenizer(
         vocab_file=vocab_file, do_lower_case=True)
+    if backend == TokenizerBackend.FAST:
+      self._fast_tokenizer = (
+          fast_tokenization.FastWordpieceTokenizer.from_bert_tokenizer(
+              self._wp_tokenizer, do_lower_case=True))
+    elif backend == TokenizerBackend.BERT:
+      self._fast_tokenizer = None
+    else:
+      raise ValueError(f'Unknown tokenizer backend: {backend}')
+    self._vocab_file = vocab_file
+    self._token_cache = token_cache
 
   def get_vocab(self):
     return self._wp_tokenizer.vocab.keys()
 
   def tokenize(self, text):
+    """Returns a new list of the tokens of 'text'."""
+    if self._token_cache is None:
+      return self._tokenize(text)
+    return list(
+        self._token_cache.get((self._vocab_file, text),
+                              lambda key: tuple(self._tokenize(key[1]))))
+
+  def _tokenize(self, text):
     if text_utils.format_text(text) == constants.EMPTY_TEXT:
       return [Token(_EMPTY, _EMPTY)]
+    if self._fast_tokenizer is not None:
+      return [
+          Token(token, piece)
+          for token, piece in self._fast_tokenizer.tokenize(text)
+      ]
     tokens = []
     for token in self._basic_tokenizer.tokenize(text):
       for piece in self._wp_tokenizer.tokenize(token):
@@ -227,19 +540,249 @@ class TapasTokenizer:
     return len(question_tokens) + 2
 
 
+class _TableCostIndex:
+  """Answers table cost queries in constant time.
+
+  Holds prefix counts over (row, column, word begin index) of a tokenized
+  table. The cost of a table restricted to the first rows, columns and tokens
+  per cell is a single lookup, which allows growing tables incrementally.
+  """
+
+  def __init__(self, table, max_num_columns,
+               max_num_rows, max_num_tokens):
+    # The header row is always included so we need one more row.
+    num_rows = min(len(table.rows), max_num_rows + 1)
+    shape = (num_rows, max_num_columns, max_num_tokens + 1)
+    is_selected = ((table.row_indexes < num_rows) &
+                   (table.column_indexes < max_num_columns))
+    # Begin indexes start at -1 for cells that start with an inner word piece.
+    flat_indexes = (
+        (table.row_indexes[is_selected].astype(np.int64) * shape[1] +
+         table.column_indexes[is_selected]) * shape[2] +
+        table.word_begin_indexes[is_selected] + 1)
+    counts = np.bincount(
+        flat_indexes, minlength=int(np.prod(shape))).reshape(shape)
+    self._prefix_counts = counts.cumsum(axis=0).cumsum(axis=1).cumsum(axis=2)
+
+  def get_cost(self, num_columns, num_rows, num_tokens):
+    """Same as `ToTensorflowExampleBase._get_table_cost`."""
+    max_rows, max_columns, max_tokens = self._prefix_counts.shape
+    # First row is header row.
+    num_rows = min(num_rows + 1, max_rows)
+    num_columns = min(num_columns, max_columns)
+    if num_rows <= 0 or num_columns <= 0 or num_tokens < 0:
+      return 0
+    num_tokens = min(num_tokens, max_tokens - 1)
+    return int(self._prefix_counts[num_rows - 1, num_columns - 1, num_tokens])
+
+
+def _get_type_signature(numeric_value):
+  """Returns the fields of a value that determine how it can be compared."""
+  date = numeric_value.date
+  return (numeric_value.HasField('float_value'), numeric_value.HasField('date'),
+          date.HasField('year'), date.HasField('month'), date.HasField('day'))
+
+
+def _get_relation_bit(relation):
+  return 2**(relation.value - constants.Relation.EQ.value)
+
+
+class _NumericColumnProfile:
+  """Numeric values of a column sorted for comparisons with question values.
+
+  The sort key that is used to compare a question value with the column only
+  depends on the type signature of the question value, so the sorted keys are
+  computed once per signature.
+  """
+
+  def __init__(self, cell_ids,
+               numeric_values):
+    self._cell_ids = np.asarray(cell_ids, dtype=np.int64)
+    self._numeric_values = numeric_values
+    self._signature_to_sorted_keys = {}
+
+  def _get_sorted_keys(self, value):
+    """Returns the sort key function and the sorted keys and cell ids."""
+    signature = _get_type_signature(value)
+    if signature not in self._signature_to_sorted_keys:
+      try:
+        key_fn = number_annotation_utils.get_numeric_sort_key_fn(
+            self._numeric_values + [value])
+      except ValueError:
+        key_fn = None
+      sorted_keys = []
+      sorted_cell_ids = self._cell_ids[:0]
+      if key_fn is not None:
+        keys = [key_fn(numeric_value) for numeric_value in self._numeric_values]
+        # NaN doesn't have any relation with other values.
+        order = sorted((index for index, key in enumerate(keys) if key == key),
+                       key=keys.__getitem__)
+        sorted_keys = [keys[index] for index in order]
+        sorted_cell_ids = self._cell_ids[order]
+      self._signature_to_sorted_keys[signature] = (key_fn, sorted_keys,
+                                                   sorted_cell_ids)
+    return self._signature_to_sorted_keys[signature]
+
+  def add_relations(self, value,
+                    cell_relations):
+    """Adds the relations of 'value' with all cells to 'cell_relations'."""
+    key_fn, sorted_keys, sorted_cell_ids = self._get_sorted_keys(value)
+    if key_fn is None:
+      return
+    key = key_fn(value)
+    if key != key:
+      return
+    begin = bisect.bisect_left(sorted_keys, key)
+    end = bisect.bisect_right(sorted_keys, key, lo=begin)
+    cell_relations[sorted_cell_ids[:begin]] |= _get_relation_bit(
+        constants.Relation.GT)
+    cell_relations[sorted_cell_ids[begin:end]] |= _get_relation_bit(
+        constants.Relation.EQ)
+    cell_relations[sorted_cell_ids[end:]] |= _get_relation_bit(
+        constants.Relation.LT)
+
+
+class _NumericTableProfile:
+  """Numeric cell values of a table prepared for computing token features.
+
+  All arrays are indexed by flat cell ids, see _get_cell_ids.
+  """
+
+  def __init__(self, table):
+    num_rows = len(table.rows)
+    num_cells = len(table.columns) * num_rows
+    self.cell_ranks = np.zeros(num_cells, dtype=np.int64)
+    self.cell_inv_ranks = np.zeros(num_cells, dtype=np.int64)
+    self.cell_values = np.full(num_cells, _NAN)
+    self._columns = []
+    for col_index in range(len(table.columns)):
+      row_indexes = []
+      numeric_values = []
+      for row_index, row in enumerate(table.rows):
+        cell = row.cells[col_index]
+        if not cell.HasField('numeric_value'):
+          continue
+        row_indexes.append(row_index)
+        numeric_values.append(cell.numeric_value)
+        float_value = cell.numeric_value.float_value
+        if (cell.numeric_value.HasField('float_value') and
+            float_value != float('inf')):
+          self.cell_values[col_index * num_rows + row_index] = float_value
+      if not numeric_values:
+        continue
+
+      cell_ids = col_index * num_rows + np.array(row_indexes, dtype=np.int64)
+      self._columns.append(_NumericColumnProfile(cell_ids, numeric_values))
+
+      try:
+        key_fn = number_annotation_utils.get_numeric_sort_key_fn(
+            numeric_values)
+      except ValueError:
+        continue
+      ranks, num_unique_values = _get_ranks(
+          [key_fn(value) for value in numeric_values])
+      self.cell_ranks[cell_ids] = ranks + 1
+      self.cell_inv_ranks[cell_ids] = num_unique_values - ranks
+
+  def get_cell_relations(
+      self, question):
+    """Returns the set of relations with question values as a bit mask."""
+    cell_relations = np.zeros_like(self.cell_ranks)
+    for numeric_value_span in question.annotations.spans:
+      for value in numeric_value_span.values:
+        for column in self._columns:
+          column.add_relations(value, cell_relations)
+    return cell_relations
+
+
+@dataclasses.dataclass
+class _CachedTable:
+  """Question independent data of a table that is kept in the table cache."""
+  tokenized_table: TokenizedTable
+  # Computed when it is first needed.
+  numeric_profile: Optional[_NumericTableProfile] = None
+
+
+@dataclasses.dataclass
+class _PreparedTable:
+  """Question independent data of a table that is shared by all questions."""
+  tokenized_table: TokenizedTable
+  num_columns: int
+  num_rows: int
+  table_costs: List[int]
+  numeric_profile: _NumericTableProfile
+  # Maps the number of tokens per cell to the indexes of the selected tokens.
+  table_token_indexes: Dict[int, np.ndarray] = dataclasses.field(
+      default_factory=dict)
+
+
 class ToTensorflowExampleBase:
   """Base class for converting interactions to TF examples."""
 
-  def __init__(self, config):
+  def __init__(self,
+               config,
+               table_cache=None,
+               token_cache=None,
+               tokenizer_backend=TokenizerBackend.BERT,
+               stage_timer=None):
+    """Initializes the converter.
+
+    Args:
+      config: Conversion options.
+      table_cache: Optional LRU cache of tokenized tables and their numeric
+        profiles. The cache can be shared between converters since the key
+        includes the vocab file and whether column names are stripped.
+      token_cache: Optional LRU cache of tokenized texts, see TapasTokenizer.
+      tokenizer_backend: Word piece implementation, see TapasTokenizer.
+      stage_timer: Optional timing_utils.StageTimer that measures the time
+        spent in the conversion stages. Disabled by default.
+    """
     self._max_seq_length = config.max_seq_length
     self._max_column_id = config.max_column_id
     self._max_row_id = config.max_row_id
     self._strip_column_names = config.strip_column_names
-    self._tokenizer = TapasTokenizer(config.vocab_file)
+    self._vocab_file = config.vocab_file
+    self._tokenizer = TapasTokenizer(
+        config.vocab_file, token_cache, backend=tokenizer_backend)
+    self._table_cache = table_cache
+    self._stage_timer = stage_timer
+
+  def _time(self, stage):
+    """Returns a context that measures 'stage' if timing is enabled."""
+    if self._stage_timer is None:
+      return _NO_TIMING
+    return self._stage_timer.time(stage)
+
+  def _count(self, name, value=1):
+    if self._stage_timer is not None:
+      self._stage_timer.count(name, value)
+
+  def get_stage_stats(self):
+    """Returns the stage timer statistics, empty if timing is disabled."""
+    if self._stage_timer is None:
+      return {'stages': {}, 'counters': {}}
+    return self._stage_timer.get_stats()
+
+  def _get_cached_table(self, table):
+    """Returns the table cache entry of 'table', a new one without a cache."""
+    with self._time('tokenize_table'):
+      if self._table_cache is None:
+        return _CachedTable(self._tokenize_table_uncached(table))
+      key = (get_table_fingerprint(table), self._strip_column_names,
+             self._vocab_file)
+      return self._table_cache.get(
+          key, lambda _: _CachedTable(self._tokenize_table_uncached(table)))
 
   def _tokenize_table(
       self,
       table,
+  ):
+    """Returns the tokenized table, from the table cache if available."""
+    return self._get_cached_table(table).tokenized_table
+
+  def _tokenize_table_uncached(
+      self,
+      table,
   ):
     """Runs tokenizer over columns and table cell texts."""
     tokenized_rows = []
@@ -257,64 +800,62 @@ class ToTensorflowExampleBase:
         tokenized_row.append(self._tokenizer.tokenize(cell.text))
       tokenized_rows.append(tokenized_row)
 
-    token_coordinates = []
+    tokens = []
+    row_indexes = array.array('i')
+    column_indexes = array.array('i')
+    token_indexes = array.array('i')
+    word_begin_indexes = array.array('i')
     for row_index, row in enumerate(tokenized_rows):
       for column_index, cell in enumerate(row):
-        for token_index, _ in enumerate(cell):
-          token_coordinates.append(
-              TokenCoordinates(
-                  row_index=row_index,
-                  column_index=column_index,
-                  token_index=token_index,
-              ))
+        word_begin_index = -1
+        for token_index, token in enumerate(cell):
+          if not _is_inner_wordpiece(token):
+            word_begin_index = token_index
+          tokens.append(token)
+          row_indexes.append(row_index)
+          column_indexes.append(column_index)
+          token_indexes.append(token_index)
+          word_begin_indexes.append(word_begin_index)
 
     return TokenizedTable(
         rows=tokenized_rows,
-        selected_tokens=token_coordinates,
+        tokens=tokens,
+        row_indexes=np.asarray(row_indexes),
+        column_indexes=np.asarray(column_indexes),
+        token_indexes=np.asarray(token_indexes),
+        word_begin_indexes=np.asarray(word_begin_indexes),
     )
 
+  def _get_table_token_indexes(self, table,
+                               num_columns, num_rows,
+                               num_tokens):
+    """Returns the indexes of the table tokens that fit into the budget."""
+    # First row is header row. Don't add partial words, the starting word piece
+    # has to fit in the token budget.
+    is_selected = ((table.row_indexes < num_rows + 1) &
+                   (table.column_indexes < num_columns) &
+                   (table.word_begin_indexes < num_tokens))
+    return np.flatnonzero(is_selected)
+
   def _get_table_values(self, table, num_columns,
                         num_rows,
                         num_tokens):
     """Iterates over partial table and returns token, col. and row indexes."""
-    for tc in table.selected_tokens:
-      # First row is header row.
-      if tc.row_index >= num_rows + 1:
-        continue
-      if tc.column_index >= num_columns:
-        continue
-      cell = table.rows[tc.row_index][tc.column_index]
-      token = cell[tc.token_index]
-      word_begin_index = tc.token_index
-      # Don't add partial words. Find the starting word piece and check if it
-      # fits in the token budget.
-      while word_begin_index >= 0 \
-          and _is_inner_wordpiece(cell[word_begin_index]):
-        word_begin_index -= 1
-      if word_begin_index >= num_tokens:
-        continue
-      yield token, tc.column_index + 1, tc.row_index
+    token_indexes = self._get_table_token_indexes(table, num_columns, num_rows,
+                                                  num_tokens)
+    for index in token_indexes.tolist():
+      yield (table.tokens[index], int(table.column_indexes[index]) + 1,
+             int(table.row_indexes[index]))
 
   def _serialize_text(
       self, question_tokens
   ):
     """Serialzes texts in index arrays."""
-    tokens = []
-    segment_ids = []
-    column_ids = []
-    row_ids = []
-
-    tokens.append(Token(_CLS, _CLS))
-    segment_ids.append(0)
-    column_ids.append(0)
-    row_ids.append(0)
-
-    for token in question_tokens:
-      tokens.append(token)
-      segment_ids.append(0)
-      column_ids.append(0)
-      row_ids.append(0)
-
+    tokens = [Token(_CLS, _CLS)]
+    tokens.extend(question_tokens)
+    segment_ids = array.array('i', [0]) * len(tokens)
+    column_ids = array.array('i', [0]) * len(tokens)
+    row_ids = array.array('i', [0]) * len(tokens)
     return tokens, segment_ids, column_ids, row_ids
 
   def _serialize(
@@ -324,8 +865,22 @@ class ToTensorflowExampleBase:
       num_columns,
       num_rows,
       num_tokens,
+      table_token_indexes = None,
   ):
-    """Serializes table and text."""
+    """Serializes table and text.
+
+    Args:
+      question_tokens: Tokens of the question.
+      table: Tokenized table.
+      num_columns: Number of columns to include.
+      num_rows: Number of rows to include (excluding the header).
+      num_tokens: Number of tokens per cell.
+      table_token_indexes: Optional precomputed output of
+        _get_table_token_indexes.
+
+    Returns:
+      The serialized example.
+    """
     tokens, segment_ids, column_ids, row_ids = self._serialize_text(
         question_tokens)
 
@@ -334,18 +889,23 @@ class ToTensorflowExampleBase:
     column_ids.append(0)
     row_ids.append(0)
 
-    for token, column_id, row_id in self._get_table_values(
-        table, num_columns, num_rows, num_tokens):
-      tokens.append(token)
-      segment_ids.append(1)
-      column_ids.append(column_id)
-      row_ids.append(row_id)
+    if table_token_indexes is None:
+      table_token_indexes = self._get_table_token_indexes(
+          table, num_columns, num_rows, num_tokens)
+    tokens.extend(table.tokens[index] for index in table_token_indexes.tolist())
+    segment_ids.extend(array.array('i', [1]) * len(table_token_indexes))
+    column_ids.frombytes(
+        (table.column_indexes[table_token_indexes] + 1).astype(
+            np.intc).tobytes())
+    row_ids.frombytes(
+        table.row_indexes[table_token_indexes].astype(np.intc).tobytes())
 
     return SerializedExample(
         tokens=tokens,
         segment_ids=segment_ids,
         column_ids=column_ids,
         row_ids=row_ids,
+        cell_index=_get_cell_token_index(column_ids, row_ids),
     )
 
   def _tokenize(self, text):
@@ -361,181 +921,109 @@ class ToTensorflowExampleBase:
     max_num_tokens = 0
     max_num_columns = 0
     max_num_rows = 0
-    for tc in table.selected_tokens:
-      max_num_columns = max(max_num_columns, tc.column_index + 1)
-      max_num_rows = max(max_num_rows, tc.row_index + 1)
-      max_num_tokens = max(max_num_tokens, tc.token_index + 1)
+    if table.tokens:
+      max_num_columns = int(table.column_indexes.max()) + 1
+      max_num_rows = int(table.row_indexes.max()) + 1
+      max_num_tokens = int(table.token_indexes.max()) + 1
     max_num_columns = min(self._max_column_id, max_num_columns)
     max_num_rows = min(self._max_row_id, max_num_rows)
     return max_num_rows, max_num_columns, max_num_tokens
 
   def _get_table_cost(self, table, num_columns,
                       num_rows, num_tokens):
-    return sum(1 for _ in self._get_table_values(table, num_columns, num_rows,
-                                                 num_tokens))
-
-  def _get_column_values(
-      self, table,
-      col_index):
-    table_numeric_values = {}
-    for row_index, row in enumerate(table.rows):
-      cell = row.cells[col_index]
-      if cell.HasField('numeric_value'):
-        table_numeric_values[row_index] = cell.numeric_value
-    return table_numeric_values
-
-  def _add_numeric_column_ranks(self, column_ids, row_ids,
-                                table,
-                                features):
-    """Adds column ranks for all numeric columns."""
-
-    ranks = [0] * len(column_ids)
-    inv_ranks = [0] * len(column_ids)
-
-    if table:
-      for col_index in range(len(table.columns)):
-        table_numeric_values = self._get_column_values(table, col_index)
-        if not table_numeric_values:
-          continue
-
-        try:
-          key_fn = number_annotation_utils.get_numeric_sort_key_fn(
-              table_numeric_values.values())
-        except ValueError:
-          continue
+    return len(
+        self._get_table_token_indexes(table, num_columns, num_rows, num_tokens))
 
-        table_numeric_values = {
-            row_index: key_fn(value)
-            for row_index, value in table_numeric_values.items()
-        }
+  def _get_table_costs(self, table, num_columns,
+                       num_rows):
+    """Computes the table cost for all possible per-cell token budgets.
 
-        table_numeric_values_inv = collections.defaultdict(list)
-        for row_index, value in table_numeric_values.items():
-          table_numeric_values_inv[value].append(row_index)
-
-        unique_values = sorted(table_numeric_values_inv.keys())
-
-        for rank, value in enumerate(unique_values):
-          for row_index in table_numeric_values_inv[value]:
-            for index in _get_cell_token_indexes(column_ids, row_ids, col_index,
-                                                 row_index):
-              ranks[index] = rank + 1
-              inv_ranks[index] = len(unique_values) - rank
-
-    features['column_ranks'] = create_int_feature(ranks)
-    features['inv_column_ranks'] = create_int_feature(inv_ranks)
-
-  def _get_numeric_sort_key_fn(self, table_numeric_values, value):
-    """Returns the sort key function for comparing value to table values.
-
-    The function returned will be a suitable input for the key param of the
-    sort(). See number_annotation_utils._get_numeric_sort_key_fn for details.
+    Builds a histogram of the word begin indexes of all tokens in a single pass.
+    A token is included if the first piece of its word is within the budget, so
+    the cost of budget 't' is the number of tokens with a begin index below 't'.
 
     Args:
-      table_numeric_values: Numeric values of a column
-      value: Numeric value in the question.
+      table: Tokenized table.
+      num_columns: Number of columns to include.
+      num_rows: Number of rows to include (excluding the header).
 
     Returns:
-      A function key function to compare column and question values.
-
+      A non-decreasing list where entry 't' equals
+      `_get_table_cost(table, num_columns, num_rows, num_tokens=t)` for 't' in
+      0 ... max number of tokens per cell.
     """
-    if not table_numeric_values:
-      return None
-    all_values = list(table_numeric_values.values())
-    all_values.append(value)
-    try:
-      return number_annotation_utils.get_numeric_sort_key_fn(all_values)
-    except ValueError:
-      return None
+    _, _, max_num_tokens = self._get_table_boundaries(table)
+    # First row is header row.
+    is_selected = ((table.row_indexes < num_rows + 1) &
+                   (table.column_indexes < num_columns))
+    # Begin indexes start at -1 for cells that start with an inner word piece.
+    histogram = np.bincount(
+        table.word_begin_indexes[is_selected] + 1,
+        minlength=max_num_tokens + 1)
+    return np.cumsum(histogram).tolist()
+
+  def _get_numeric_profile(
+      self, table,
+      cached_table):
+    """Returns the numeric profile, computed once per table cache entry."""
+    with self._time('numeric_profile'):
+      if cached_table.numeric_profile is None:
+        cached_table.numeric_profile = _NumericTableProfile(table)
+      return cached_table.numeric_profile
+
+  def _add_numeric_column_ranks(self, cell_ids,
+                                numeric_profile,
+                                features):
+    """Adds column ranks for all numeric columns."""
+    ranks = np.zeros(self._max_seq_length, dtype=np.int64)
+    inv_ranks = np.zeros(self._max_seq_length, dtype=np.int64)
+    if numeric_profile is not None:
+      ranks = _gather_cell_values(cell_ids, numeric_profile.cell_ranks, 0)
+      inv_ranks = _gather_cell_values(cell_ids, numeric_profile.cell_inv_ranks,
+                                      0)
+    features['column_ranks'] = _int_feature(ranks)
+    features['inv_column_ranks'] = _int_feature(inv_ranks)
 
   def _add_numeric_relations(self, question,
-                             column_ids, row_ids,
-                             table,
+                             cell_ids,
+                             numeric_profile,
                              features):
     """Adds numeric relation emebeddings to 'features'.
 
+    For each cell all word pieces get the set of relations the cell has with
+    any value in the question.
+
     Args:
       question: The question, numeric values are used.
-      column_ids: Maps word piece position to column id.
-      row_ids: Maps word piece position to row id.
-      table: The table containing the numeric cell values.
+      cell_ids: Maps word piece positions to flat cell ids.
+      numeric_profile: Numeric cell values of the table.
       features: Output.
     """
-
-    numeric_relations = [0 for _ in column_ids]
-
-    # Create a dictionary that maps a table cell to the set of all relations
-    # this cell has with any value in the question.
-    cell_indices_to_relations = collections.defaultdict(set)
-    if question is not None and table is not None:
-      for numeric_value_span in question.annotations.spans:
-        for value in numeric_value_span.values:
-          for column_index in range(len(table.columns)):
-            table_numeric_values = self._get_column_values(table, column_index)
-            sort_key_fn = self._get_numeric_sort_key_fn(table_numeric_values,
-                                                        value)
-            if sort_key_fn is None:
-              continue
-            for row_index, cell_value in table_numeric_values.items():
-              relation = number_annotation_utils.get_numeric_relation(
-                  value, cell_value, sort_key_fn)
-              if relation is not None:
-                cell_indices_to_relations[column_index, row_index].add(relation)
-
-    # For each cell add a special feature for all its word pieces.
-    for (column_index,
-         row_index), relations in cell_indices_to_relations.items():
-      relation_set_index = 0
-      for relation in relations:
-        assert relation.value >= constants.Relation.EQ.value
-        relation_set_index += 2**(relation.value - constants.Relation.EQ.value)
-      for cell_token_index in _get_cell_token_indexes(column_ids, row_ids,
-                                                      column_index, row_index):
-        numeric_relations[cell_token_index] = relation_set_index
-
-    features['numeric_relations'] = create_int_feature(numeric_relations)
-
-  def _add_numeric_values(self, table,
-                          token_ids_dict,
+    numeric_relations = np.zeros(self._max_seq_length, dtype=np.int64)
+    if question is not None and numeric_profile is not None:
+      numeric_relations = _gather_cell_values(
+          cell_ids, numeric_profile.get_cell_relations(question), 0)
+    features['numeric_relations'] = _int_feature(numeric_relations)
+
+  def _add_numeric_values(self, cell_ids,
+                          numeric_profile,
                           features):
     """Adds numeric values for computation of answer loss."""
-    numeric_values = [_NAN] * self._max_seq_length
-    if table:
-      for col_index in range(len(table.columns)):
-        for row_index in range(len(table.rows)):
-
-          numeric_value = table.rows[row_index].cells[col_index].numeric_value
-          if not numeric_value.HasField('float_value'):
-            continue
-
-          float_value = numeric_value.float_value
-          if float_value == float('inf'):
-            continue
-
-          for index in _get_cell_token_indexes(token_ids_dict['column_ids'],
-                                               token_ids_dict['row_ids'],
-                                               col_index, row_index):
-            numeric_values[index] = float_value
-    features['numeric_values'] = create_float_feature(numeric_values)
+    numeric_values = np.full(self._max_seq_length, _NAN)
+    if numeric_profile is not None:
+      numeric_values = _gather_cell_values(cell_ids,
+                                           numeric_profile.cell_values, _NAN)
+    features['numeric_values'] = _float_feature(numeric_values)
 
-  def _add_numeric_values_scale(self, table, token_ids_dict, features):
+  def _add_numeric_values_scale(self, table, cell_ids, features):
     """Adds a scale to each token to down weigh the value of long words."""
-    numeric_values_scale = [1.0] * self._max_seq_length
     if not table:
-      return numeric_values_scale
-    for col_index in range(len(table.columns)):
-      for row_index in range(len(table.rows)):
-        indices = [
-            index for index in _get_cell_token_indexes(
-                token_ids_dict['column_ids'], token_ids_dict['row_ids'],
-                col_index, row_index)
-        ]
-        num_indices = len(indices)
-        if num_indices > 1:
-          for index in indices:
-            numeric_values_scale[index] = float(num_indices)
-    features['numeric_values_scale'] = create_float_feature(
-        numeric_values_scale)
+      return
+    num_cells = len(table.columns) * len(table.rows)
+    cell_sizes = np.bincount(cell_ids[cell_ids >= 0], minlength=num_cells)
+    cell_scales = np.where(cell_sizes > 1, cell_sizes, 1).astype(np.float64)
+    numeric_values_scale = _gather_cell_values(cell_ids, cell_scales, 1.0)
+    features['numeric_values_scale'] = _float_feature(numeric_values_scale)
 
   def _pad_to_seq_length(self, inputs):
     while len(inputs) < self._max_seq_length:
@@ -547,7 +1035,8 @@ class ToTensorflowExampleBase:
   def _to_features(
       self, tokens, token_ids_dict,
       table,
-      question):
+      question,
+      numeric_profile = None):
     """Produces a dict of TF features."""
     tokens = list(tokens)
     token_ids_dict = {
@@ -573,23 +1062,34 @@ class ToTensorflowExampleBase:
       assert len(values) == self._max_seq_length
 
     features = collections.OrderedDict()
-    features['input_ids'] = create_int_feature(input_ids)
-    features['input_mask'] = create_int_feature(input_mask)
+    features['input_ids'] = _int_feature(input_ids)
+    features['input_mask'] = _int_feature(input_mask)
     for key, values in sorted(token_ids_dict.items()):
-      features[key] = create_int_feature(values)
+      features[key] = _int_feature(values)
 
-    self._add_numeric_column_ranks(token_ids_dict['column_ids'],
-                                   token_ids_dict['row_ids'], table, features)
+    cell_ids = None
+    if table:
+      cell_ids = _get_cell_ids(token_ids_dict['column_ids'],
+                               token_ids_dict['row_ids'], len(table.columns),
+                               len(table.rows))
+      if numeric_profile is None:
+        with self._time('numeric_profile'):
+          numeric_profile = _NumericTableProfile(table)
 
-    self._add_numeric_relations(question, token_ids_dict['column_ids'],
-                                token_ids_dict['row_ids'], table, features)
+    with self._time('numeric_features'):
+      self._add_numeric_column_ranks(cell_ids, numeric_profile, features)
 
-    self._add_numeric_values(table, token_ids_dict, features)
+    with self._time('numeric_relations'):
+      self._add_numeric_relations(question, cell_ids, numeric_profile,
+                                  features)
 
-    self._add_numeric_values_scale(table, token_ids_dict, features)
+    with self._time('numeric_features'):
+      self._add_numeric_values(cell_ids, numeric_profile, features)
+
+      self._add_numeric_values_scale(table, cell_ids, features)
 
     if table:
-      features['table_id'] = create_string_feature(
+      features['table_id'] = _string_feature(
           [table.table_id.encode('utf8')])
     return features
 
@@ -597,8 +1097,15 @@ class ToTensorflowExampleBase:
 class ToPretrainingTensorflowExample(ToTensorflowExampleBase):
   """Class for converting pretraining examples."""
 
-  def __init__(self, config):
-    super(ToPretrainingTensorflowExample, self).__init__(config)
+  def __init__(self,
+               config,
+               table_cache=None,
+               token_cache=None,
+               tokenizer_backend=TokenizerBackend.BERT,
+               stage_timer=None):
+    super(ToPretrainingTensorflowExample,
+          self).__init__(config, table_cache, token_cache, tokenizer_backend,
+                         stage_timer)
     self._max_predictions_per_seq = config.max_predictions_per_seq
     self._masked_lm_prob = config.masked_lm_prob
     self._min_question_length = config.min_question_length
@@ -609,11 +1116,13 @@ class ToPretrainingTensorflowExample(ToTensorflowExampleBase):
         (self._min_question_length + self._max_question_length) / 2,
         self._max_question_length
     ]
-    self._vocab_words = list(self._tokenizer.get_vocab())
+    self._vocab_words = np.array(
+        list(self._tokenizer.get_vocab()), dtype=object)
 
   def _to_example(self,
                   table,
-                  instance):
+                  instance,
+                  numeric_profile = None):
     """Creates TF example from TrainingInstance."""
 
     features = self._to_features(
@@ -624,7 +1133,8 @@ class ToPretrainingTensorflowExample(ToTensorflowExampleBase):
             'segment_ids': instance.segment_ids,
         },
         table=table,
-        question=None)
+        question=None,
+        numeric_profile=numeric_profile)
 
     masked_lm_positions = list(instance.masked_lm_positions)
     masked_lm_ids = self._tokenizer.convert_tokens_to_ids(
@@ -638,13 +1148,14 @@ class ToPretrainingTensorflowExample(ToTensorflowExampleBase):
 
     is_random_table = 1 if instance.is_random_table else 0
 
-    features['masked_lm_positions'] = create_int_feature(masked_lm_positions)
-    features['masked_lm_ids'] = create_int_feature(masked_lm_ids)
-    features['masked_lm_weights'] = create_float_feature(masked_lm_weights)
-    features['next_sentence_labels'] = create_int_feature([is_random_table])
-    features['is_random_table'] = create_int_feature([is_random_table])
+    features['masked_lm_positions'] = _int_feature(masked_lm_positions)
+    features['masked_lm_ids'] = _int_feature(masked_lm_ids)
+    features['masked_lm_weights'] = _float_feature(masked_lm_weights)
+    features['next_sentence_labels'] = _int_feature([is_random_table])
+    features['is_random_table'] = _int_feature([is_random_table])
 
-    return tf.train.Example(features=tf.train.Features(feature=features))
+    with self._time('proto'):
+      return _to_tf_example(features)
 
   def convert(
       self,
@@ -653,7 +1164,8 @@ class ToPretrainingTensorflowExample(ToTensorflowExampleBase):
       random_table,
   ):
     """Creates TF example from interaction."""
-    question_tokens = self._get_question_tokens(interaction, rng)
+    with self._time('tokenize_question'):
+      question_tokens = self._get_question_tokens(interaction, rng)
 
     if random_table is not None and rng.random() < 0.5:
       is_random_table = True
@@ -665,9 +1177,11 @@ class ToPretrainingTensorflowExample(ToTensorflowExampleBase):
       else:
         table = None
 
+    numeric_profile = None
     if table is None:
-      question_tokens = self._tokenizer.tokenize(
-          interaction.questions[0].original_text)
+      with self._time('tokenize_question'):
+        question_tokens = self._tokenizer.tokenize(
+            interaction.questions[0].original_text)
       question_tokens = question_tokens[:self._max_seq_length - 1]
       tokens, segment_ids, column_ids, row_ids = self._serialize_text(
           question_tokens)
@@ -681,25 +1195,32 @@ class ToPretrainingTensorflowExample(ToTensorflowExampleBase):
                             random_table.table_id, is_random_table)
 
       token_budget = self._get_token_budget(question_tokens)
-      tokenized_table = self._tokenize_table(table)
+      cached_table = self._get_cached_table(table)
+      tokenized_table = cached_table.tokenized_table
       try:
-        num_columns, num_rows, num_tokens = self._get_table_sizes(
-            token_budget, tokenized_table, rng)
+        with self._time('table_sizes'):
+          num_columns, num_rows, num_tokens = self._get_table_sizes(
+              token_budget, tokenized_table, rng)
       except ValueError:
         return None
 
-      serialized_example = self._serialize(question_tokens, tokenized_table,
-                                           num_columns, num_rows, num_tokens)
+      with self._time('serialize'):
+        serialized_example = self._serialize(question_tokens, tokenized_table,
+                                             num_columns, num_rows, num_tokens)
       tokens = serialized_example.tokens
       segment_ids = serialized_example.segment_ids
       row_ids = serialized_example.row_ids
       column_ids = serialized_example.column_ids
+      numeric_profile = self._get_numeric_profile(table, cached_table)
 
     assert len(tokens) <= self._max_seq_length
 
-    (tokens, masked_lm_positions,
-     masked_lm_labels) = self._create_masked_lm_predictions(
-         interaction, tokens, column_ids, row_ids, rng)
+    with self._time('masking'):
+      (tokens, masked_lm_positions,
+       masked_lm_labels) = self._create_masked_lm_predictions(
+           interaction, tokens, column_ids, row_ids, rng)
+    self._count('examples')
+    self._count('tokens', len(tokens))
     instance = TrainingInstance(
         tokens=tokens,
         segment_ids=segment_ids,
@@ -708,71 +1229,75 @@ class ToPretrainingTensorflowExample(ToTensorflowExampleBase):
         masked_lm_positions=masked_lm_positions,
         masked_lm_labels=masked_lm_labels,
         is_random_table=is_random_table)
-    return self._to_example(table, instance)
+    return self._to_example(table, instance, numeric_profile)
 
   def _create_masked_lm_predictions(
       self, interaction, tokens,
       column_ids, row_ids,
       rng):
-    """Creates the predictions for the masked LM objective."""
-    cand_indexes = []
-    for (i, token) in enumerate(tokens):
-      if token.piece in [_CLS, _SEP]:
-        continue
-      column_id = column_ids[i]
-      is_cell_continutation = column_id > 0 and column_id == column_ids[i - 1]
-      if not self._always_continue_cells:
-        is_cell_continutation = False
-      if cand_indexes and (_is_inner_wordpiece(token) or is_cell_continutation):
-        cand_indexes[-1].append(i)
-      else:
-        cand_indexes.append([i])
-
-    rng.shuffle(cand_indexes)
-
-    output_tokens = list(tokens)
+    """Creates the predictions for the masked LM objective.
 
+    Whole words (and whole cells if always_continue_cells is set) are masked
+    together. Group boundaries and replacements are computed with NumPy, the
+    NumPy RandomState is seeded from 'rng' so results stay reproducible.
+    """
+    pieces = np.array(list(_get_pieces(tokens)), dtype=object)
+    column_ids = np.asarray(column_ids, dtype=np.int64)
+    is_candidate = (pieces != _CLS) & (pieces != _SEP)
+    continues_group = np.array([_is_inner_wordpiece(token) for token in tokens],
+                               dtype=bool)
+    if self._always_continue_cells:
+      previous_column_ids = np.roll(column_ids, 1)
+      continues_group |= (column_ids > 0) & (column_ids == previous_column_ids)
+
+    candidate_indexes = np.flatnonzero(is_candidate)
+    starts_group = ~continues_group[candidate_indexes]
+    if starts_group.size:
+      # The first candidate always starts a group.
+      starts_group[0] = True
+    group_starts = np.flatnonzero(starts_group)
+    group_sizes = np.diff(np.append(group_starts, len(candidate_indexes)))
+
+    np_rng = np.random.RandomState(rng.getrandbits(32))
     num_to_predict = min(self._max_predictions_per_seq,
                          max(1, int(round(len(tokens) * self._masked_lm_prob))))
 
-    masked_lms = []
-    covered_indexes = set()
-    for index_set in cand_indexes:
-      if len(masked_lms) >= num_to_predict:
+    selected_groups = []
+    num_selected = 0
+    for group in np_rng.permutation(len(group_starts)).tolist():
+      if num_selected >= num_to_predict:
         break
       # If adding a whole-word mask would exceed the maximum number of
       # predictions, then just skip this candidate.
-      if len(masked_lms) + len(index_set) > num_to_predict:
+      if num_selected + group_sizes[group] > num_to_predict:
         continue
+      selected_groups.append(group)
+      num_selected += group_sizes[group]
+    assert num_selected <= num_to_predict
+
+    is_masked = np.zeros(len(candidate_indexes), dtype=bool)
+    for group in selected_groups:
+      begin = group_starts[group]
+      is_masked[begin:begin + group_sizes[group]] = True
+    masked_lm_positions = candidate_indexes[is_masked]
+
+    # 80% of the time replace with [MASK], 10% of the time keep the original
+    # and 10% of the time replace with a random word.
+    draws = np_rng.random_sample(len(masked_lm_positions))
+    random_words = np_rng.randint(
+        len(self._vocab_words), size=len(masked_lm_positions))
+    masked_pieces = np.where(
+        draws < 0.8, _MASK,
+        np.where(draws < 0.9, pieces[masked_lm_positions],
+                 self._vocab_words[random_words]))
 
-      for index in index_set:
-        assert index not in covered_indexes
-        covered_indexes.add(index)
-
-        masked_token = None
-        # 80% of the time, replace with [MASK]
-        if rng.random() < 0.8:
-          masked_token = _MASK
-        else:
-          # 10% of the time, keep original
-          if rng.random() < 0.5:
-            masked_token = tokens[index].piece
-          # 10% of the time, replace with random word
-          else:
-            masked_token = rng.choice(self._vocab_words)
-
-        output_tokens[index] = Token(tokens[index].original_text, masked_token)
-
-        masked_lms.append(
-            MaskedLmInstance(index=index, label=tokens[index].piece))
-    assert len(masked_lms) <= num_to_predict
-    masked_lms = sorted(masked_lms, key=lambda x: x.index)
+    output_tokens = list(tokens)
+    for index, masked_piece in zip(masked_lm_positions.tolist(),
+                                   masked_pieces.tolist()):
+      output_tokens[index] = Token(tokens[index].original_text, masked_piece)
 
-    masked_lm_positions = []
-    masked_lm_labels = []
-    for p in masked_lms:
-      masked_lm_positions.append(p.index)
-      masked_lm_labels.append(p.label)
+    masked_lm_positions = masked_lm_positions.tolist()
+    masked_lm_labels = pieces[masked_lm_positions].tolist()
 
     return (output_tokens, masked_lm_positions, masked_lm_labels)
 
@@ -807,33 +1332,35 @@ class ToPretrainingTensorflowExample(ToTensorflowExampleBase):
   def _get_table_sizes(self, token_budget, table,
                        rng):
     """Computes column, row and token count for table."""
+    max_num_rows, max_num_columns, max_num_tokens = self._get_table_boundaries(
+        table)
+    cost_index = _TableCostIndex(
+        table,
+        max_num_columns=max(max_num_columns, 1),
+        max_num_rows=max(max_num_rows, 1),
+        max_num_tokens=max(max_num_tokens, 1))
+
     num_columns = 1
     num_rows = 1
     num_tokens = 1
-    table_cost = self._get_table_cost(table, num_columns, num_rows, num_tokens)
+    table_cost = cost_index.get_cost(num_columns, num_rows, num_tokens)
     if table_cost > token_budget:
       raise ValueError('Cannot create table that fits budget')
 
-    max_num_rows, max_num_columns, max_num_tokens = self._get_table_boundaries(
-        table)
-
     while (num_columns < max_num_columns or num_rows < max_num_rows or
            num_tokens < max_num_tokens):
       if num_columns < max_num_columns and rng.random() < 0.5:
-        cost = self._get_table_cost(table, num_columns + 1, num_rows,
-                                    num_tokens)
+        cost = cost_index.get_cost(num_columns + 1, num_rows, num_tokens)
         if cost > token_budget:
           break
         num_columns += 1
       if num_rows < max_num_rows and rng.random() < 0.5:
-        cost = self._get_table_cost(table, num_columns, num_rows + 1,
-                                    num_tokens)
+        cost = cost_index.get_cost(num_columns, num_rows + 1, num_tokens)
         if cost > token_budget:
           break
         num_rows += 1
       if num_tokens < max_num_tokens and rng.random() < 0.5:
-        cost = self._get_table_cost(table, num_columns, num_rows,
-                                    num_tokens + 1)
+        cost = cost_index.get_cost(num_columns, num_rows, num_tokens + 1)
         if cost > token_budget:
           break
         num_tokens += 1
@@ -845,25 +1372,54 @@ class ToPretrainingTensorflowExample(ToTensorflowExampleBase):
 class ToTrimmedTensorflowExample(ToTensorflowExampleBase):
   """Helper that allows squeezing a table into the max seq length."""
 
+  def _prepare_table(self, table,
+                     cached_table,
+                     num_columns,
+                     num_rows):
+    """Computes the question independent data of a table."""
+    tokenized_table = cached_table.tokenized_table
+    with self._time('table_costs'):
+      table_costs = self._get_table_costs(tokenized_table, num_columns,
+                                          num_rows)
+    numeric_profile = self._get_numeric_profile(table, cached_table)
+    return _PreparedTable(
+        tokenized_table=tokenized_table,
+        num_columns=num_columns,
+        num_rows=num_rows,
+        table_costs=table_costs,
+        numeric_profile=numeric_profile,
+    )
+
   def _to_trimmed_features(
       self,
       question,
       table,
       question_tokens,
-      tokenized_table,
-      num_columns,
-      num_rows,
+      prepared_table,
   ):
     """Finds optiomal number of table tokens to include and serializes."""
-    num_tokens = self._get_max_num_tokens(
-        question_tokens,
-        tokenized_table,
-        num_rows=num_rows,
-        num_columns=num_columns,
-    )
+    with self._time('max_num_tokens'):
+      num_tokens = self._get_max_num_tokens(
+          question_tokens,
+          prepared_table.tokenized_table,
+          num_rows=prepared_table.num_rows,
+          num_columns=prepared_table.num_columns,
+          table_costs=prepared_table.table_costs,
+      )
 
-    serialized_example = self._serialize(question_tokens, tokenized_table,
-                                         num_columns, num_rows, num_tokens)
+    with self._time('serialize'):
+      if num_tokens not in prepared_table.table_token_indexes:
+        prepared_table.table_token_indexes[num_tokens] = (
+            self._get_table_token_indexes(prepared_table.tokenized_table,
+                                          prepared_table.num_columns,
+                                          prepared_table.num_rows, num_tokens))
+      serialized_example = self._serialize(
+          question_tokens,
+          prepared_table.tokenized_table,
+          prepared_table.num_columns,
+          prepared_table.num_rows,
+          num_tokens,
+          table_token_indexes=prepared_table.table_token_indexes[num_tokens])
 
     assert len(serialized_example.tokens) <= self._max_seq_length
 
@@ -873,7 +1429,11 @@ class ToTrimmedTensorflowExample(ToTensorflowExampleBase):
         'segment_ids': serialized_example.segment_ids,
     }
     features = self._to_features(
-        serialized_example.tokens, feature_dict, table=table, question=question)
+        serialized_example.tokens,
+        feature_dict,
+        table=table,
+        question=question,
+        numeric_profile=prepared_table.numeric_profile)
     return serialized_example, features
 
   def _get_max_num_tokens(
@@ -882,16 +1442,17 @@ class ToTrimmedTensorflowExample(ToTensorflowExampleBase):
       tokenized_table,
       num_columns,
       num_rows,
+      table_costs = None,
   ):
     """Computes max number of tokens that can be squeezed into the budget."""
     token_budget = self._get_token_budget(question_tokens)
-    _, _, max_num_tokens = self._get_table_boundaries(tokenized_table)
-    num_tokens = 0
-    for num_tokens in range(max_num_tokens + 1):
-      cost = self._get_table_cost(tokenized_table, num_columns, num_rows,
-                                  num_tokens + 1)
-      if cost > token_budget:
-        break
+    if table_costs is None:
+      table_costs = self._get_table_costs(tokenized_table, num_columns,
+                                          num_rows)
+    max_num_tokens = len(table_costs) - 1
+    # Costs are non-decreasing so we can search for the largest budget that
+    # still fits.
+    num_tokens = max(bisect.bisect_right(table_costs, token_budget) - 1, 0)
     if num_tokens < max_num_tokens:
       if num_tokens == 0:
         raise ValueError('Sequence too long')
@@ -901,8 +1462,15 @@ class ToTrimmedTensorflowExample(ToTensorflowExampleBase):
 class ToClassifierTensorflowExample(ToTrimmedTensorflowExample):
   """Class for converting finetuning examples."""
 
-  def __init__(self, config):
-    super(ToClassifierTensorflowExample, self).__init__(config)
+  def __init__(self,
+               config,
+               table_cache=None,
+               token_cache=None,
+               tokenizer_backend=TokenizerBackend.BERT,
+               stage_timer=None):
+    super(ToClassifierTensorflowExample,
+          self).__init__(config, table_cache, token_cache, tokenizer_backend,
+                         stage_timer)
     self._add_aggregation_candidates = config.add_aggregation_candidates
 
   def _add_question_numeric_values(self, question,
@@ -922,14 +1490,12 @@ class ToClassifierTensorflowExample(ToTrimmedTensorflowExample):
             question_numeric_values[count] = value.float_value
           count += 1
 
-    features['question_numeric_values'] = create_float_feature(
+    features['question_numeric_values'] = _float_feature(
         question_numeric_values)
 
-  def convert(self, interaction,
-              index):
-    """Converts question at 'index' to example."""
-    table = interaction.table
-
+  def _prepare_interaction_table(
+      self, table):
+    """Checks the table size and computes question independent data."""
     num_rows = len(table.rows)
     if num_rows >= self._max_row_id:
       raise ValueError('Too many rows')
@@ -938,58 +1504,135 @@ class ToClassifierTensorflowExample(ToTrimmedTensorflowExample):
     if num_columns >= self._max_column_id:
       raise ValueError('Too many columns')
 
+    cached_table = self._get_cached_table(table)
+    return self._prepare_table(table, cached_table, num_columns, num_rows)
+
+  def convert(self, interaction,
+              index):
+    """Converts question at 'index' to example."""
+    prepared_table = self._prepare_interaction_table(interaction.table)
+    features, _ = self._convert_question(interaction, index, prepared_table)
+    with self._time('proto'):
+      return _to_tf_example(features)
+
+  def convert_interaction(
+      self,
+      interaction,
+      serialize = False,
+  ):
+    """Converts all questions of an interaction.
+
+    Tokenization of the table and the table features that don't depend on the
+    question are computed once. The answer ids of a question are reused as the
+    previous answer ids of the next question if both have the same layout.
+
+    Args:
+      interaction: Interaction with numeric values.
+      serialize: If true, the examples are directly encoded to serialized
+        tf.train.Example protos without building the proto objects.
+
+    Returns:
+      For every question the example or the ValueError raised while converting
+      it. The examples are identical to the output of 'convert'.
+    """
+    try:
+      prepared_table = self._prepare_interaction_table(interaction.table)
+    except ValueError as e:
+      return [e] * len(interaction.questions)
+
+    outputs = []
+    prev_serialized_example = None
+    for index in range(len(interaction.questions)):
+      try:
+        features, prev_serialized_example = self._convert_question(
+            interaction, index, prepared_table, prev_serialized_example)
+        with self._time('proto'):
+          if serialize:
+            outputs.append(_encode_example(features))
+          else:
+            outputs.append(_to_tf_example(features))
+      except ValueError as e:
+        prev_serialized_example = None
+        outputs.append(e)
+    return outputs
+
+  def _convert_question(
+      self,
+      interaction,
+      index,
+      prepared_table,
+      prev_serialized_example = None,
+  ):
+    """Converts question at 'index' to features.
+
+    Args:
+      interaction: Interaction with numeric values.
+      index: Index of the question to convert.
+      prepared_table: Question independent data of the interaction table.
+      prev_serialized_example: Serialized example and answer ids of the
+        previous question if available.
+
+    Returns:
+      The features and a tuple of the serialized example and answer ids.
+    """
+    table = interaction.table
     question = interaction.questions[index]
     if not interaction.questions[index].answer.is_valid:
       raise ValueError('Invalid answer')
 
-    question_tokens = self._tokenizer.tokenize(question.text)
-
-    tokenized_table = self._tokenize_table(table)
+    with self._time('tokenize_question'):
+      question_tokens = self._tokenizer.tokenize(question.text)
 
     serialized_example, features = self._to_trimmed_features(
         question=question,
         table=table,
         question_tokens=question_tokens,
-        tokenized_table=tokenized_table,
-        num_columns=num_columns,
-        num_rows=num_rows)
+        prepared_table=prepared_table)
 
     column_ids = serialized_example.column_ids
-    row_ids = serialized_example.row_ids
-    answer_ids = _get_answer_ids(column_ids, row_ids, question)
+    cell_index = serialized_example.cell_index
+    answer_ids = _get_answer_ids(column_ids, cell_index, question)
     self._pad_to_seq_length(answer_ids)
-    features['label_ids'] = create_int_feature(answer_ids)
+    features['label_ids'] = _int_feature(answer_ids)
 
     if index == 0:
       prev_answer_ids = [0] * len(column_ids)
+    elif (prev_serialized_example is not None and
+          prev_serialized_example[0].column_ids == column_ids and
+          prev_serialized_example[0].row_ids == serialized_example.row_ids):
+      # Same cells at the same positions, the previous answer maps to the same
+      # ids.
+      prev_answer_ids = list(prev_serialized_example[1][:len(column_ids)])
     else:
       prev_answer_ids = _get_answer_ids(
           column_ids,
-          row_ids,
+          cell_index,
           interaction.questions[index - 1],
       )
     self._pad_to_seq_length(prev_answer_ids)
-    features['prev_label_ids'] = create_int_feature(prev_answer_ids)
-    features['question_id'] = create_string_feature(
+    features['prev_label_ids'] = _int_feature(prev_answer_ids)
+    features['question_id'] = _string_feature(
         [question.id.encode('utf8')])
-    features['question_id_ints'] = create_int_feature(
+    features['question_id_ints'] = _int_feature(
         text_utils.str_to_ints(
             question.id, length=text_utils.DEFAULT_INTS_LENGTH))
-    features['aggregation_function_id'] = create_int_feature(
+    features['aggregation_function_id'] = _int_feature(
         [question.answer.aggregation_function])
-    features['classification_class_index'] = create_int_feature(
+    features['classification_class_index'] = _int_feature(
         [question.answer.class_index])
 
     answer = question.answer.float_value if question.answer.HasField(
         'float_value') else _NAN
-    features['answer'] = create_float_feature([answer])
+    features['answer'] = _float_feature([answer])
 
     self._add_question_numeric_values(question, features)
 
     if self._add_aggregation_candidates:
       rng = random.Random(fingerprint(question.id))
 
-      candidates = interpretation_utils.find_candidates(rng, table, question)
+      with self._time('candidates'):
+        candidates = interpretation_utils.find_candidates(
+            rng, table, question)
       num_initial_candidates = len(candidates)
 
       candidates = [c for c in candidates if len(c.rows) < _MAX_NUM_ROWS]
@@ -1003,7 +1646,7 @@ class ToClassifierTensorflowExample(ToTrimmedTensorflowExample):
       for index, candidate in enumerate(candidates):
         token_indexes = []
         for row in candidate.rows:
-          token_indexes += _get_cell_token_indexes(column_ids, row_ids,
+          token_indexes += _get_cell_token_indexes(cell_index,
                                                    candidate.column, row)
         if len(indexes) + len(serialized_example.tokens) > _MAX_INDEX_LENGTH:
           break
@@ -1013,17 +1656,19 @@ class ToClassifierTensorflowExample(ToTrimmedTensorflowExample):
         indexes += token_indexes
 
       # <int>[1]
-      features['cand_num'] = create_int_feature([num_final_candidates])
+      features['cand_num'] = _int_feature([num_final_candidates])
       # <int>[_MAX_NUM_CANDIDATES]
-      features['can_aggregation_function_ids'] = create_int_feature(funs)
+      features['can_aggregation_function_ids'] = _int_feature(funs)
       # <int>[_MAX_NUM_CANDIDATES]
-      features['can_sizes'] = create_int_feature(sizes)
+      features['can_sizes'] = _int_feature(sizes)
       # <int>[_MAX_INDEX_LENGTH]
       # Actual length is sum(sizes).
-      features['can_indexes'] = create_int_feature(indexes)
+      features['can_indexes'] = _int_feature(indexes)
 
 
-    return tf.train.Example(features=tf.train.Features(feature=features))
+    self._count('examples')
+    self._count('tokens', len(serialized_example.tokens))
+    return features, (serialized_example, answer_ids)
 
   def get_empty_example(self):
     interaction = interaction_pb2.Interaction(questions=[
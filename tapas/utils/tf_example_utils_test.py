@@ -14,16 +14,22 @@
 # limitations under the License.
 # Lint as: python3
 
+import collections
 import math
 import os
+import random
 import tempfile
 
 from absl import logging
 from absl.testing import absltest
 from tapas.protos import interaction_pb2
+from tapas.utils import cache_utils
 from tapas.utils import number_annotation_utils
 from tapas.utils import text_utils
 from tapas.utils import tf_example_utils
+import tensorflow.compat.v1 as tf
+
+from google.protobuf import text_format
 
 _RESERVED_SYMBOLS = ('[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]', '[EMPTY]')
 _NAN = float('nan')
@@ -54,6 +60,85 @@ def _create_vocab(vocab_file, tokens):
       output_file.write(f'{token}\n')
 
 
+def _tokenize_test_table(input_dir):
+  """Creates a converter and a table with multi word piece cells."""
+  vocab_file = os.path.join(input_dir, 'vocab.txt')
+  _create_vocab(vocab_file, ['a', 'b', '##b', 'c', '##c'])
+  converter = tf_example_utils.ToClassifierTensorflowExample(
+      config=tf_example_utils.ClassifierConversionConfig(
+          vocab_file=vocab_file,
+          max_seq_length=32,
+          max_column_id=32,
+          max_row_id=32,
+          strip_column_names=False,
+          add_aggregation_candidates=False,
+      ))
+  table = interaction_pb2.Table(
+      columns=[
+          interaction_pb2.Cell(text='a'),
+          interaction_pb2.Cell(text='b c'),
+      ],
+      rows=[
+          interaction_pb2.Cells(cells=[
+              interaction_pb2.Cell(text='abbb a'),
+              interaction_pb2.Cell(text='c'),
+          ]),
+          interaction_pb2.Cells(cells=[
+              interaction_pb2.Cell(text='b cc a'),
+              interaction_pb2.Cell(text='a b c'),
+          ]),
+      ],
+  )
+  return converter, converter._tokenize_table(table)
+
+
+def _create_pretraining_converter(input_dir, tokens, always_continue_cells,
+                                  max_predictions_per_seq, masked_lm_prob):
+  vocab_file = os.path.join(input_dir, 'vocab.txt')
+  _create_vocab(vocab_file, tokens)
+  return tf_example_utils.ToPretrainingTensorflowExample(
+      config=tf_example_utils.PretrainConversionConfig(
+          vocab_file=vocab_file,
+          max_seq_length=64,
+          max_predictions_per_seq=max_predictions_per_seq,
+          random_seed=1,
+          masked_lm_prob=masked_lm_prob,
+          max_column_id=32,
+          max_row_id=32,
+          min_question_length=1,
+          max_question_length=8,
+          always_continue_cells=always_continue_cells,
+          strip_column_names=False,
+      ))
+
+
+def _get_masking_input():
+  """Returns a question and a 2x2 table as (pieces, column_ids, row_ids)."""
+  cells = [
+      (['[CLS]', 'a', '##b', 'c', '[SEP]'], 0, 0),
+      (['d', '##d', 'e'], 1, 0),
+      (['f'], 2, 0),
+      (['g', 'h'], 1, 1),
+      (['i', '##i'], 2, 1),
+  ]
+  pieces = []
+  column_ids = []
+  row_ids = []
+  for cell_pieces, column_id, row_id in cells:
+    pieces.extend(cell_pieces)
+    column_ids.extend([column_id] * len(cell_pieces))
+    row_ids.extend([row_id] * len(cell_pieces))
+  tokens = [tf_example_utils.Token(piece, piece) for piece in pieces]
+  return tokens, column_ids, row_ids
+
+
+def _get_masking_groups(always_continue_cells):
+  """Positions of the pieces that have to be masked together."""
+  if always_continue_cells:
+    return [[1, 2], [3], [5, 6, 7], [8], [9, 10], [11, 12]]
+  return [[1, 2], [3], [5, 6], [7], [8], [9], [10], [11, 12]]
+
+
 class TfExampleUtilsTest(absltest.TestCase):
 
   def test_get_empty_example(self):
@@ -134,5 +219,364 @@ class TfExampleUtilsTest(absltest.TestCase):
           _get_float_feature(example, 'question_numeric_values'),
           _clean_nans([2.0] + [_NAN] * (_MAX_NUMERIC_VALUES - 1)))
 
+  def test_convert_with_table_cache(self):
+    with tempfile.TemporaryDirectory() as input_dir:
+      vocab_file = os.path.join(input_dir, 'vocab.txt')
+      _create_vocab(vocab_file, ['a', 'b', '##b', 'c', '##c'])
+      config = tf_example_utils.ClassifierConversionConfig(
+          vocab_file=vocab_file,
+          max_seq_length=32,
+          max_column_id=32,
+          max_row_id=32,
+          strip_column_names=False,
+          add_aggregation_candidates=False,
+      )
+      table_cache = cache_utils.LruCache(max_size=4)
+      cached_converter = tf_example_utils.ToClassifierTensorflowExample(
+          config, table_cache=table_cache)
+      converter = tf_example_utils.ToClassifierTensorflowExample(config)
+      interaction = interaction_pb2.Interaction(
+          table=interaction_pb2.Table(
+              columns=[interaction_pb2.Cell(text='a')],
+              rows=[
+                  interaction_pb2.Cells(
+                      cells=[interaction_pb2.Cell(text='abb')]),
+                  interaction_pb2.Cells(cells=[interaction_pb2.Cell(text='c')]),
+              ],
+          ),
+          questions=[
+              interaction_pb2.Question(id='id_0', original_text='a c'),
+              interaction_pb2.Question(id='id_1', original_text='b'),
+          ],
+      )
+      number_annotation_utils.add_numeric_values(interaction)
+      for index in range(len(interaction.questions)):
+        self.assertEqual(
+            cached_converter.convert(interaction, index).SerializeToString(
+                deterministic=True),
+            converter.convert(interaction,
+                              index).SerializeToString(deterministic=True))
+      # The tokenized table and the numeric profile are computed once and
+      # share a cache entry.
+      self.assertEqual(table_cache.hits, 1)
+      self.assertEqual(table_cache.misses, 1)
+      self.assertLen(table_cache, 1)
+
+  def test_convert_interaction(self):
+    with tempfile.TemporaryDirectory() as input_dir:
+      vocab_file = os.path.join(input_dir, 'vocab.txt')
+      _create_vocab(vocab_file, ['a', 'b', '##b', 'c', '##c', '1', '2'])
+      config = tf_example_utils.ClassifierConversionConfig(
+          vocab_file=vocab_file,
+          max_seq_length=16,
+          max_column_id=32,
+          max_row_id=32,
+          strip_column_names=False,
+          add_aggregation_candidates=False,
+      )
+      converter = tf_example_utils.ToClassifierTensorflowExample(config)
+      interaction = text_format.Parse(
+          """
+          table {
+            columns { text: 'a' }
+            columns { text: 'b' }
+            rows {
+              cells { text: 'abb c' }
+              cells { text: '1' }
+            }
+            rows {
+              cells { text: 'c' }
+              cells { text: '2' }
+            }
+          }
+          questions {
+            id: 'id_0' original_text: 'a c' answer {
+              is_valid: true answer_coordinates { row_index: 1 column_index: 0 }
+            }
+          }
+          questions {
+            id: 'id_1' original_text: 'b a' answer {
+              is_valid: true answer_coordinates { row_index: 0 column_index: 1 }
+            }
+          }
+          questions {
+            id: 'id_2' original_text: 'b c b c 1 2' answer {
+              is_valid: true answer_coordinates { row_index: 1 column_index: 1 }
+            }
+          }
+          questions { id: 'id_3' original_text: 'c' answer { is_valid: false } }
+          questions {
+            id: 'id_4' original_text: 'a' answer { is_valid: true }
+          }
+          """, interaction_pb2.Interaction())
+      number_annotation_utils.add_numeric_values(interaction)
+
+      outputs = converter.convert_interaction(interaction)
+
+      self.assertLen(outputs, len(interaction.questions))
+      for index, output in enumerate(outputs):
+        try:
+          expected = converter.convert(interaction, index)
+        except ValueError as e:
+          self.assertIsInstance(output, ValueError)
+          self.assertEqual(str(output), str(e))
+          continue
+        self.assertEqual(
+            output.SerializeToString(deterministic=True),
+            expected.SerializeToString(deterministic=True))
+      self.assertEqual(str(outputs[3]), 'Invalid answer')
+
+  def test_tokenize_with_token_cache(self):
+    with tempfile.TemporaryDirectory() as input_dir:
+      vocab_file = os.path.join(input_dir, 'vocab.txt')
+      _create_vocab(vocab_file, ['a', 'b', '##b'])
+      token_cache = cache_utils.LruCache(max_size=4)
+      cached_tokenizer = tf_example_utils.TapasTokenizer(
+          vocab_file, token_cache=token_cache)
+      tokenizer = tf_example_utils.TapasTokenizer(vocab_file)
+      for text in ['abb a', 'n/a', 'abb a', 'B']:
+        tokens = cached_tokenizer.tokenize(text)
+        self.assertIsInstance(tokens, list)
+        self.assertEqual(tokens, tokenizer.tokenize(text))
+        # Modifying the result must not modify the cached tokens.
+        tokens.append(tf_example_utils.Token('c', 'c'))
+      self.assertEqual(token_cache.hits, 1)
+      self.assertEqual(token_cache.misses, 3)
+
+  def test_get_cell_token_index(self):
+    column_ids = [0, 0, 1, 2, 1, 1, 2, 0]
+    row_ids = [0, 0, 0, 0, 1, 1, 1, 0]
+    cell_index = tf_example_utils._get_cell_token_index(column_ids, row_ids)
+    self.assertEqual(cell_index, {
+        (-1, -1): [0, 1, 7],
+        (0, -1): [2],
+        (1, -1): [3],
+        (0, 0): [4, 5],
+        (1, 0): [6],
+    })
+    self.assertEqual(
+        tf_example_utils._get_cell_token_indexes(cell_index, 1, 1), [])
+
+  def test_get_table_costs(self):
+    with tempfile.TemporaryDirectory() as input_dir:
+      converter, tokenized_table = _tokenize_test_table(input_dir)
+      for num_columns in range(1, 3):
+        for num_rows in range(3):
+          costs = converter._get_table_costs(tokenized_table, num_columns,
+                                             num_rows)
+          self.assertEqual(costs, [
+              converter._get_table_cost(tokenized_table, num_columns,
+                                        num_rows, num_tokens)
+              for num_tokens in range(len(costs))
+          ])
+      self.assertEqual(
+          converter._get_table_costs(tokenized_table, 2, 2),
+          [0, 9, 13, 14, 15, 16])
+
+  def test_table_cost_index(self):
+    with tempfile.TemporaryDirectory() as input_dir:
+      converter, tokenized_table = _tokenize_test_table(input_dir)
+      cost_index = tf_example_utils._TableCostIndex(
+          tokenized_table, max_num_columns=2, max_num_rows=3, max_num_tokens=5)
+      for num_columns in range(3):
+        for num_rows in range(4):
+          for num_tokens in range(7):
+            self.assertEqual(
+                cost_index.get_cost(num_columns, num_rows, num_tokens),
+                converter._get_table_cost(tokenized_table, num_columns,
+                                          num_rows, num_tokens))
+
+  def test_get_cell_ids(self):
+    column_ids = [0, 0, 1, 2, 1, 1, 2, 3, 0]
+    row_ids = [0, 0, 0, 0, 1, 1, 2, 1, 0]
+    self.assertEqual(
+        tf_example_utils._get_cell_ids(
+            column_ids, row_ids, num_columns=2, num_rows=2).tolist(),
+        [-1, -1, -1, -1, 0, 0, 3, -1, -1])
+
+  def test_get_ranks(self):
+    ranks, num_unique_values = tf_example_utils._get_ranks([3.0, 1.0, 3.0, 2.0])
+    self.assertEqual(ranks.tolist(), [2, 0, 2, 1])
+    self.assertEqual(num_unique_values, 3)
+    ranks, num_unique_values = tf_example_utils._get_ranks([(2001.0, 3.0),
+                                                            (2001.0, 1.0),
+                                                            (1999.0, 5.0)])
+    self.assertEqual(ranks.tolist(), [2, 1, 0])
+    self.assertEqual(num_unique_values, 3)
+
+  def test_numeric_table_profile(self):
+    table = interaction_pb2.Table(
+        columns=[interaction_pb2.Cell(text='a'),
+                 interaction_pb2.Cell(text='b')],
+        rows=[
+            interaction_pb2.Cells(cells=[
+                interaction_pb2.Cell(text='2'),
+                interaction_pb2.Cell(text='May 2001')
+            ]),
+            interaction_pb2.Cells(cells=[
+                interaction_pb2.Cell(text='1'),
+                interaction_pb2.Cell(text='2000')
+            ]),
+            interaction_pb2.Cells(cells=[
+                interaction_pb2.Cell(text='2'),
+                interaction_pb2.Cell(text='June 3, 1999')
+            ]),
+        ])
+    number_annotation_utils.add_numeric_table_values(table)
+    interaction = interaction_pb2.Interaction(questions=[
+        interaction_pb2.Question(original_text='was it 2 or 2000 in march 2000')
+    ])
+    number_annotation_utils.add_numeric_values_to_questions(interaction)
+    question = interaction.questions[0]
+    profile = tf_example_utils._NumericTableProfile(table)
+    self.assertEqual(profile.cell_ranks.tolist(), [2, 1, 2, 3, 2, 1])
+    self.assertEqual(profile.cell_inv_ranks.tolist(), [1, 2, 1, 1, 2, 3])
+    self.assertEqual(profile.cell_values[:3].tolist(), [2.0, 1.0, 2.0])
+    self.assertTrue(all(math.isnan(value) for value in profile.cell_values[3:]))
+
+    relations = [0] * 6
+    for span in question.annotations.spans:
+      for value in span.values:
+        for column_index in range(2):
+          column_values = [row.cells[column_index].numeric_value
+                           for row in table.rows]
+          try:
+            sort_key_fn = number_annotation_utils.get_numeric_sort_key_fn(
+                column_values + [value])
+          except ValueError:
+            continue
+          for row_index, cell_value in enumerate(column_values):
+            relation = number_annotation_utils.get_numeric_relation(
+                value, cell_value, sort_key_fn)
+            relations[column_index * 3 + row_index] |= (
+                tf_example_utils._get_relation_bit(relation))
+    self.assertEqual(relations, [5, 4, 5, 2, 1, 4])
+    self.assertEqual(profile.get_cell_relations(question).tolist(), relations)
+
+  def test_encode_example(self):
+    features = {
+        'ints':
+            tf_example_utils._int_feature(
+                [0, 1, 127, 128, 300, -1, 2**63 - 1, -2**63]),
+        'floats':
+            tf_example_utils._float_feature([1.5, _NAN, 1e300, -2.0, 1e-50]),
+        'strings':
+            tf_example_utils._string_feature([b'', b'a' * 200]),
+        'no_ints':
+            tf_example_utils._int_feature([]),
+        'no_floats':
+            tf_example_utils._float_feature([]),
+    }
+    serialized_example = tf_example_utils._encode_example(features)
+    # The order of map entries in serialized protos is not defined, so the
+    # parsed protos are compared. Text format prints map entries sorted by key
+    # and NaN values compare equal.
+    self.assertEqual(
+        text_format.MessageToString(
+            tf.train.Example.FromString(serialized_example)),
+        text_format.MessageToString(
+            tf_example_utils._to_tf_example(features)))
+
+    with tf.Graph().as_default():
+      parsed = tf.io.parse_single_example(
+          serialized_example, {
+              'ints': tf.io.FixedLenFeature([8], tf.int64),
+              'floats': tf.io.FixedLenFeature([5], tf.float32),
+              'strings': tf.io.FixedLenFeature([2], tf.string),
+          })
+      with tf.Session() as session:
+        parsed = session.run(parsed)
+    self.assertEqual(parsed['ints'].tolist(),
+                     [0, 1, 127, 128, 300, -1, 2**63 - 1, -2**63])
+    floats = parsed['floats'].tolist()
+    self.assertEqual(floats[0], 1.5)
+    self.assertTrue(math.isnan(floats[1]))
+    self.assertEqual(floats[2], float('inf'))
+    self.assertEqual(floats[3:], [-2.0, 0.0])
+    self.assertEqual(parsed['strings'].tolist(), [b'', b'a' * 200])
+
+
+  def test_masking_is_reproducible(self):
+    with tempfile.TemporaryDirectory() as input_dir:
+      vocab = ['a', '##b', 'c', 'd', '##d', 'e', 'f', 'g', 'h', 'i', '##i']
+      converter = _create_pretraining_converter(
+          input_dir,
+          vocab,
+          always_continue_cells=True,
+          max_predictions_per_seq=5,
+          masked_lm_prob=0.5)
+      tokens, column_ids, row_ids = _get_masking_input()
+      outputs = []
+      for _ in range(2):
+        output_tokens, positions, labels = (
+            converter._create_masked_lm_predictions(None, tokens, column_ids,
+                                                    row_ids, random.Random(7)))
+        outputs.append(([token.piece for token in output_tokens], positions,
+                        labels))
+
+    self.assertEqual(outputs[0], outputs[1])
+    # Changes of how the random generator is used change the pretraining data,
+    # they have to be intentional.
+    self.assertEqual(outputs[0], ([
+        '[CLS]', '[MASK]', '[MASK]', '[MASK]', '[SEP]', 'd', '##d', 'e', 'f',
+        '[MASK]', '[MASK]', 'i', '##i'
+    ], [1, 2, 3, 9, 10], ['a', '##b', 'c', 'g', 'h']))
+
+  def test_masking_groups(self):
+    tokens, column_ids, row_ids = _get_masking_input()
+    for always_continue_cells in [False, True]:
+      groups = _get_masking_groups(always_continue_cells)
+      with tempfile.TemporaryDirectory() as input_dir:
+        converter = _create_pretraining_converter(
+            input_dir, [],
+            always_continue_cells=always_continue_cells,
+            max_predictions_per_seq=5,
+            masked_lm_prob=0.3)
+        for seed in range(100):
+          _, positions, labels = converter._create_masked_lm_predictions(
+              None, tokens, column_ids, row_ids, random.Random(seed))
+          self.assertNotEmpty(positions)
+          self.assertLessEqual(len(positions), 5)
+          self.assertEqual(labels, [tokens[index].piece for index in positions])
+          for group in groups:
+            num_masked = len(set(group) & set(positions))
+            self.assertIn(num_masked, [0, len(group)],
+                          msg=f'seed: {seed} group: {group}')
+
+  def test_masking_replacement_distribution(self):
+    with tempfile.TemporaryDirectory() as input_dir:
+      vocab = [f'w{index}' for index in range(100)]
+      converter = _create_pretraining_converter(
+          input_dir,
+          vocab,
+          always_continue_cells=False,
+          max_predictions_per_seq=20,
+          masked_lm_prob=0.5)
+      pieces = ['[CLS]'] + vocab[:40] + ['[SEP]']
+      tokens = [tf_example_utils.Token(piece, piece) for piece in pieces]
+      column_ids = [0] * len(tokens)
+      row_ids = [0] * len(tokens)
+      counts = collections.Counter()
+      for seed in range(500):
+        output_tokens, positions, labels = (
+            converter._create_masked_lm_predictions(None, tokens, column_ids,
+                                                    row_ids,
+                                                    random.Random(seed)))
+        for position, label in zip(positions, labels):
+          piece = output_tokens[position].piece
+          if piece == '[MASK]':
+            counts['mask'] += 1
+          elif piece == label:
+            counts['keep'] += 1
+          else:
+            counts['random'] += 1
+
+    total = sum(counts.values())
+    self.assertEqual(total, 500 * 20)
+    # A random replacement keeps the original piece with probability 1/106.
+    self.assertAlmostEqual(counts['mask'] / total, 0.8, delta=0.02)
+    self.assertAlmostEqual(counts['keep'] / total, 0.1, delta=0.02)
+    self.assertAlmostEqual(counts['random'] / total, 0.1, delta=0.02)
+
 if __name__ == '__main__':
   absltest.main()
@@ -0,0 +1,170 @@
+# coding=utf-8
+# Copyright 2019 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# Lint as: python3
+"""Helpers for writing TF records."""
+
+import os
+import random
+from typing import Optional, Text
+
+import tensorflow.compat.v1 as tf
+
+
+def get_shard_paths(path, num_shards):
+  """Returns the shard paths of 'path', e.g. 'data-00000-of-00002.tfrecord'.
+
+  A single shard is written to 'path' itself.
+
+  Args:
+    path: Output path.
+    num_shards: Number of output shards.
+  """
+  if num_shards <= 0:
+    raise ValueError(f'Invalid number of shards: {num_shards}')
+  if num_shards == 1:
+    return [path]
+  root, extension = os.path.splitext(path)
+  return [
+      f'{root}-{index:05d}-of-{num_shards:05d}{extension}'
+      for index in range(num_shards)
+  ]
+
+
+def get_file_pattern(path, num_shards):
+  """Returns a glob pattern that matches all shards of 'path'."""
+  if num_shards <= 0:
+    raise ValueError(f'Invalid number of shards: {num_shards}')
+  if num_shards == 1:
+    return path
+  root, extension = os.path.splitext(path)
+  return f'{root}-?????-of-{num_shards:05d}{extension}'
+
+
+class ShardedTFRecordWriter:
+  """Writes records round-robin to 'num_shards' TFRecord files.
+
+  Shard sizes differ by at most one record and the assignment only depends on
+  the order of the written records.
+  """
+
+  def __init__(
+      self,
+      path,
+      num_shards,
+      options = None,
+  ):
+    """Opens the output shards.
+
+    Args:
+      path: Output path, see get_shard_paths for the shard names.
+      num_shards: Number of output shards.
+      options: TFRecordOptions of the output files.
+    """
+    self._writers = [
+        tf.io.TFRecordWriter(shard_path, options=options)
+        for shard_path in get_shard_paths(path, num_shards)
+    ]
+    self._num_records = 0
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def write(self, record):
+    self._writers[self._num_records % len(self._writers)].write(record)
+    self._num_records += 1
+
+  def close(self):
+    for writer in self._writers:
+      writer.close()
+
+
+class ShufflingTFRecordWriter:
+  """Writes records to a TFRecord file in a random order with bounded memory.
+
+  Records are assigned to random temporary shards while they are written. On
+  close every shard is loaded, shuffled and appended to the output, so only a
+  single shard is held in memory at any time. The order only depends on the
+  seed and the order of the written records.
+  """
+
+  def __init__(
+      self,
+      path,
+      num_shards,
+      seed,
+      options = None,
+      num_output_shards = 1,
+  ):
+    """Opens the temporary shards.
+
+    Args:
+      path: Output path.
+      num_shards: Number of temporary shards, memory usage during closing is
+        about the output size divided by 'num_shards'.
+      seed: Random seed for shard assignment and shuffling, None for a
+        different order in every run.
+      options: TFRecordOptions of the output file.
+      num_output_shards: Number of output shards, see ShardedTFRecordWriter.
+    """
+    if num_shards <= 0:
+      raise ValueError(f'Invalid number of shards: {num_shards}')
+    if num_output_shards <= 0:
+      raise ValueError(f'Invalid number of output shards: {num_output_shards}')
+    self._path = path
+    self._options = options
+    self._num_output_shards = num_output_shards
+    self._rng = random.Random(seed)
+    self._tmp_dir = f'{path}-shuffle-tmp'
+    tf.io.gfile.makedirs(self._tmp_dir)
+    self._shard_paths = [
+        os.path.join(self._tmp_dir, f'shard-{index:05d}.tfrecord')
+        for index in range(num_shards)
+    ]
+    self._shard_writers = [
+        tf.io.TFRecordWriter(shard_path) for shard_path in self._shard_paths
+    ]
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    if exc_type is None:
+      self.close()
+    else:
+      self._close_shards()
+      tf.io.gfile.rmtree(self._tmp_dir)
+
+  def write(self, record):
+    self._rng.choice(self._shard_writers).write(record)
+
+  def _close_shards(self):
+    for writer in self._shard_writers:
+      writer.close()
+
+  def close(self):
+    """Shuffles the temporary shards and writes the output."""
+    self._close_shards()
+    with ShardedTFRecordWriter(
+        self._path, self._num_output_shards,
+        options=self._options) as writer:
+      for shard_path in self._shard_paths:
+        records = list(tf.python_io.tf_record_iterator(shard_path))
+        self._rng.shuffle(records)
+        for record in records:
+          writer.write(record)
+    tf.io.gfile.rmtree(self._tmp_dir)
@@ -0,0 +1,110 @@
+# coding=utf-8
+# Copyright 2019 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# Lint as: python3
+
+import os
+import tempfile
+
+from absl.testing import absltest
+from tapas.utils import tfrecord_utils
+import tensorflow.compat.v1 as tf
+
+
+def _write(path, records, num_shards, seed):
+  with tfrecord_utils.ShufflingTFRecordWriter(
+      path, num_shards=num_shards, seed=seed) as writer:
+    for record in records:
+      writer.write(record)
+  return list(tf.python_io.tf_record_iterator(path))
+
+
+class ShardedTFRecordWriterTest(absltest.TestCase):
+
+  def test_write(self):
+    records = [f'record_{index}'.encode() for index in range(7)]
+    with tempfile.TemporaryDirectory() as output_dir:
+      path = os.path.join(output_dir, 'data.tfrecord')
+      with tfrecord_utils.ShardedTFRecordWriter(path, num_shards=3) as writer:
+        for record in records:
+          writer.write(record)
+      shard_paths = tfrecord_utils.get_shard_paths(path, num_shards=3)
+      self.assertEqual(shard_paths, [
+          os.path.join(output_dir, 'data-00000-of-00003.tfrecord'),
+          os.path.join(output_dir, 'data-00001-of-00003.tfrecord'),
+          os.path.join(output_dir, 'data-00002-of-00003.tfrecord'),
+      ])
+      self.assertEqual(
+          sorted(tf.io.gfile.glob(tfrecord_utils.get_file_pattern(path, 3))),
+          shard_paths)
+      self.assertEqual([
+          list(tf.python_io.tf_record_iterator(shard_path))
+          for shard_path in shard_paths
+      ], [records[0::3], records[1::3], records[2::3]])
+
+  def test_single_shard(self):
+    self.assertEqual(tfrecord_utils.get_shard_paths('data.tfrecord', 1),
+                     ['data.tfrecord'])
+    self.assertEqual(tfrecord_utils.get_file_pattern('data.tfrecord', 1),
+                     'data.tfrecord')
+
+  def test_invalid_num_shards(self):
+    with self.assertRaises(ValueError):
+      tfrecord_utils.get_shard_paths('path', num_shards=0)
+
+
+class ShufflingTFRecordWriterTest(absltest.TestCase):
+
+  def test_write(self):
+    records = [f'record_{index}'.encode() for index in range(100)]
+    with tempfile.TemporaryDirectory() as output_dir:
+      path = os.path.join(output_dir, 'data.tfrecord')
+      output = _write(path, records, num_shards=7, seed=1)
+      self.assertCountEqual(output, records)
+      self.assertNotEqual(output, records)
+      self.assertEqual(os.listdir(output_dir), ['data.tfrecord'])
+      self.assertEqual(_write(path, records, num_shards=7, seed=1), output)
+      self.assertEqual(_write(path, [], num_shards=7, seed=1), [])
+
+  def test_write_output_shards(self):
+    records = [f'record_{index}'.encode() for index in range(100)]
+    with tempfile.TemporaryDirectory() as output_dir:
+      path = os.path.join(output_dir, 'data.tfrecord')
+      with tfrecord_utils.ShufflingTFRecordWriter(
+          path, num_shards=7, seed=1, num_output_shards=2) as writer:
+        for record in records:
+          writer.write(record)
+      output = []
+      for shard_path in tfrecord_utils.get_shard_paths(path, 2):
+        output.extend(tf.python_io.tf_record_iterator(shard_path))
+      self.assertCountEqual(output, records)
+      self.assertLen(os.listdir(output_dir), 2)
+
+  def test_cleans_up_on_error(self):
+    with tempfile.TemporaryDirectory() as output_dir:
+      path = os.path.join(output_dir, 'data.tfrecord')
+      with self.assertRaises(KeyError):
+        with tfrecord_utils.ShufflingTFRecordWriter(
+            path, num_shards=2, seed=1) as writer:
+          writer.write(b'record')
+          raise KeyError()
+      self.assertEmpty(os.listdir(output_dir))
+
+  def test_invalid_num_shards(self):
+    with self.assertRaises(ValueError):
+      tfrecord_utils.ShufflingTFRecordWriter('path', num_shards=0, seed=1)
+
+
+if __name__ == '__main__':
+  absltest.main()
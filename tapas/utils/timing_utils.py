@@ -0,0 +1,100 @@
+# coding=utf-8
+# Copyright 2019 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# Lint as: python3
+"""Timers and counters for the stages of TF example conversion."""
+
+import collections
+import contextlib
+import time
+
+
+class StageTimer:
+  """Accumulates the time spent in named stages and named counters.
+
+  Stages of a converter don't overlap, so their times can be added up.
+  """
+
+  def __init__(self, report_fn=None):
+    """Initializes the timer.
+
+    Args:
+      report_fn: Optionally called with the stage name and the duration in
+        seconds every time a stage finishes.
+    """
+    self._report_fn = report_fn
+    self._seconds = collections.defaultdict(float)
+    self._stage_counts = collections.defaultdict(int)
+    self._counters = collections.defaultdict(int)
+
+  @contextlib.contextmanager
+  def time(self, stage):
+    start_time = time.perf_counter()
+    try:
+      yield
+    finally:
+      seconds = time.perf_counter() - start_time
+      self._seconds[stage] += seconds
+      self._stage_counts[stage] += 1
+      if self._report_fn is not None:
+        self._report_fn(stage, seconds)
+
+  def count(self, name, value=1):
+    self._counters[name] += value
+
+  def get_stats(self):
+    """Returns the number of calls and total seconds per stage and counters."""
+    return {
+        'stages': {
+            stage: {
+                'count': self._stage_counts[stage],
+                'seconds': seconds,
+            } for stage, seconds in self._seconds.items()
+        },
+        'counters': dict(self._counters),
+    }
+
+
+def merge_stats(all_stats):
+  """Sums the output of several StageTimer.get_stats calls."""
+  stages = collections.defaultdict(lambda: {'count': 0, 'seconds': 0.0})
+  counters = collections.defaultdict(int)
+  for stats in all_stats:
+    for stage, stage_stats in stats['stages'].items():
+      stages[stage]['count'] += stage_stats['count']
+      stages[stage]['seconds'] += stage_stats['seconds']
+    for name, value in stats['counters'].items():
+      counters[name] += value
+  return {'stages': dict(stages), 'counters': dict(counters)}
+
+
+def format_stats(stats):
+  """Formats stats as table lines, slowest stage first."""
+  total_seconds = sum(
+      stage_stats['seconds'] for stage_stats in stats['stages'].values())
+  lines = [
+      f'{"stage":<24} {"calls":>10} {"seconds":>10} {"ms/call":>10} '
+      f'{"share":>7}'
+  ]
+  for stage, stage_stats in sorted(
+      stats['stages'].items(), key=lambda item: -item[1]['seconds']):
+    count = stage_stats['count']
+    seconds = stage_stats['seconds']
+    ms_per_call = 1000.0 * seconds / count if count else 0.0
+    share = seconds / total_seconds if total_seconds else 0.0
+    lines.append(f'{stage:<24} {count:>10} {seconds:>10.3f} '
+                 f'{ms_per_call:>10.3f} {share:>7.1%}')
+  for name, value in sorted(stats['counters'].items()):
+    lines.append(f'{name:<24} {value:>10}')
+  return lines
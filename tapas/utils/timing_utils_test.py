@@ -0,0 +1,106 @@
+# coding=utf-8
+# Copyright 2019 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# Lint as: python3
+
+from absl.testing import absltest
+from tapas.utils import timing_utils
+
+
+class StageTimerTest(absltest.TestCase):
+
+  def test_get_stats(self):
+    reported = []
+    timer = timing_utils.StageTimer(
+        report_fn=lambda stage, seconds: reported.append(stage))
+    with timer.time('a'):
+      pass
+    with timer.time('b'):
+      pass
+    with timer.time('a'):
+      pass
+    timer.count('examples')
+    timer.count('tokens', 5)
+
+    stats = timer.get_stats()
+    self.assertEqual(reported, ['a', 'b', 'a'])
+    self.assertEqual({
+        stage: stage_stats['count']
+        for stage, stage_stats in stats['stages'].items()
+    }, {
+        'a': 2,
+        'b': 1
+    })
+    self.assertEqual(stats['counters'], {'examples': 1, 'tokens': 5})
+
+  def test_time_on_error(self):
+    timer = timing_utils.StageTimer()
+    with self.assertRaises(ValueError):
+      with timer.time('a'):
+        raise ValueError()
+    self.assertEqual(timer.get_stats()['stages']['a']['count'], 1)
+
+  def test_merge_stats(self):
+    stats = timing_utils.merge_stats([
+        {
+            'stages': {
+                'a': {
+                    'count': 1,
+                    'seconds': 1.0
+                }
+            },
+            'counters': {
+                'examples': 1
+            }
+        },
+        {
+            'stages': {
+                'a': {
+                    'count': 2,
+                    'seconds': 0.5
+                },
+                'b': {
+                    'count': 1,
+                    'seconds': 2.0
+                }
+            },
+            'counters': {
+                'examples': 3
+            }
+        },
+    ])
+    self.assertEqual(
+        stats, {
+            'stages': {
+                'a': {
+                    'count': 3,
+                    'seconds': 1.5
+                },
+                'b': {
+                    'count': 1,
+                    'seconds': 2.0
+                }
+            },
+            'counters': {
+                'examples': 4
+            }
+        })
+    lines = timing_utils.format_stats(stats)
+    self.assertLen(lines, 4)
+    # Slowest stage first.
+    self.assertTrue(lines[1].startswith('b '))
+
+
+if __name__ == '__main__':
+  absltest.main()
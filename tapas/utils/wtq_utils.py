@@ -23,6 +23,7 @@ import os
 from typing import MutableMapping, Text, Tuple, Iterable, List
 
 from absl import logging
+import numpy as np
 import pandas as pd
 from tapas.utils import file_utils
 from tapas.utils import text_utils
@@ -97,6 +98,15 @@ def _read_wtq_table(input_dir, wtq_table_id):
     )
 
 
+def _normalize_table(table):
+  """Applies wtq_normalize to all cells, distinct cells are normalized once."""
+  values = text_utils.wtq_normalize_all(table.to_numpy().ravel())
+  return pd.DataFrame(
+      np.array(values, dtype=object).reshape(table.shape),
+      index=table.index,
+      columns=table.columns)
+
+
 def _export_table(table, output_dir,
                   sqa_table_id):
   output_file = os.path.join(output_dir, sqa_table_id)
@@ -166,7 +176,7 @@ def _convert_data(
         table = table_cache[sqa_table_id]
       else:
         table = _read_wtq_table(input_dir, wtq_table_id)
-        table = table.applymap(text_utils.wtq_normalize)
+        table = _normalize_table(table)
         table_cache[sqa_table_id] = table
 
       sqa_row = []